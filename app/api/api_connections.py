@@ -1,23 +1,30 @@
 # app/api/api_connections.py
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Body
-from sqlalchemy.orm import Session, relationship
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import RedirectResponse
 
 from app.services.auth import get_current_user
+from app.services.dashboard_cache import dashboard_cache
+from app.services.oauth_state import create_oauth_state, consume_oauth_state
+from app.services.http_client import get_async_client
 from app.models.user import User
 from app.models.api_connections import ApiConnection, ApiConnectionCreate, ApiConnectionResponse
-from database.db_setup import get_db
+from database.db_setup import get_async_db
+from app.config import get_settings
 from typing import  Dict, Any, List
 import os
 import dotenv
 from datetime import datetime, timedelta
-import secrets
 from database.db_setup import Base
-import requests
+import httpx
+import logging
 
 dotenv.load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 
 
@@ -31,14 +38,14 @@ router = APIRouter(
 @router.get("/", response_model=List[ApiConnectionResponse])
 async def get_user_api_connections(
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Pobiera listę wszystkich połączeń API dla zalogowanego użytkownika.
     """
-    connections = db.query(ApiConnection).filter(
+    connections = (await db.execute(select(ApiConnection).where(
         ApiConnection.user_id == current_user.id
-    ).all()
+    ))).scalars().all()
 
     return connections
 
@@ -47,16 +54,16 @@ async def get_user_api_connections(
 async def create_api_connection(
         connection_data: ApiConnectionCreate,
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Tworzy nowe połączenie API dla zalogowanego użytkownika.
     """
     # Sprawdzenie, czy połączenie z tym dostawcą już istnieje
-    existing_connection = db.query(ApiConnection).filter(
+    existing_connection = (await db.execute(select(ApiConnection).where(
         ApiConnection.user_id == current_user.id,
         ApiConnection.provider == connection_data.provider
-    ).first()
+    ))).scalars().first()
 
     if existing_connection:
         # Aktualizacja istniejącego połączenia
@@ -67,8 +74,9 @@ async def create_api_connection(
         existing_connection.updated_at = datetime.now()
         existing_connection.is_active = True
 
-        db.commit()
-        db.refresh(existing_connection)
+        await db.commit()
+        await db.refresh(existing_connection)
+        dashboard_cache.invalidate_user(current_user.id)
         return existing_connection
 
     # Utworzenie nowego połączenia
@@ -78,8 +86,9 @@ async def create_api_connection(
     )
 
     db.add(new_connection)
-    db.commit()
-    db.refresh(new_connection)
+    await db.commit()
+    await db.refresh(new_connection)
+    dashboard_cache.invalidate_user(current_user.id)
 
     return new_connection
 
@@ -88,15 +97,15 @@ async def create_api_connection(
 async def delete_api_connection(
         connection_id: int,
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Usuwa połączenie API dla zalogowanego użytkownika.
     """
-    connection = db.query(ApiConnection).filter(
+    connection = (await db.execute(select(ApiConnection).where(
         ApiConnection.id == connection_id,
         ApiConnection.user_id == current_user.id
-    ).first()
+    ))).scalars().first()
 
     if not connection:
         raise HTTPException(
@@ -104,8 +113,9 @@ async def delete_api_connection(
             detail="Połączenie API nie zostało znalezione"
         )
 
-    db.delete(connection)
-    db.commit()
+    await db.delete(connection)
+    await db.commit()
+    dashboard_cache.invalidate_user(current_user.id)
 
     return None
 
@@ -116,7 +126,7 @@ async def delete_api_connection(
 async def initialize_google_fit_auth(
         request: Request,
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Inicjalizuje proces autoryzacji z Google Fit.
@@ -124,32 +134,8 @@ async def initialize_google_fit_auth(
     Generuje URL, na który użytkownik musi przejść, aby zalogować się do Google
     i udzielić zgody na dostęp do danych z Google Fit.
     """
-    # Generowanie stanu dla zabezpieczenia CSRF
-    state = secrets.token_urlsafe(16)
-
-    # Zapisz stan w bazie danych dla późniejszej weryfikacji
-    connection_data = {"auth_state": state}
-
-    # Sprawdź, czy istnieje już połączenie z Google Fit dla tego użytkownika
-    existing_connection = db.query(ApiConnection).filter(
-        ApiConnection.user_id == current_user.id,
-        ApiConnection.provider == "google_fit"
-    ).first()
-
-    if existing_connection:
-        # Aktualizacja istniejącego połączenia
-        existing_connection.connection_data = connection_data
-        existing_connection.updated_at = datetime.now()
-        db.commit()
-    else:
-        # Utworzenie nowego połączenia (jeszcze bez tokenów)
-        new_connection = ApiConnection(
-            user_id=current_user.id,
-            provider="google_fit",
-            connection_data=connection_data
-        )
-        db.add(new_connection)
-        db.commit()
+    # Generowanie stanu dla zabezpieczenia CSRF - zapisany w oauth_states do weryfikacji w callbacku
+    state = await create_oauth_state(db, current_user.id, "google_fit")
 
     # Adres zwrotny, na który Google przekieruje użytkownika po autoryzacji
     # Construct the redirect URI manually instead of using url_for
@@ -177,9 +163,8 @@ async def initialize_google_fit_auth(
     ...
     auth_url = f"https://accounts.google.com/o/oauth2/auth?response_type=code&client_id={client_id}&redirect_uri={redirect_uri}&scope={'%20'.join(scopes)}&state={state}&access_type=offline&prompt=consent"
 
-    # DODAJ TEN PRINT
-    print(f"DEBUG: URL Autoryzacji: {auth_url}")
-    print(f"DEBUG: Redirect URI (Init): {redirect_uri}")
+    logger.debug("URL autoryzacji Google Fit: %s", auth_url)
+    logger.debug("Redirect URI (init): %s", redirect_uri)
     
 
     return {
@@ -194,24 +179,21 @@ async def initialize_google_fit_auth(
 async def google_fit_callback(
         code: str,
         state: str,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Obsługuje callback od Google po autoryzacji.
 
     Wymienia kod autoryzacyjny na tokeny dostępu i odświeżania.
     """
-    # Znajdź połączenie z tym stanem dla weryfikacji CSRF
-    connection = db.query(ApiConnection).filter(
-        ApiConnection.provider == "google_fit",
-        ApiConnection.connection_data.op('->>')('auth_state') == state
-    ).first()
-
-    if not connection:
+    # Weryfikacja CSRF: stan jest jednorazowy - zużywamy go przed wymianą kodu
+    pending = await consume_oauth_state(db, state)
+    if pending is None or pending[1] != "google_fit":
         return RedirectResponse(url="/connections?auth_success=false")
+    user_id = pending[0]
 
     # Adres API Google do wymiany kodu
-    token_url = "https://oauth2.googleapis.com/token"
+    token_url = get_settings().GOOGLE_TOKEN_URL
 
     # Odbierz CLIENT_ID i CLIENT_SECRET z zmiennych środowiskowych
     client_id = os.getenv('GOOGLE_CLIENT_ID')
@@ -224,10 +206,7 @@ async def google_fit_callback(
     base_url = os.getenv('APP_BASE_URL', 'http://localhost:8080')
     redirect_uri = f"{base_url}/api/api-connections/google-fit/callback"
 
-    # DODAJ TEN PRINT
-    print(f"DEBUG: Redirect URI (Callback): {redirect_uri}")
-    print(f"DEBUG: Otrzymany 'code': {code}")
-    print(f"DEBUG: Otrzymany 'state': {state}")
+    logger.debug("Redirect URI (callback): %s, state: %s", redirect_uri, state)
     # Parametry żądania wymiany kodu na tokeny
     token_params = {
         "code": code,
@@ -239,7 +218,8 @@ async def google_fit_callback(
 
     try:
         # Wykonanie żądania HTTP do Google API
-        response = requests.post(token_url, data=token_params)
+        response = await get_async_client().post(token_url, data=token_params,
+                                                 timeout=get_settings().GOOGLE_TOKEN_TIMEOUT)
         response.raise_for_status()  # Sprawdzenie czy nie ma błędu HTTP
 
         token_data = response.json()
@@ -255,21 +235,29 @@ async def google_fit_callback(
         # Oblicz datę wygaśnięcia tokenu
         token_expires_at = datetime.now() + timedelta(seconds=expires_in) if expires_in else None
 
-        # Aktualizuj połączenie w bazie danych
+        # Aktualizuj (albo utwórz) połączenie w bazie danych
+        connection = (await db.execute(select(ApiConnection).where(
+            ApiConnection.user_id == user_id,
+            ApiConnection.provider == "google_fit"
+        ))).scalars().first()
+        if connection is None:
+            connection = ApiConnection(user_id=user_id, provider="google_fit")
+            db.add(connection)
         connection.access_token = access_token
         connection.refresh_token = refresh_token
         connection.token_expires_at = token_expires_at
         connection.is_active = True
         connection.updated_at = datetime.now()
 
-        db.commit()
+        await db.commit()
+        dashboard_cache.invalidate_user(connection.user_id)
 
         # Przekieruj użytkownika z powrotem do strony połączeń z informacją o sukcesie
         return RedirectResponse(url="/connections?auth_success=true")
 
-    except requests.RequestException as e:
-        print(f"Google API error: {str(e)}")
+    except httpx.HTTPError as e:
+        logger.warning("Google API error: %s", e)
         return RedirectResponse(url="/connections?auth_success=false")
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+        logger.exception("Unexpected error: %s", e)
         return RedirectResponse(url="/connections?auth_success=false")
\ No newline at end of file
@@ -3,8 +3,9 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Body, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from app.services.auth import create_access_token, get_current_user, verify_password, get_password_hash
-from database.db_setup import get_db
-from sqlalchemy.orm import Session
+from database.db_setup import get_async_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User, UserRegister, UserResponse, TokenData
 
 
@@ -14,7 +15,7 @@ router = APIRouter(tags=["Auth"])
 
 
 @router.post("/register", response_model=UserResponse)
-async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register_user(user_data: UserRegister, db: AsyncSession = Depends(get_async_db)):
     """
     Rejestracja nowego użytkownika w systemie.
 
@@ -29,9 +30,9 @@ async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
         )
 
     # Sprawdzenie czy użytkownik już istnieje
-    existing_user = db.query(User).filter(
+    existing_user = (await db.execute(select(User).where(
         (User.username == user_data.username) | (User.email == user_data.email)
-    ).first()
+    ))).scalars().first()
 
     if existing_user:
         if existing_user.username == user_data.username:
@@ -54,18 +55,18 @@ async def register_user(user_data: UserRegister, db: Session = Depends(get_db)):
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
 
 @router.post("/login", response_model=TokenData)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     Logowanie użytkownika i generowanie tokenu JWT.
     """
-    user = db.query(User).filter(User.username == form_data.username).first()
+    user = (await db.execute(select(User).where(User.username == form_data.username))).scalars().first()
     if not user or not verify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -114,7 +115,7 @@ async def get_user_profile(current_user: User = Depends(get_current_user)):
 async def update_user_profile(
         user_data: dict = Body(...),
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Aktualizuje profil aktualnie zalogowanego użytkownika.
@@ -128,7 +129,7 @@ async def update_user_profile(
             # Aktualizacja innych pól (z wyjątkiem bezpośredniego ustawiania hasza hasła)
             setattr(current_user, key, value)
 
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
 
     return current_user
\ No newline at end of file
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime
 
 from app.services.auth import get_current_user
 from app.models.user import User
 from app.models.transaction import Transaction , TransactionCreate, TransactionResponse
-from database.db_setup import get_db
+from database.db_setup import get_async_db
 
 
 router = APIRouter()
@@ -18,7 +19,7 @@ router = APIRouter()
 async def create_transaction(
     transaction_data: TransactionCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Tworzy nową transakcję finansową dla zalogowanego użytkownika.
@@ -28,21 +29,21 @@ async def create_transaction(
         user_id=current_user.id
     )
     db.add(new_transaction)
-    db.commit()
-    db.refresh(new_transaction)
+    await db.commit()
+    await db.refresh(new_transaction)
     return new_transaction
 
 
 @router.get("/", response_model=List[TransactionResponse])
 async def get_transactions(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Pobiera listę wszystkich transakcji finansowych zalogowanego użytkownika.
     """
-    transactions = db.query(Transaction).filter(
+    transactions = (await db.execute(select(Transaction).where(
         Transaction.user_id == current_user.id
-    ).order_by(Transaction.date.desc()).all()
-    
+    ).order_by(Transaction.date.desc()))).scalars().all()
+
     return transactions
\ No newline at end of file
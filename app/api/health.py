@@ -1,26 +1,199 @@
 # app/api/health.py
-from fastapi import APIRouter, Depends, Query, HTTPException
+import asyncio
+import logging
+import time
+from typing import Literal
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from app.services.health import GoogleFitServices
-from app.services.auth import get_current_user
+from app.services.dashboard_cache import dashboard_cache
+from app.services.payload_log import payload_recorder
+from app.services.json_response import PreparedJson, conditional_json_response
+from app.services.dashboard_events import dashboard_events, format_sse, SubscriptionLimitError
+from app.services.circuit_breaker import google_fit_unavailable, seconds_until_half_open
+from app.services.predictions import forecast_steps_for_users
+from app.services.summary_watch import SummaryChangeWatcher
+from database.db_setup import get_db
+from app.services.auth import get_current_user, get_current_admin
 from app.models.user import User # <-- Ważny import
+from app.config import get_settings
 
 router = APIRouter()
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Odświeżenia w tle zaplanowane podczas awarii Google, klucz jak w dashboard_cache
+_revalidations = {}
+# Błędy przeliczenia oznaczające niedostępność Google (bezpiecznik, transport, limit czasu)
+GOOGLE_UNAVAILABLE_STATUSES = (503, 504)
+
+
+async def _revalidate_when_half_open(key, compute):
+    """Czeka, aż bezpiecznik dopuści próbne wywołanie, i przelicza dashboard do cache."""
+    try:
+        await asyncio.sleep(seconds_until_half_open())
+        await dashboard_cache.refresh(key, compute)
+    except Exception as e:
+        logger.warning("Odświeżenie dashboardu %s w tle nieudane: %s", key, e)
+    finally:
+        _revalidations.pop(key, None)
+
+
+def _stale_response(request: Request, key, compute, last_good: PreparedJson):
+    """Ostatni kompletny dashboard oznaczony jako nieaktualny; przeliczenie czeka w tle na Google."""
+    if key not in _revalidations:
+        _revalidations[key] = asyncio.create_task(_revalidate_when_half_open(key, compute))
+    return conditional_json_response(request, last_good.marked_stale())
+
 
 @router.get("/dashboard")
 async def get_dashboard_data(
-    days: int = Query(7, description="Number of days"),
+    request: Request,
+    days: int = Query(7, ge=1, le=settings.DASHBOARD_MAX_DAYS, description="Number of days"),
+    resolution: Literal["hour", "day", "week", "month"] = Query("day", description="Chart point resolution"),
     current_user: User = Depends(get_current_user)
 ):
+    if resolution == "hour" and days > settings.DASHBOARD_MAX_HOURLY_DAYS:
+        raise HTTPException(status_code=400,
+                            detail=f"Rozdzielczość godzinowa jest dostępna dla maksymalnie {settings.DASHBOARD_MAX_HOURLY_DAYS} dni.")
+    key = (current_user.id, days, resolution)
     try:
-        service = GoogleFitServices(user_id=current_user.id)
-        data = service.get_dashboard_data(days)
-        return {
-            "daily_stats": data["daily_stats"],
-            "charts": data["charts"]
-        }
+        async def compute():
+            service = await GoogleFitServices.create(user_id=current_user.id)
+            data = await service.get_dashboard_data_async(days, resolution)
+            # W cache trzymamy gotowe body z ETagiem - powtórne wyświetlenie nie serializuje danych
+            prepared = PreparedJson({
+                "daily_stats": data["daily_stats"],
+                "charts": data["charts"],
+                "rolling": data.get("rolling", {}),
+                "missing": data.get("missing", [])
+            })
+            if not data.get("missing"):
+                dashboard_cache.remember_good(key, prepared)
+            return prepared
+
+        last_good = dashboard_cache.last_good(key)
+        if last_good is not None and google_fit_unavailable():
+            # Google nie odpowiada - ostatni kompletny dashboard, oznaczony jako nieaktualny
+            return _stale_response(request, key, compute, last_good)
+
+        try:
+            prepared = await dashboard_cache.get_or_compute(key, compute)
+        except HTTPException as e:
+            # Bezpiecznik mógł się otworzyć (albo Google przestać odpowiadać) już w trakcie przeliczania
+            last_good = dashboard_cache.last_good(key)
+            if last_good is None or e.status_code not in GOOGLE_UNAVAILABLE_STATUSES:
+                raise
+            return _stale_response(request, key, compute, last_good)
+        return conditional_json_response(request, prepared)
     except HTTPException as e: # Najpierw łap HTTPException
         raise e
     except Exception as e:
-        print(f"Nieoczekiwany błąd w /api/health/dashboard: {e}") # Logowanie błędu
-        raise HTTPException(status_code=500, detail="Wystąpił wewnętrzny błąd serwera podczas pobierania danych.")
\ No newline at end of file
+        logger.exception("Nieoczekiwany błąd w /api/health/dashboard: %s", e)
+        raise HTTPException(status_code=500, detail="Wystąpił wewnętrzny błąd serwera podczas pobierania danych.")
+
+
+@router.get("/forecast/steps")
+async def get_steps_forecast(
+    history_days: int = Query(56, ge=14, le=365, description="Days of history used for the fit"),
+    horizon: int = Query(7, ge=1, le=30, description="Number of days to forecast"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Prognoza kroków (trend + sezonowość tygodniowa) z lokalnych podsumowań dziennych."""
+    # Zapytanie i dopasowanie NumPy w wątku puli. AsyncSession.run_sync tu nie pomaga -
+    # wykonuje funkcję w greenlecie w wątku pętli zdarzeń, blokując ją na czas dopasowania.
+    forecasts = await run_in_threadpool(forecast_steps_for_users, db, [current_user.id], history_days, horizon)
+    forecast = forecasts[current_user.id]
+    return {"history_days": history_days, "horizon": horizon, "forecast": forecast}
+
+
+async def _sync_while_subscribed(user_id: int):
+    """
+    Dopóki użytkownik ma otwarty strumień: co SSE_CHANGES_POLL_SECONDS sprawdza zmiany w bazie
+    (także zapisane przez sync_worker i inne workery), a co SSE_SYNC_INTERVAL_SECONDS sam
+    synchronizuje użytkownika. Zmienione dni trafiają do strumienia jako delty.
+    """
+    watcher = SummaryChangeWatcher(user_id)
+    next_sync = time.monotonic() + settings.SSE_SYNC_INTERVAL_SECONDS
+    while True:
+        try:
+            if time.monotonic() >= next_sync:
+                next_sync = time.monotonic() + settings.SSE_SYNC_INTERVAL_SECONDS
+                service = await GoogleFitServices.create(user_id=user_id)
+                # Delty wysyła watcher - razem ze zmianami z innych procesów, bez dublowania
+                changed = await service.sync_recent(publish=False)
+                logger.debug("Synchronizacja w tle dla użytkownika %s: zmienionych dni %s", user_id, changed)
+            await watcher.poll()
+        except HTTPException as e:
+            logger.warning("Synchronizacja w tle dla użytkownika %s nieudana: %s", user_id, e.detail)
+        except Exception as e:
+            logger.exception("Nieoczekiwany błąd synchronizacji w tle dla użytkownika %s: %s", user_id, e)
+        await asyncio.sleep(settings.SSE_CHANGES_POLL_SECONDS)
+
+
+async def _event_stream(request: Request, user_id: int):
+    # Klient po zerwaniu połączenia odczeka 10 s przed ponowną próbą
+    yield "retry: 10000\n\n"
+    # Subskrypcja dopiero w generatorze - odpowiedź, której ciało nigdy nie ruszy, nie zajmuje miejsca
+    try:
+        queue = dashboard_events.subscribe(user_id)
+    except SubscriptionLimitError as e:
+        # Limit zajęty przez strumień otwarty po sprawdzeniu w endpoincie
+        logger.info("Strumień dashboardu użytkownika %s odrzucony: %s", user_id, e.detail)
+        return
+    try:
+        dashboard_events.ensure_worker(user_id, lambda: _sync_while_subscribed(user_id))
+        while not await request.is_disconnected():
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=settings.SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # Komentarz SSE utrzymuje połączenie przez proxy i pozwala wykryć rozłączenie
+                yield ": ping\n\n"
+                continue
+            yield format_sse(event, data)
+    finally:
+        dashboard_events.unsubscribe(user_id, queue)
+
+
+@router.get("/dashboard/events")
+async def stream_dashboard_events(request: Request, current_user: User = Depends(get_current_user)):
+    """Strumień SSE ze zmienionymi wartościami dziennymi po każdej synchronizacji ("delta") lub prośbą o pełne odświeżenie ("resync")."""
+    user_id = current_user.id
+    try:
+        dashboard_events.check_limits(user_id)
+    except SubscriptionLimitError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return StreamingResponse(
+        _event_stream(request, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/debug/payloads")
+async def get_debug_payloads(
+    user_id: int = Query(None, description="Filtruj po id użytkownika"),
+    admin: User = Depends(get_current_admin)
+):
+    return {
+        "debug_user_ids": payload_recorder.debug_user_ids(),
+        "entries": payload_recorder.entries(user_id)
+    }
+
+
+@router.put("/debug/payloads/{user_id}")
+async def enable_payload_debug(user_id: int, admin: User = Depends(get_current_admin)):
+    payload_recorder.enable(user_id)
+    logger.info("Administrator %s włączył zapis odpowiedzi Google Fit dla użytkownika %s", admin.username, user_id)
+    return {"debug_user_ids": payload_recorder.debug_user_ids()}
+
+
+@router.delete("/debug/payloads/{user_id}")
+async def disable_payload_debug(user_id: int, admin: User = Depends(get_current_admin)):
+    payload_recorder.disable(user_id)
+    logger.info("Administrator %s wyłączył zapis odpowiedzi Google Fit dla użytkownika %s", admin.username, user_id)
+    return {"debug_user_ids": payload_recorder.debug_user_ids()}
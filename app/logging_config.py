@@ -0,0 +1,12 @@
+import logging
+from app.config import get_settings
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def configure_logging():
+    """Ustawia poziom i format logów aplikacji (LOG_LEVEL z ustawień)."""
+    level = get_settings().LOG_LEVEL.upper()
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+    # Loggery modułów app.* dziedziczą poziom, nawet gdy uvicorn skonfigurował root wcześniej
+    logging.getLogger("app").setLevel(level)
@@ -1,6 +1,6 @@
 from database.db_setup import Base
 
 from .user import User
-from .health import HeartRate, Sleep, Activity
+from .health import HeartRate, Sleep, Activity, BodyMeasurement, HealthRollup, DailyHealthSummary, RollingStatsState
 from .transaction import Transaction
-from .api_connections import ApiConnection
\ No newline at end of file
+from .api_connections import ApiConnection, OAuthState
\ No newline at end of file
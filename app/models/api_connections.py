@@ -1,6 +1,6 @@
 # app/models/api_connection.py
 from typing import Any
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON, Index
 from typing import Optional, Dict, Any 
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -10,6 +10,8 @@ from pydantic import BaseModel
 
 class ApiConnection(Base):
     __tablename__ = 'api_connections'
+    # Aktywne połączenie dostawcy dla użytkownika (GoogleFitServices, router połączeń)
+    __table_args__ = (Index('ix_api_connections_user_provider_active', 'user_id', 'provider', 'is_active'),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)  # Fixed to match user table name
@@ -23,6 +25,11 @@ class ApiConnection(Base):
     # Additional connection data (state, etc.)
     connection_data = Column(JSON, nullable=True)
 
+    # Synchronizacja przyrostowa: dane z zakresu [synced_from, synced_until) są już w lokalnych tabelach
+    synced_from = Column(DateTime, nullable=True)
+    synced_until = Column(DateTime, nullable=True)
+    last_synced_at = Column(DateTime, nullable=True)
+
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -31,6 +38,20 @@ class ApiConnection(Base):
     user = relationship("User", back_populates="api_connections")
 
 
+class OAuthState(Base):
+    __tablename__ = 'oauth_states'
+    # Oczekujące autoryzacje OAuth (ochrona CSRF) - stan wyszukiwany po unikalnym indeksie,
+    # usuwany przy użyciu w callbacku, przeterminowane usuwa OAuthStatePurger
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    state = Column(String(64), nullable=False, unique=True, index=True)
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    provider = Column(String(50), nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    user = relationship("User", back_populates="oauth_states")
+
+
 # Schematy Pydantic
 class ApiConnectionCreate(BaseModel):
     provider: str
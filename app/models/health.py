@@ -1,35 +1,118 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Float, ForeignKey, Index, UniqueConstraint, JSON
 from sqlalchemy.orm import relationship
 from database.db_setup import Base
 
 class HeartRate(Base):
     __tablename__ = 'heart_rate'
+    # Jeden wiersz na kubełek czasowy - klucz dla upsertu przy synchronizacji
+    __table_args__ = (UniqueConstraint('user_id', 'timestamp', name='uq_heart_rate_user_timestamp'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     timestamp = Column(DateTime, nullable=False)
-    bpm_value = Column(Integer, nullable=False)
+    bpm_value = Column(Integer, nullable=False)  # średnie tętno w kubełku
+    bpm_max = Column(Integer, nullable=True)
+    bpm_min = Column(Integer, nullable=True)
 
     user = relationship('User', back_populates='heart_rates')
 
 
 class Sleep(Base):
     __tablename__ = 'sleep'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'start_time', name='uq_sleep_user_start_time'),
+        # Podsumowania dzienne wybierają sesje po końcu snu
+        Index('ix_sleep_user_end_time', 'user_id', 'end_time'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, nullable=False)
-    sleep_value = Column(Integer, nullable=False)
+    sleep_value = Column(Integer, nullable=False)  # długość sesji w minutach
 
     user = relationship('User', back_populates='sleep')
 
 
+# activity_type wierszy z godzinowych kubełków Google Fit
+ACTIVITY_TYPE_HOURLY = "hourly_summary"
+
+
 class Activity(Base):
     __tablename__ = 'activity'
+    __table_args__ = (UniqueConstraint('user_id', 'activity_type', 'timestamp', name='uq_activity_user_type_timestamp'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     timestamp = Column(DateTime, nullable=False)
     activity_type = Column(String, nullable=False)
-    duration = Column(Float, nullable=False)
+    duration = Column(Float, nullable=False)  # minuty
     calories = Column(Integer, nullable=False)
+    steps = Column(Integer, nullable=False, default=0)
+    distance = Column(Float, nullable=False, default=0)  # metry
 
     user = relationship('User', back_populates='activity')
+
+
+class BodyMeasurement(Base):
+    __tablename__ = 'body_measurement'
+    # Tylko najnowszy pomiar danego typu - dashboard nie potrzebuje historii
+    __table_args__ = (UniqueConstraint('user_id', 'measurement_type', name='uq_body_measurement_user_type'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    measurement_type = Column(String, nullable=False)  # 'weight' (kg) lub 'height' (m)
+    value = Column(Float, nullable=True)
+    end_time_nanos = Column(BigInteger, nullable=True)  # endTimeNanos najnowszego punktu z Google Fit
+    measured_at = Column(DateTime, nullable=True)
+    checked_at = Column(DateTime, nullable=True)  # ostatnie zapytanie do Google Fit
+
+    user = relationship('User', back_populates='body_measurements')
+
+
+class HealthRollup(Base):
+    __tablename__ = 'health_rollup'
+    # Agregaty godzinowych wierszy Activity/HeartRate w okresach: hour, day, week, month
+    __table_args__ = (UniqueConstraint('user_id', 'resolution', 'period_start', name='uq_health_rollup_user_resolution_period'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    resolution = Column(String(10), nullable=False)
+    period_start = Column(DateTime, nullable=False)
+    steps = Column(Integer, nullable=False, default=0)
+    distance = Column(Float, nullable=False, default=0)  # metry
+    calories = Column(Integer, nullable=False, default=0)
+    # Średnie tętno okresu = bpm_sum / bpm_count (średnia z kubełków godzinowych)
+    bpm_sum = Column(Integer, nullable=False, default=0)
+    bpm_count = Column(Integer, nullable=False, default=0)
+    bpm_max = Column(Integer, nullable=True)
+    bpm_min = Column(Integer, nullable=True)
+
+    user = relationship('User', back_populates='health_rollups')
+
+
+class DailyHealthSummary(Base):
+    __tablename__ = 'daily_health_summary'
+    # Gotowe wartości dzienne dashboardu - odczyt to jeden skan zakresu po (user_id, date)
+    __table_args__ = (UniqueConstraint('user_id', 'date', name='uq_daily_health_summary_user_date'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    date = Column(Date, nullable=False)
+    steps = Column(Integer, nullable=False, default=0)
+    distance = Column(Float, nullable=False, default=0)  # metry
+    avg_hr = Column(Integer, nullable=True)
+    max_hr = Column(Integer, nullable=True)
+    min_hr = Column(Integer, nullable=True)
+    sleep_minutes = Column(Integer, nullable=False, default=0)  # noc kończąca się tego dnia, po scaleniu sesji
+    updated_at = Column(DateTime, nullable=True)
+
+    user = relationship('User', back_populates='daily_summaries')
+
+
+class RollingStatsState(Base):
+    __tablename__ = 'rolling_stats_state'
+    # Stan przyrostowych statystyk kroczących (app.services.rolling_stats) - jeden wiersz na metrykę
+    __table_args__ = (UniqueConstraint('user_id', 'metric', name='uq_rolling_stats_state_user_metric'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    metric = Column(String, nullable=False)  # np. "steps", "avg_hr"
+    last_date = Column(Date, nullable=False)  # ostatni dzień uwzględniony w stanie
+    state = Column(JSON, nullable=False)
+    updated_at = Column(DateTime, nullable=True)
+
+    user = relationship('User', back_populates='rolling_stats')
@@ -1,5 +1,5 @@
 # app/models/transaction.py
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database.db_setup import Base
 from datetime import datetime
@@ -9,6 +9,8 @@ from typing import Optional
 
 class Transaction(Base):
     __tablename__ = 'transaction'
+    # Lista transakcji użytkownika sortowana po dacie (GET /api/finance/)
+    __table_args__ = (Index('ix_transaction_user_date', 'user_id', 'date'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     amount = Column(Float, nullable=False)
     description = Column(String, nullable=True)
@@ -5,7 +5,7 @@ from database.db_setup import Base
 from datetime import datetime
 # Import your models or use fully qualified name
 from app.models.transaction import Transaction 
-from app.models.health import HeartRate, Sleep, Activity
+from app.models.health import HeartRate, Sleep, Activity, BodyMeasurement, HealthRollup, DailyHealthSummary
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 
@@ -21,9 +21,14 @@ class User(Base):
     # Relationships - use the imported class or fully qualified name
     transactions = relationship("Transaction", back_populates="user")
     api_connections = relationship("ApiConnection", back_populates="user")
+    oauth_states = relationship("OAuthState", back_populates="user")
     heart_rates = relationship('HeartRate', back_populates='user')
     sleep = relationship('Sleep', back_populates='user')
     activity = relationship('Activity', back_populates='user')
+    body_measurements = relationship('BodyMeasurement', back_populates='user')
+    health_rollups = relationship('HealthRollup', back_populates='user')
+    daily_summaries = relationship('DailyHealthSummary', back_populates='user')
+    rolling_stats = relationship('RollingStatsState', back_populates='user')
 
 
 class UserRegister(BaseModel):
@@ -5,9 +5,10 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, FastAPI, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
-from database.db_setup import get_db
+from database.db_setup import get_async_db
 from app.config import get_settings
 
 settings = get_settings()
@@ -44,7 +45,7 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Nie można zweryfikować poświadczeń",
@@ -58,8 +59,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
 
-    # Użyj metody first() zamiast bezpośredniego filtrowania
-    user = db.query(User).filter(User.username == username).first()
+    user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+    # Kończymy transakcję odczytu, żeby połączenie wróciło do puli na resztę żądania
+    # (np. wywołania Google); expire_on_commit=False - użytkownik pozostaje załadowany
+    await db.commit()
     if user is None:
         raise credentials_exception
 
@@ -71,4 +74,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    return user
\ No newline at end of file
+    return user
+
+
+async def get_current_admin(current_user: User = Depends(get_current_user)):
+    admin_usernames = {name.strip() for name in settings.ADMIN_USERNAMES.split(",") if name.strip()}
+    if current_user.username not in admin_usernames:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Brak uprawnień administratora",
+        )
+    return current_user
@@ -0,0 +1,124 @@
+import logging
+import time
+from typing import Dict
+from prometheus_client import Counter, Gauge
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CIRCUIT_STATE = Gauge("google_fit_circuit_state", "Stan bezpiecznika Google Fit (0 zamknięty, 1 półotwarty, 2 otwarty)", ["endpoint"])
+CIRCUIT_REJECTED = Counter("google_fit_circuit_rejected_total", "Wywołania Google Fit zablokowane przez otwarty bezpiecznik", ["endpoint"])
+CIRCUIT_OPENED = Counter("google_fit_circuit_opened_total", "Otwarcia bezpiecznika Google Fit", ["endpoint"])
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Bezpiecznik '{name}' otwarty, kolejna próba za {retry_after:.1f} s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Bezpiecznik dla jednego endpointu Google Fit.
+
+    Po `failure_threshold` kolejnych błędach (timeout, błąd połączenia, 5xx)
+    przestajemy wywoływać endpoint na `reset_timeout` sekund. Potem przepuszczamy
+    jedno próbne wywołanie (stan półotwarty): sukces zamyka bezpiecznik, błąd
+    otwiera go ponownie.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        CIRCUIT_STATE.labels(endpoint=name).set(0)
+
+    def _set_state(self, state: str):
+        if state == OPEN and self.state != OPEN:
+            CIRCUIT_OPENED.labels(endpoint=self.name).inc()
+            logger.warning("Bezpiecznik Google Fit '%s' otwarty na %s s", self.name, self.reset_timeout)
+        elif state == CLOSED and self.state != CLOSED:
+            logger.info("Bezpiecznik Google Fit '%s' zamknięty", self.name)
+        self.state = state
+        CIRCUIT_STATE.labels(endpoint=self.name).set(_STATE_VALUES[state])
+
+    def retry_after(self) -> float:
+        """Sekundy do przejścia w stan półotwarty (0, jeśli wywołania są dopuszczone)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        return self.retry_after() > 0
+
+    def before_call(self):
+        """Zgłasza CircuitOpenError, jeśli wywołanie nie może teraz przejść."""
+        if self.state == OPEN:
+            remaining = self.retry_after()
+            if remaining > 0:
+                CIRCUIT_REJECTED.labels(endpoint=self.name).inc()
+                raise CircuitOpenError(self.name, remaining)
+            self._set_state(HALF_OPEN)
+            self._trial_in_flight = False
+        if self.state == HALF_OPEN:
+            if self._trial_in_flight:
+                # Próbne wywołanie już trwa - pozostali czekają na jego wynik
+                CIRCUIT_REJECTED.labels(endpoint=self.name).inc()
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self._trial_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self._trial_in_flight = False
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def release_trial(self):
+        """Anulowane wywołanie nic nie mówi o stanie Google - zwalnia tylko miejsce próby."""
+        self._trial_in_flight = False
+
+    def record_status(self, status_code: int):
+        """Odpowiedź 5xx to awaria Google; 4xx (np. 401, 429) dotyczy konkretnego żądania."""
+        if status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+
+google_fit_breakers: Dict[str, CircuitBreaker] = {
+    endpoint: CircuitBreaker(endpoint, settings.GOOGLE_FIT_CIRCUIT_FAILURE_THRESHOLD,
+                             settings.GOOGLE_FIT_CIRCUIT_RESET_SECONDS)
+    for endpoint in ("aggregate", "sessions", "datasets")
+}
+
+
+def google_fit_endpoint(url: str) -> str:
+    """Nazwa endpointu Google Fit (klucz bezpiecznika i limitu czasu) dla adresu żądania."""
+    if "dataset:aggregate" in url:
+        return "aggregate"
+    if "/sessions" in url:
+        return "sessions"
+    return "datasets"
+
+
+def google_fit_unavailable() -> bool:
+    return any(breaker.is_open() for breaker in google_fit_breakers.values())
+
+
+def seconds_until_half_open() -> float:
+    return max(breaker.retry_after() for breaker in google_fit_breakers.values())
@@ -0,0 +1,136 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.health import HeartRate, Sleep, Activity, DailyHealthSummary, ACTIVITY_TYPE_HOURLY
+from app.services.sleep_nights import nightly_sleep_millis
+from database.upsert import bulk_upsert
+
+SUMMARY_COLUMNS = ["steps", "distance", "avg_hr", "max_hr", "min_hr", "sleep_minutes"]
+# Scalona noc może zaczynać się dzień przed dniem, do którego ją przypisujemy
+SLEEP_MERGE_LOOKBACK = timedelta(days=1)
+
+
+def load_daily_activity(db: Session, user_id: int, start: datetime, end: datetime) -> Dict[date, dict]:
+    """Agreguje lokalne wiersze Activity i HeartRate z [start, end) do wartości dziennych."""
+    data_by_date = {}
+
+    activity_day = func.date(Activity.timestamp)
+    activity_rows = db.query(
+        activity_day, func.sum(Activity.steps), func.sum(Activity.distance)
+    ).filter(
+        Activity.user_id == user_id,
+        Activity.activity_type == ACTIVITY_TYPE_HOURLY,
+        Activity.timestamp >= start,
+        Activity.timestamp < end
+    ).group_by(activity_day).all()
+    for day, steps, distance in activity_rows:
+        data_by_date[date.fromisoformat(str(day)[:10])] = {
+            "steps": int(steps or 0), "distance": float(distance or 0),
+            "avg_hr": None, "max_hr": None, "min_hr": None
+        }
+
+    heart_rate_day = func.date(HeartRate.timestamp)
+    heart_rate_rows = db.query(
+        heart_rate_day, func.avg(HeartRate.bpm_value), func.max(HeartRate.bpm_max), func.min(HeartRate.bpm_min)
+    ).filter(
+        HeartRate.user_id == user_id,
+        HeartRate.timestamp >= start,
+        HeartRate.timestamp < end
+    ).group_by(heart_rate_day).all()
+    for day, avg_hr, max_hr, min_hr in heart_rate_rows:
+        daily_data = data_by_date.setdefault(date.fromisoformat(str(day)[:10]), {"steps": 0, "distance": 0.0})
+        daily_data["avg_hr"] = round(avg_hr) if avg_hr is not None else None
+        daily_data["max_hr"] = max_hr
+        daily_data["min_hr"] = min_hr
+
+    return data_by_date
+
+
+def load_sleep_intervals(db: Session, user_id: int, start: datetime, end: datetime) -> List[Tuple[int, int]]:
+    """Lokalne sesje snu kończące się w [start, end) jako przedziały (start, koniec) w ms."""
+    rows = db.query(Sleep.start_time, Sleep.end_time).filter(
+        Sleep.user_id == user_id,
+        Sleep.end_time >= start,
+        Sleep.end_time < end
+    ).order_by(Sleep.start_time).all()
+    return [(int(start_time.timestamp() * 1000), int(end_time.timestamp() * 1000)) for start_time, end_time in rows]
+
+
+def refresh_daily_summaries(db: Session, user_id: int, days: Iterable[date]) -> List[dict]:
+    """
+    Przelicza wiersze daily_health_summary tylko dla podanych dni.
+
+    Zapisuje (upsert) wyłącznie wiersze, których wartości się zmieniły, i
+    zwraca je (np. do wysłania jako delta do otwartych dashboardów).
+    Nie wykonuje commit.
+    """
+    days = sorted(set(days))
+    if not days:
+        return []
+    start = datetime.combine(days[0], time())
+    end = datetime.combine(days[-1] + timedelta(days=1), time())
+
+    activity = load_daily_activity(db, user_id, start, end)
+    nights = nightly_sleep_millis(load_sleep_intervals(db, user_id, start - SLEEP_MERGE_LOOKBACK, end))
+    existing = {row.date: row for row in db.query(DailyHealthSummary).filter(
+        DailyHealthSummary.user_id == user_id,
+        DailyHealthSummary.date.in_(days)
+    )}
+
+    rows = []
+    for day in days:
+        values = activity.get(day, {})
+        row = {
+            "steps": values.get("steps", 0),
+            "distance": values.get("distance", 0.0),
+            "avg_hr": values.get("avg_hr"),
+            "max_hr": values.get("max_hr"),
+            "min_hr": values.get("min_hr"),
+            "sleep_minutes": round(nights.get(day, 0) / 60000),
+        }
+        current = existing.get(day)
+        if current is not None and all(getattr(current, column) == row[column] for column in SUMMARY_COLUMNS):
+            continue
+        rows.append({"user_id": user_id, "date": day, "updated_at": datetime.now(), **row})
+
+    bulk_upsert(db, DailyHealthSummary, rows, ["user_id", "date"], SUMMARY_COLUMNS + ["updated_at"])
+    return rows
+
+
+def summary_delta(row: dict) -> dict:
+    """Wartości jednego dnia w jednostkach wykresów dashboardu."""
+    return {
+        "date": row["date"].isoformat(),
+        "label": row["date"].strftime("%d-%m"),
+        "steps": row["steps"],
+        "distance": round(row["distance"] / 1000, 2),
+        "avg_hr": row["avg_hr"],
+        "max_hr": row["max_hr"],
+        "min_hr": row["min_hr"],
+        "sleep_hours": round(row["sleep_minutes"] / 60, 1),
+    }
+
+
+def load_daily_summaries(db: Session, user_id: int, start: date) -> Tuple[dict, dict]:
+    """
+    Jeden odczyt zakresu daily_health_summary od `start`.
+
+    Zwraca wartości dzienne w formacie _charts_from_daily (klucz 'YYYY-MM-DD',
+    dystans w km) oraz noce {data: ms snu} dla wykresów i statystyk snu.
+    """
+    rows = db.query(DailyHealthSummary).filter(
+        DailyHealthSummary.user_id == user_id,
+        DailyHealthSummary.date >= start
+    ).order_by(DailyHealthSummary.date).all()
+
+    data_by_date = {}
+    nights = {}
+    for row in rows:
+        data_by_date[row.date.isoformat()] = {
+            "steps": row.steps, "distance": round(row.distance / 1000, 2),
+            "avg_hr": row.avg_hr, "max_hr": row.max_hr, "min_hr": row.min_hr
+        }
+        if row.sleep_minutes:
+            nights[row.date] = row.sleep_minutes * 60000
+    return data_by_date, nights
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from prometheus_client import Counter, Gauge
+from app.config import get_settings
+
+settings = get_settings()
+
+CACHE_HITS = Counter("dashboard_cache_hits_total", "Trafienia w cache dashboardu")
+CACHE_MISSES = Counter("dashboard_cache_misses_total", "Chybienia w cache dashboardu")
+CACHE_EVICTIONS = Counter("dashboard_cache_evictions_total", "Wpisy usunięte z cache dashboardu (LRU)")
+CACHE_COALESCED = Counter("dashboard_cache_coalesced_total", "Żądania obsłużone przez trwające już obliczenie")
+CACHE_SIZE = Gauge("dashboard_cache_entries", "Liczba wpisów w cache dashboardu")
+
+
+class DashboardCache:
+    """
+    Cache wyników dashboardu w pamięci procesu, klucz: (user_id, days, resolution).
+
+    Wpisy wygasają po ttl_seconds, a po przekroczeniu max_size usuwany jest
+    najdawniej używany. Równoczesne żądania o ten sam klucz czekają na jedno
+    wspólne obliczenie zamiast uruchamiać własne.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        # Inkrementowane przy unieważnieniu - wynik liczony przed unieważnieniem nie trafi do cache
+        self._generations: Dict[int, int] = {}
+        # Ostatni kompletny wynik na klucz (bez TTL) - serwowany jako nieaktualny, gdy Google nie odpowiada
+        self._last_good: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            CACHE_SIZE.set(len(self._entries))
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            CACHE_EVICTIONS.inc()
+        CACHE_SIZE.set(len(self._entries))
+
+    async def get_or_compute(self, key: Tuple[int, Any], compute: Callable[[], Awaitable[Any]]):
+        """Zwraca wartość z cache albo wylicza ją (raz na klucz, nawet przy wielu żądaniach)."""
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            CACHE_HITS.inc()
+            return entry[1]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            CACHE_COALESCED.inc()
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        CACHE_MISSES.inc()
+        # Obliczenie działa jako osobne zadanie, więc rozłączenie pierwszego
+        # klienta nie przerywa go pozostałym oczekującym.
+        task = asyncio.ensure_future(self._compute_and_store(key, compute, self._generations.get(key[0], 0)))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute_and_store(self, key, compute, generation: int):
+        try:
+            value = await compute()
+            if self._generations.get(key[0], 0) == generation:
+                self._store(key, value)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def refresh(self, key: Tuple[int, Any], compute: Callable[[], Awaitable[Any]]):
+        """Wylicza wartość od nowa i zapisuje ją w cache, nawet jeśli aktualny wpis jeszcze nie wygasł."""
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+        task = asyncio.ensure_future(self._compute_and_store(key, compute, self._generations.get(key[0], 0)))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    def remember_good(self, key: Tuple[int, Any], value):
+        self._last_good[key] = value
+        self._last_good.move_to_end(key)
+        while len(self._last_good) > self.max_size:
+            self._last_good.popitem(last=False)
+
+    def last_good(self, key: Tuple[int, Any]):
+        return self._last_good.get(key)
+
+    def invalidate_user(self, user_id: int, keep_last_good: bool = False):
+        """
+        Usuwa wszystkie wpisy użytkownika (np. po zmianie jego ApiConnection).
+
+        keep_last_good=True zostawia ostatnie kompletne wyniki - gdy dane się
+        tylko zaktualizowały, nadal nadają się na awaryjną odpowiedź.
+        """
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        for key in [key for key in self._entries if key[0] == user_id]:
+            del self._entries[key]
+        if not keep_last_good:
+            for key in [key for key in self._last_good if key[0] == user_id]:
+                del self._last_good[key]
+        CACHE_SIZE.set(len(self._entries))
+
+    def clear(self):
+        self._entries.clear()
+        self._last_good.clear()
+        CACHE_SIZE.set(0)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+dashboard_cache = DashboardCache(
+    max_size=settings.DASHBOARD_CACHE_MAX_SIZE,
+    ttl_seconds=settings.DASHBOARD_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Set
+from prometheus_client import Counter, Gauge
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SSE_CONNECTIONS = Gauge("dashboard_sse_connections", "Otwarte strumienie SSE dashboardu w tym procesie")
+SSE_EVENTS = Counter("dashboard_sse_events_total", "Zdarzenia wysłane do kolejek subskrybentów SSE", ["event"])
+SSE_OVERFLOWS = Counter("dashboard_sse_overflows_total", "Przepełnione kolejki SSE zastąpione zdarzeniem resync")
+
+
+class SubscriptionLimitError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class DashboardEventBroker:
+    """
+    Rozsyłanie zmian dashboardu do otwartych strumieni SSE w obrębie jednego procesu.
+
+    Każdy strumień ma ograniczoną kolejkę. Gdy klient nie nadąża, zamiast
+    buforować kolejne delty czyścimy jego kolejkę i wysyłamy jedno zdarzenie
+    "resync" - klient pobiera wtedy pełny dashboard. Liczba strumieni jest
+    ograniczona na proces i na użytkownika.
+    """
+
+    def __init__(self, max_connections: int, max_connections_per_user: int, queue_size: int):
+        self.max_connections = max_connections
+        self.max_connections_per_user = max_connections_per_user
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+
+    def connection_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def check_limits(self, user_id: int):
+        """Zgłasza SubscriptionLimitError, jeśli subscribe(user_id) zostałby teraz odrzucony."""
+        if self.connection_count() >= self.max_connections:
+            raise SubscriptionLimitError(503, "Osiągnięto limit połączeń strumieniowych serwera.")
+        if len(self._subscribers.get(user_id, ())) >= self.max_connections_per_user:
+            raise SubscriptionLimitError(429, "Zbyt wiele otwartych strumieni dashboardu dla tego użytkownika.")
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        self.check_limits(user_id)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        SSE_CONNECTIONS.inc()
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if not queues or queue not in queues:
+            return
+        queues.discard(queue)
+        SSE_CONNECTIONS.dec()
+        if not queues:
+            del self._subscribers[user_id]
+            worker = self._workers.pop(user_id, None)
+            if worker is not None:
+                worker.cancel()
+
+    def ensure_worker(self, user_id: int, factory: Callable[[], Awaitable]):
+        """Uruchamia jedno zadanie w tle na użytkownika (np. okresową synchronizację) na czas subskrypcji."""
+        worker = self._workers.get(user_id)
+        if user_id in self._subscribers and (worker is None or worker.done()):
+            self._workers[user_id] = asyncio.create_task(factory())
+
+    def publish(self, user_id: int, event: str, data: dict):
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # Wolny klient - porzuć zaległe delty, wystarczy mu pełne odświeżenie
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("resync", {}))
+                SSE_OVERFLOWS.inc()
+                event_name = "resync"
+            else:
+                event_name = event
+            SSE_EVENTS.labels(event=event_name).inc()
+
+    async def close(self):
+        workers = list(self._workers.values())
+        self._workers.clear()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+dashboard_events = DashboardEventBroker(
+    max_connections=settings.SSE_MAX_CONNECTIONS,
+    max_connections_per_user=settings.SSE_MAX_CONNECTIONS_PER_USER,
+    queue_size=settings.SSE_QUEUE_SIZE
+)
@@ -1,150 +1,333 @@
-import requests
-import os
-import json # Dodano import json do formatowania printów
+import asyncio
+import math
+from contextlib import asynccontextmanager, contextmanager
+import httpx
+import logging
+import numpy as np
 from datetime import datetime, timedelta, time
-from fastapi import HTTPException, Depends
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.models.api_connections import ApiConnection
-from database.db_setup import get_db, SessionLocal
+from app.models.health import BodyMeasurement
+from database.db_setup import SessionLocal
+from database.upsert import bulk_upsert
 from app.config import get_settings
+from app.services.http_client import get_async_client
+from app.services.dashboard_cache import dashboard_cache
+from app.services.payload_log import payload_recorder
+from app.services.circuit_breaker import google_fit_breakers, google_fit_endpoint, CircuitOpenError
+from app.services.rate_limit import (
+    google_fit_limiter, RateLimitExceeded, parse_retry_after, backoff_delay, UPSTREAM_RETRIES
+)
+from app.services.health_columns import (
+    DailyColumns, daily_columns_from_dict, local_epoch_day,
+    window_positions, scatter, day_labels, rounded_ints
+)
+from app.services.health_sync import HealthSyncService
+from app.services.daily_summary import load_daily_summaries, summary_delta
+from app.services.dashboard_events import dashboard_events
+from app.services.rolling_stats import update_rolling_stats
+from app.services.health_rollups import load_rollups, period_start, periods
+from app.services.sleep_nights import MILLIS_PER_HOUR, session_interval
 from typing import Optional # <<< POPRAWKA: Dodano import Optional
+from prometheus_client import Counter
+from weakref import WeakValueDictionary
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+BODY_DATA_SOURCES = {
+    "weight": "derived:com.google.weight:com.google.android.gms:merge_weight",
+    "height": "derived:com.google.height:com.google.android.gms:merge_height",
+}
+ROLLUP_LABEL_FORMATS = {"hour": "%d-%m %H:00", "day": "%d-%m", "week": "%d-%m", "month": "%m-%Y"}
+# Zakres wstecz przy pierwszym pobraniu wagi/wzrostu
+BODY_LOOKBACK = timedelta(days=90)
+
+GOOGLE_TOKEN_URL = settings.GOOGLE_TOKEN_URL
+GOOGLE_FIT_BASE_URL = settings.GOOGLE_FIT_BASE_URL
+# Odpowiedzi Google, po których ponawiamy żądanie z backoffem
+RETRY_STATUSES = (429, 503)
+ENDPOINT_TIMEOUTS = {
+    "aggregate": settings.GOOGLE_FIT_AGGREGATE_TIMEOUT,
+    "sessions": settings.GOOGLE_FIT_SESSIONS_TIMEOUT,
+    "datasets": settings.GOOGLE_FIT_DATASETS_TIMEOUT,
+}
+
+TOKEN_REFRESHES = Counter("google_fit_token_refresh_total", "Odświeżenia tokenu Google Fit", ["outcome"])
+
+# Jedna blokada na połączenie - równoległe żądania tego samego użytkownika
+# czekają na jedno odświeżenie zamiast każde uderzać w endpoint OAuth.
+_token_refresh_locks: "WeakValueDictionary[int, asyncio.Lock]" = WeakValueDictionary()
+
+
+def token_refresh_lock(connection_id: int) -> asyncio.Lock:
+    lock = _token_refresh_locks.get(connection_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _token_refresh_locks[connection_id] = lock
+    return lock
 
 class GoogleFitServices:
-    def __init__(self, user_id: int):
+    def __init__(self, user_id: int, session_factory=None):
         self.user_id = user_id
-        # Używamy nowej, niezależnej sesji, aby uniknąć problemów z zależnościami FastAPI
-        self.db: Session = SessionLocal()
+        # Bez własnej, długo otwartej sesji: każdy odczyt/zapis otwiera krótką sesję
+        # (self.session()), zamykaną przed wywołaniami Google - połączenie z puli
+        # nie czeka na sieć. self.connection jest obiektem odłączonym od sesji.
+        self._session_factory = session_factory
         self.connection = self._get_connection()
         if not self.connection or not self.connection.access_token:
-             # Zamknij sesję, jeśli nie znaleziono połączenia
-            self.db.close()
             raise HTTPException(status_code=404, detail="Aktywne połączenie Google Fit nie zostało znalezione dla tego użytkownika.")
 
-    def __del__(self):
-        # Upewnij się, że sesja jest zamykana, gdy obiekt jest niszczony
-        if self.db:
-            self.db.close()
+    @classmethod
+    async def create(cls, user_id: int, session_factory=None) -> "GoogleFitServices":
+        """Tworzy serwis z kodu asynchronicznego - odczyt połączenia idzie w wątku puli, nie w pętli zdarzeń."""
+        return await run_in_threadpool(cls, user_id, session_factory)
+
+    @contextmanager
+    def session(self):
+        """Krótka sesja bazy; zamknięcie zwraca połączenie do puli (i wycofuje niezatwierdzone zmiany)."""
+        db: Session = (self._session_factory or SessionLocal)()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @asynccontextmanager
+    async def threaded_session(self):
+        """
+        Sesja dla kodu asynchronicznego, trzymana przez kilka kroków - zapytania na niej
+        wykonujemy przez run_in_threadpool, zamknięcie również idzie w wątku puli.
+        """
+        db: Session = (self._session_factory or SessionLocal)()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
 
     def _get_connection(self) -> Optional[ApiConnection]:
         """Pobiera aktywne połączenie Google Fit dla użytkownika."""
         try:
-            connection = self.db.query(ApiConnection).filter(
-                ApiConnection.user_id == self.user_id,
-                ApiConnection.provider == "google_fit",
-                ApiConnection.is_active == True
-            ).first()
-            return connection
+            with self.session() as db:
+                return db.query(ApiConnection).filter(
+                    ApiConnection.user_id == self.user_id,
+                    ApiConnection.provider == "google_fit",
+                    ApiConnection.is_active == True
+                ).first()
         except Exception as e:
-            print(f"Błąd podczas pobierania połączenia z bazy danych: {e}")
+            logger.warning("Błąd podczas pobierania połączenia z bazy danych: %s", e)
             return None
 
-
-    def _refresh_token(self) -> bool:
-        """Odświeża access token, jeśli jest refresh token i token wygasł."""
-        if not self.connection or not self.connection.refresh_token:
+    def _lock_connection(self, db: Session) -> bool:
+        """
+        Ponownie czyta połączenie z blokadą wiersza (SELECT ... FOR UPDATE) - token mógł
+        odświeżyć inny proces. Blokada trwa do zatwierdzenia albo zamknięcia sesji db.
+        """
+        connection = db.get(ApiConnection, self.connection.id, with_for_update=True)
+        if connection is None:
             return False
+        db.expunge(connection)
+        self.connection = connection
+        return True
 
-        if self.connection.token_expires_at and self.connection.token_expires_at > datetime.now() + timedelta(minutes=1):
-            return True
+    def _update_connection(self, db: Session, **values):
+        """Zapisuje i zatwierdza podane kolumny połączenia (i ustawia je na self.connection)."""
+        db.query(ApiConnection).filter(ApiConnection.id == self.connection.id).update(
+            values, synchronize_session=False)
+        db.commit()
+        for column, value in values.items():
+            setattr(self.connection, column, value)
 
-        print("Próba odświeżenia tokenu Google Fit...")
-        token_url = "https://oauth2.googleapis.com/token"
-        payload = {
+
+    def _token_is_fresh(self, min_validity: timedelta = timedelta(minutes=1)) -> bool:
+        """Sprawdza, czy access token jest ważny jeszcze przez co najmniej min_validity."""
+        return bool(self.connection.token_expires_at and self.connection.token_expires_at > datetime.now() + min_validity)
+
+    def _token_refresh_payload(self) -> dict:
+        return {
             "client_id": settings.GOOGLE_CLIENT_ID,
             "client_secret": settings.GOOGLE_CLIENT_SECRET,
             "refresh_token": self.connection.refresh_token,
             "grant_type": "refresh_token",
         }
-        try:
-            response = requests.post(token_url, data=payload)
-            response.raise_for_status()
-            token_data = response.json()
-
-            self.connection.access_token = token_data["access_token"]
-            if "refresh_token" in token_data:
-                 self.connection.refresh_token = token_data["refresh_token"]
-            expires_in = token_data.get("expires_in", 3600)
-            self.connection.token_expires_at = datetime.now() + timedelta(seconds=expires_in)
-            self.connection.updated_at = datetime.now()
-
-            self.db.commit()
-            self.db.refresh(self.connection)
-            print("Token Google Fit odświeżony pomyślnie.")
-            return True
-        except requests.RequestException as e:
-            print(f"Błąd podczas odświeżania tokenu Google Fit: {e}")
-            if e.response is not None and e.response.status_code in [400, 401]:
-                print("Dezaktywacja połączenia Google Fit z powodu błędu odświeżania.")
-                self.connection.is_active = False
-                self.connection.access_token = None
-                self.connection.refresh_token = None
-                self.connection.token_expires_at = None
-                self.db.commit()
-            return False
-        except Exception as e:
-            print(f"Nieoczekiwany błąd podczas odświeżania tokenu: {e}")
+
+    def _apply_token_data(self, db: Session, token_data: dict):
+        """Zapisuje w bazie tokeny otrzymane z endpointu OAuth Google."""
+        expires_in = token_data.get("expires_in", 3600)
+        values = {
+            "access_token": token_data["access_token"],
+            "token_expires_at": datetime.now() + timedelta(seconds=expires_in),
+            "updated_at": datetime.now(),
+        }
+        if "refresh_token" in token_data:
+            values["refresh_token"] = token_data["refresh_token"]
+        self._update_connection(db, **values)
+        logger.info("Token Google Fit odświeżony pomyślnie.")
+
+    def _deactivate_connection(self, db: Session):
+        logger.warning("Dezaktywacja połączenia Google Fit z powodu błędu odświeżania.")
+        self._update_connection(db, is_active=False, access_token=None, refresh_token=None, token_expires_at=None)
+        dashboard_cache.invalidate_user(self.user_id)
+
+    async def _refresh_token_async(self, rejected_token: Optional[str] = None, min_validity: timedelta = timedelta(minutes=1)) -> bool:
+        """
+        Odświeża access token bez blokowania pętli zdarzeń.
+
+        Odświeżanie jest single-flight na połączenie: w obrębie procesu czekamy
+        na blokadę asyncio, a między procesami (workery uvicorna, sync_worker)
+        na blokadę wiersza api_connections, trzymaną do zapisu nowego tokenu.
+        Po jej uzyskaniu ponownie czytamy połączenie i jeśli ktoś inny już
+        odświeżył token, korzystamy z jego wyniku. rejected_token to token, który
+        Google właśnie odrzucił (401) - wtedy odświeżamy niezależnie od token_expires_at.
+        """
+        if not self.connection or not self.connection.refresh_token:
             return False
 
-    def _make_request(self, url: str, method: str = "POST", headers: dict = None, json_data: dict = None, params: dict = None):
+        if rejected_token is None and self._token_is_fresh(min_validity):
+            return True
+
+        async with token_refresh_lock(self.connection.id):
+            # Sesja (i połączenie z puli) trwa do zapisu tokenu, razem z POST do OAuth
+            # ograniczonym GOOGLE_TOKEN_TIMEOUT - tyle kosztuje blokada między procesami
+            async with self.threaded_session() as db:
+                locked = await run_in_threadpool(self._lock_connection, db)
+                if not locked or not self.connection.is_active or not self.connection.refresh_token:
+                    return False
+                if self._token_is_fresh(min_validity) and self.connection.access_token != rejected_token:
+                    TOKEN_REFRESHES.labels(outcome="shared").inc()
+                    return True
+
+                logger.info("Próba odświeżenia tokenu Google Fit...")
+                try:
+                    response = await get_async_client().post(GOOGLE_TOKEN_URL, data=self._token_refresh_payload(),
+                                                             timeout=settings.GOOGLE_TOKEN_TIMEOUT)
+                    response.raise_for_status()
+                    await run_in_threadpool(self._apply_token_data, db, response.json())
+                    TOKEN_REFRESHES.labels(outcome="refreshed").inc()
+                    return True
+                except httpx.HTTPStatusError as e:
+                    logger.warning("Błąd podczas odświeżania tokenu Google Fit: %s", e)
+                    if e.response.status_code in [400, 401]:
+                        await run_in_threadpool(self._deactivate_connection, db)
+                except httpx.HTTPError as e:
+                    logger.warning("Błąd podczas odświeżania tokenu Google Fit: %s", e)
+                except Exception as e:
+                    logger.exception("Nieoczekiwany błąd podczas odświeżania tokenu: %s", e)
+                TOKEN_REFRESHES.labels(outcome="failed").inc()
+                return False
+
+    def _record_payload(self, method: str, url: str, payload):
+        """Zapisuje surową odpowiedź w buforze diagnostycznym (tylko dla debugowanych użytkowników)."""
+        payload_recorder.record(self.user_id, method.upper(), url, payload)
+        return payload
+
+    def _retry_delay(self, response, attempt: int) -> Optional[float]:
+        """Czas do ponowienia po 429/503 albo None, jeśli nie ponawiamy."""
+        if response.status_code not in RETRY_STATUSES:
+            return None
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if response.status_code == 429 and retry_after is not None:
+            # Limit projektu jest wspólny - wstrzymujemy wszystkich na cały Retry-After,
+            # także gdy to żądanie nie będzie już ponawiane
+            google_fit_limiter.hold(retry_after)
+        if attempt >= settings.GOOGLE_FIT_MAX_RETRIES:
+            return None
+        if retry_after is not None and retry_after > settings.GOOGLE_FIT_BACKOFF_MAX_SECONDS:
+            # Nie trzymamy żądania użytkownika tak długo - błąd trafi do wywołującego
+            return None
+        delay = backoff_delay(attempt, retry_after)
+        if response.status_code == 429 and retry_after is None:
+            google_fit_limiter.hold(delay)
+        UPSTREAM_RETRIES.labels(status=str(response.status_code)).inc()
+        logger.warning("Google Fit zwrócił %s, ponowienie %s za %.2f s", response.status_code, attempt + 1, delay)
+        return delay
+
+    async def _send_async(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Pojedyncze wywołanie Google Fit przez limiter i bezpiecznik endpointu,
+        z limitem czasu endpointu i ponowieniami po 429/503 (współdzielona pula połączeń).
+        """
+        endpoint = google_fit_endpoint(url)
+        breaker = google_fit_breakers[endpoint]
+        attempt = 0
+        while True:
+            await google_fit_limiter.acquire(self.user_id)
+            breaker.before_call()
+            try:
+                response = await get_async_client().request(method, url, timeout=ENDPOINT_TIMEOUTS[endpoint], **kwargs)
+            except (httpx.TransportError, httpx.TimeoutException):
+                # Awaria to tylko błąd transportu albo przekroczony limit czasu żądania; anulowanie
+                # (rozłączony klient, GOOGLE_FIT_FETCH_TIMEOUT) przechodzi dalej bez wpływu na bezpiecznik
+                breaker.record_failure()
+                raise
+            except BaseException:
+                # Anulowanie albo błąd samego żądania (np. niepoprawny URL) nic nie mówi o stanie
+                # Google - zwalniamy tylko miejsce próby, żeby bezpiecznik nie utknął w stanie półotwartym
+                breaker.release_trial()
+                raise
+            breaker.record_status(response.status_code)
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _circuit_open_exception(self, error: CircuitOpenError) -> HTTPException:
+        return HTTPException(status_code=503, detail=f"Google Fit ({error.name}) chwilowo niedostępny.",
+                             headers={"Retry-After": str(math.ceil(error.retry_after))})
+
+    def _rate_limit_exception(self, error: RateLimitExceeded) -> HTTPException:
+        logger.warning("Wywołanie Google Fit dla użytkownika %s odrzucone przez limiter (%s)", self.user_id, error.scope)
+        return HTTPException(status_code=429, detail="Przekroczono limit zapytań do Google Fit. Spróbuj ponownie za chwilę.",
+                             headers={"Retry-After": str(math.ceil(error.retry_after))})
+
+    async def _make_request_async(self, url: str, method: str = "POST", headers: dict = None, json_data: dict = None, params: dict = None):
         """Wykonuje żądanie do API Google Fit, obsługując odświeżanie tokenu."""
         if not self.connection or not self.connection.access_token:
             raise HTTPException(status_code=401, detail="Brak ważnego tokenu dostępu Google Fit.")
+        if method.upper() not in ("POST", "GET"):
+            raise ValueError("Nieobsługiwana metoda HTTP")
 
         auth_headers = {"Authorization": f"Bearer {self.connection.access_token}"}
         if headers:
             auth_headers.update(headers)
 
+        sent_token = self.connection.access_token
         try:
-            if method.upper() == "POST":
-                response = requests.post(url, headers=auth_headers, json=json_data, params=params)
-            elif method.upper() == "GET":
-                 response = requests.get(url, headers=auth_headers, params=params)
-            else:
-                 raise ValueError("Nieobsługiwana metoda HTTP")
+            response = await self._send_async(method.upper(), url, headers=auth_headers, json=json_data, params=params)
+            if response.status_code == 401:
+                logger.warning("Otrzymano błąd 401, próba odświeżenia tokenu...")
+                if not await self._refresh_token_async(rejected_token=sent_token):
+                    raise HTTPException(status_code=401, detail="Nie można odświeżyć tokenu Google Fit. Wymagana ponowna autoryzacja.")
+                logger.info("Token odświeżony, ponawianie żądania...")
+                auth_headers["Authorization"] = f"Bearer {self.connection.access_token}"
+                response = await self._send_async(method.upper(), url, headers=auth_headers, json=json_data, params=params)
 
             response.raise_for_status()
-            return response.json()
-
-        except requests.exceptions.RequestException as e:
-            if e.response is not None and e.response.status_code == 401:
-                print("Otrzymano błąd 401, próba odświeżenia tokenu...")
-                if self._refresh_token():
-                    print("Token odświeżony, ponawianie żądania...")
-                    auth_headers["Authorization"] = f"Bearer {self.connection.access_token}"
-                    try:
-                        if method.upper() == "POST":
-                            response = requests.post(url, headers=auth_headers, json=json_data, params=params)
-                        elif method.upper() == "GET":
-                            response = requests.get(url, headers=auth_headers, params=params)
-
-                        response.raise_for_status()
-                        return response.json()
-                    except requests.exceptions.RequestException as retry_e:
-                        print(f"Błąd podczas ponawiania żądania po odświeżeniu tokenu: {retry_e}")
-                        raise HTTPException(status_code=retry_e.response.status_code if retry_e.response else 500,
-                                            detail=f"Błąd API Google Fit po odświeżeniu tokenu: {retry_e}")
-                else:
-                    raise HTTPException(status_code=401, detail="Nie można odświeżyć tokenu Google Fit. Wymagana ponowna autoryzacja.")
-            else:
-                print(f"Błąd żądania do Google Fit API: {e}")
-                raise HTTPException(status_code=e.response.status_code if e.response else 503,
-                                    detail=f"Błąd komunikacji z Google Fit API: {e}")
+            return self._record_payload(method, url, response.json())
+
+        except HTTPException:
+            raise
+        except RateLimitExceeded as e:
+            raise self._rate_limit_exception(e)
+        except CircuitOpenError as e:
+            raise self._circuit_open_exception(e)
+        except httpx.HTTPStatusError as e:
+            logger.warning("Błąd żądania do Google Fit API: %s", e)
+            raise HTTPException(status_code=e.response.status_code,
+                                detail=f"Błąd komunikacji z Google Fit API: {e}")
+        except httpx.HTTPError as e:
+            logger.warning("Błąd żądania do Google Fit API: %s", e)
+            raise HTTPException(status_code=503, detail=f"Błąd komunikacji z Google Fit API: {e}")
         except Exception as e:
-            print(f"Nieoczekiwany błąd podczas żądania do Google Fit API: {e}")
+            logger.exception("Nieoczekiwany błąd podczas żądania do Google Fit API: %s", e)
             raise HTTPException(status_code=500, detail="Wewnętrzny błąd serwera podczas komunikacji z Google Fit API.")
 
 
-    def get_dashboard_data(self, days: int):
-        """Pobiera i agreguje dane z Google Fit dla dashboardu."""
-        end_time = datetime.now()
-        start_time = end_time - timedelta(days=days)
-
-        end_time_millis = int(end_time.timestamp() * 1000)
-        start_time_millis = int(start_time.timestamp() * 1000)
-
-        aggregate_request_body = {
+    def _build_aggregate_request(self, start_time_millis: int, end_time_millis: int) -> dict:
+        """Buduje ciało żądania dataset:aggregate z dziennymi kubełkami."""
+        return {
             "aggregateBy": [{
                 "dataTypeName": "com.google.step_count.delta",
                 "dataSourceId": "derived:com.google.step_count.delta:com.google.android.gms:estimated_steps"
@@ -154,9 +337,6 @@ class GoogleFitServices:
             },{
                  "dataTypeName": "com.google.heart_rate.bpm",
                  "dataSourceId": "derived:com.google.heart_rate.bpm:com.google.android.gms:merge_heart_rate_bpm"
-            },{
-                 "dataTypeName": "com.google.sleep.segment", # Usuniemy to z głównego zapytania agregacji
-                 "dataSourceId": "derived:com.google.sleep.segment:com.google.android.gms:merged"
             },{
                 "dataTypeName": "com.google.weight",
                 "dataSourceId": "derived:com.google.weight:com.google.android.gms:merge_weight"
@@ -165,268 +345,339 @@ class GoogleFitServices:
                 "dataSourceId": "derived:com.google.height:com.google.android.gms:merge_height"
             }
             ],
+            # sleep.segment pobieramy osobno przez API sesji
             "bucketByTime": {"durationMillis": 86400000},
             "startTimeMillis": start_time_millis,
             "endTimeMillis": end_time_millis
         }
-        # Usuń sleep.segment z aggregateBy, bo i tak pobieramy go osobno
-        aggregate_request_body["aggregateBy"] = [
-            item for item in aggregate_request_body["aggregateBy"]
-            if item["dataTypeName"] != "com.google.sleep.segment"
-        ]
 
-        url = "https://www.googleapis.com/fitness/v1/users/me/dataset:aggregate"
+    def _dashboard_window(self, days: int):
+        end_time = datetime.now()
+        start_time = end_time - timedelta(days=days)
+        return start_time, int(start_time.timestamp() * 1000), int(end_time.timestamp() * 1000)
 
+    async def _guarded_fetch(self, name: str, coro):
+        """Wykonuje pojedyncze pobranie z limitem czasu; błąd nie przerywa pozostałych."""
         try:
-            response_data = self._make_request(url, method="POST", json_data=aggregate_request_body)
-            # <<< DODANO PRINT DIAGNOSTYCZNY >>>
-            print("\n--- DEBUG: SUROWA ODPOWIEDŹ Z AGREGACJI ---")
-            print(json.dumps(response_data, indent=2))
-            print("--- KONIEC SUROWEJ ODPOWIEDZI Z AGREGACJI ---\n")
-
-
-            daily_stats = self._parse_daily_stats(response_data, days)
-            # <<< DODANO PRINT DIAGNOSTYCZNY >>>
-            print(f"--- DEBUG: Parsed Daily Stats (przed snem/wagą): {daily_stats} ---\n")
-            charts_data = self._parse_charts_data(response_data, days)
-            # <<< DODANO PRINT DIAGNOSTYCZNY >>>
-            print(f"--- DEBUG: Parsed Charts Data (przed snem/wagą): {charts_data} ---\n")
+            return await asyncio.wait_for(coro, timeout=settings.GOOGLE_FIT_FETCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Przekroczono limit czasu pobierania '%s' z Google Fit.", name)
+            raise HTTPException(status_code=504, detail=f"Przekroczono limit czasu pobierania '{name}' z Google Fit.")
+        except HTTPException as e:
+            logger.warning("Błąd podczas pobierania '%s' z Google Fit: %s", name, e.detail)
+            raise
 
+    async def _sync_local_store(self, since: datetime) -> list:
+        """Dociąga nowe dane do lokalnych tabel; zwraca listę niepobranych źródeł."""
+        try:
+            result = await HealthSyncService(self).sync(since)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception("Nieoczekiwany błąd podczas synchronizacji danych Google Fit: %s", e)
+            return ["aggregate", "sleep"]
+        if result["changed_days"]:
+            # Otwarte dashboardy użytkownika dostają tylko zmienione dni
+            dashboard_events.publish(self.user_id, "delta", {
+                "days": [summary_delta(row) for row in result["changed_days"]]
+            })
+        return result["missing"]
+
+    async def sync_recent(self, publish: bool = True) -> int:
+        """
+        Synchronizacja w tle (bez budowania dashboardu); zwraca liczbę zmienionych dni.
+        publish=False pomija wysłanie delt - roześle je SummaryChangeWatcher.
+        """
+        await self._refresh_token_async()
+        result = await HealthSyncService(self).sync(datetime.now() - timedelta(days=1))
+        await run_in_threadpool(self._update_rolling_stats)
+        if result["changed_days"]:
+            dashboard_cache.invalidate_user(self.user_id, keep_last_good=True)
+        if result["changed_days"] and publish:
+            dashboard_events.publish(self.user_id, "delta", {
+                "days": [summary_delta(row) for row in result["changed_days"]]
+            })
+        return len(result["changed_days"])
+
+    async def get_dashboard_data_async(self, days: int, resolution: str = "day"):
+        """
+        Pobiera i agreguje dane dashboardu bez blokowania pętli zdarzeń uvicorna.
+
+        Aktywność, tętno i sen czytamy z lokalnych tabel, a z Google dociągamy
+        tylko zakres nowszy niż znacznik synchronizacji (HealthSyncService).
+        Synchronizacja oraz pobranie wagi i wzrostu idą równolegle; jeśli część
+        z nich zawiedzie, zwracamy częściowy dashboard z listą źródeł w "missing".
+        Przy resolution innym niż "day" wykresy pochodzą z tabeli rollupów.
+        """
+        start_time, _, _ = self._dashboard_window(days)
+        now = datetime.now()
+        body_measurements = await run_in_threadpool(self._load_body_measurements)
+
+        # Odśwież token raz przed rozgałęzieniem, żeby równoległe
+        # zapytania nie dostały 401 i nie odświeżały go każde osobno.
+        await self._refresh_token_async()
+
+        # Waga i wzrost są zapisane lokalnie - pytamy tylko o punkty nowsze niż ostatni znany
+        fetches = {
+            name: self._make_request_async(url, method="GET")
+            for name, url in self._body_fetches_due(body_measurements, now).items()
+        }
+        sync_result, *results = await asyncio.gather(
+            self._sync_local_store(start_time),
+            *(self._guarded_fetch(name, coro) for name, coro in fetches.items()),
+            return_exceptions=True
+        )
+        if isinstance(sync_result, BaseException):
+            # Brak danych lokalnych i brak dostępu do Google (np. 401 wymagający ponownej autoryzacji)
+            raise sync_result
+        results = dict(zip(fetches.keys(), results))
+        missing = sync_result + [name for name, result in results.items() if isinstance(result, BaseException)]
+
+        fetched_body = {name: result for name, result in results.items() if name not in missing}
+        try:
+            # Sesja dopiero po wywołaniach Google, w wątku puli - zapis pomiarów i odczyt lokalnych tabel
+            dashboard = await run_in_threadpool(
+                self._build_dashboard, days, resolution, start_time, now, body_measurements, fetched_body)
+        except Exception as e:
+            logger.exception("Nieoczekiwany błąd podczas pobierania danych dashboardu: %s", e)
+            raise HTTPException(status_code=500, detail="Nie udało się przetworzyć danych z Google Fit.")
 
-            sleep_data = self._get_sleep_data_for_period(start_time_millis, end_time_millis)
-            daily_stats.update(self._calculate_sleep_stats(sleep_data))
-            charts_data["sleep"] = self._parse_sleep_chart_data(sleep_data, days, start_time)
+        dashboard["missing"] = missing
+        return dashboard
+
+    def _build_dashboard(self, days: int, resolution: str, start_time: datetime, now: datetime,
+                         body_measurements: dict, body_responses: dict) -> dict:
+        """Zapisuje pobrane pomiary ciała i składa dashboard z lokalnych tabel (krótka sesja)."""
+        with self.session() as db:
+            body_values = self._store_body_measurements(db, body_measurements, body_responses, now)
+            weight_stats = self._weight_stats(body_values.get("weight"), body_values.get("height"))
+            data_by_date, nights = load_daily_summaries(db, self.user_id, start_time.date())
+            if resolution == "day":
+                charts_data = self._charts_from_daily(data_by_date, days)
+                charts_data["sleep"] = self._sleep_chart_from_nights(nights, days)
+            else:
+                rollups = load_rollups(db, self.user_id, resolution, start_time)
+                charts_data = self._charts_from_rollups(rollups, periods(start_time, now, resolution), resolution)
+                charts_data["sleep"] = self._sleep_chart_for_periods(nights, periods(start_time, now, resolution), resolution)
 
-            weight_stats = self._get_latest_weight_and_height()
+            daily_stats = self._daily_stats_from_daily(data_by_date)
+            daily_stats.update(self._sleep_stats_from_nights(nights))
             daily_stats.update(weight_stats)
+            # Średnie kroczące, serie celu i percentyle tętna - stan aktualizowany tylko o nowe pełne dni
+            rolling = update_rolling_stats(db, self.user_id)
+            db.commit()
 
-            return {
-                "daily_stats": daily_stats,
-                "charts": charts_data
-            }
-
-        except HTTPException as e:
-            raise e
-        except Exception as e:
-            print(f"Nieoczekiwany błąd podczas pobierania danych dashboardu: {e}")
-            raise HTTPException(status_code=500, detail="Nie udało się przetworzyć danych z Google Fit.")
+        return {
+            "daily_stats": daily_stats,
+            "charts": charts_data,
+            "rolling": rolling
+        }
 
+    def _update_rolling_stats(self):
+        with self.session() as db:
+            update_rolling_stats(db, self.user_id)
+            db.commit()
 
-    def _parse_daily_stats(self, response_data, days):
-        """Przetwarza zagregowane dane na statystyki ostatniego dnia."""
-        stats = {
+    def _empty_daily_stats(self) -> dict:
+        return {
             "steps": 0, "goal_steps": 10000,
             "avg_heart_rate": 0, "resting_heart_rate": 0, "max_heart_rate": 0,
             "sleep_hours": 0, "goal_sleep_hours": 8,
             "distance": 0, "weight": 0, "bmi": 0, "weight_change": 0
         }
-        last_bucket = None
-        if response_data and response_data.get("bucket"):
-            sorted_buckets = sorted(response_data["bucket"], key=lambda b: int(b.get("startTimeMillis", 0)), reverse=True)
-            if sorted_buckets:
-                last_bucket = sorted_buckets[0]
-
-        if last_bucket:
-            for dataset in last_bucket.get("dataset", []):
-                data_type = dataset.get("dataSourceId", "")
-                point = dataset.get("point", [])
-                if point:
-                    value = point[0].get("value", [])
-                    if value:
-                        if "step_count.delta" in data_type:
-                            stats["steps"] = value[0].get("intVal", 0)
-                        elif "distance.delta" in data_type:
-                            stats["distance"] = round(value[0].get("fpVal", 0) / 1000, 2)
-                        elif "heart_rate.bpm" in data_type:
-                            if len(value) >= 3:
-                                stats["avg_heart_rate"] = round(value[0].get("fpVal", 0))
-                                stats["max_heart_rate"] = round(value[1].get("fpVal", 0))
-                                stats["min_heart_rate"] = round(value[2].get("fpVal", 0))
-                                stats["resting_heart_rate"] = stats["min_heart_rate"]
 
+    def _daily_stats_from_columns(self, columns: DailyColumns, index: Optional[int]) -> dict:
+        """Statystyki jednego dnia (wiersza kolumn); None oznacza brak danych."""
+        stats = self._empty_daily_stats()
+        if index is None:
+            return stats
+        stats["steps"] = int(columns.steps[index])
+        stats["distance"] = round(float(columns.distance[index]), 2)
+        if not np.isnan(columns.avg_hr[index]):
+            max_hr, min_hr = columns.max_hr[index], columns.min_hr[index]
+            stats["avg_heart_rate"] = round(float(columns.avg_hr[index]))
+            stats["max_heart_rate"] = None if np.isnan(max_hr) else round(float(max_hr))
+            stats["min_heart_rate"] = None if np.isnan(min_hr) else round(float(min_hr))
+            stats["resting_heart_rate"] = stats["min_heart_rate"]
         return stats
 
+    def _daily_stats_from_daily(self, data_by_date: dict) -> dict:
+        """Statystyki dzisiejszego dnia z wartości dziennych (np. z lokalnej bazy)."""
+        columns = daily_columns_from_dict(data_by_date)
+        today = np.flatnonzero(columns.day == local_epoch_day(datetime.now().timestamp()))
+        return self._daily_stats_from_columns(columns, today[-1] if today.size else None)
 
-    def _parse_charts_data(self, response_data, days):
-        """Przetwarza zagregowane dane na dane do wykresów."""
-        labels = []
-        steps_data = []
-        distance_data = []
-        avg_hr_data = []
-        max_hr_data = []
-        data_by_date = {}
-
-        if response_data and response_data.get("bucket"):
-            for bucket in response_data["bucket"]:
-                start_millis = int(bucket.get("startTimeMillis", 0))
-                dt_object = datetime.fromtimestamp(start_millis / 1000)
-                date_str = dt_object.strftime("%Y-%m-%d")
-                daily_data = {"steps": 0, "distance": 0, "avg_hr": None, "max_hr": None}
-
-                for dataset in bucket.get("dataset", []):
-                    data_type = dataset.get("dataSourceId", "")
-                    point = dataset.get("point", [])
-                    if point:
-                        value = point[0].get("value", [])
-                        if value:
-                            if "step_count.delta" in data_type:
-                                daily_data["steps"] = value[0].get("intVal", 0)
-                            elif "distance.delta" in data_type:
-                                daily_data["distance"] = round(value[0].get("fpVal", 0) / 1000, 2)
-                            elif "heart_rate.bpm" in data_type:
-                                if len(value) >= 3:
-                                    daily_data["avg_hr"] = round(value[0].get("fpVal", 0))
-                                    daily_data["max_hr"] = round(value[1].get("fpVal", 0))
-                data_by_date[date_str] = daily_data
+    def _charts_from_columns(self, columns: DailyColumns, days: int) -> dict:
+        """Buduje serie wykresów dla ostatnich `days` dni z kolumn wartości dziennych."""
+        first_day = local_epoch_day(datetime.now().timestamp()) - days + 1
+        positions, mask = window_positions(columns, first_day, days)
+        labels = day_labels(first_day, days)
 
-        end_date = datetime.now().date()
-        for i in range(days -1, -1, -1):
-            current_date = end_date - timedelta(days=i)
-            date_str = current_date.strftime("%Y-%m-%d")
-            labels.append(current_date.strftime("%d-%m"))
-            day_data = data_by_date.get(date_str)
-            if day_data:
-                steps_data.append(day_data["steps"])
-                distance_data.append(day_data["distance"])
-                avg_hr_data.append(day_data["avg_hr"])
-                max_hr_data.append(day_data["max_hr"])
-            else:
-                steps_data.append(0)
-                distance_data.append(0)
-                avg_hr_data.append(None)
-                max_hr_data.append(None)
+        return {
+            "activity": {
+                "labels": labels,
+                "steps": scatter(columns.steps, positions, mask, days, 0).tolist(),
+                "distance": np.round(scatter(columns.distance, positions, mask, days, 0), 2).tolist()
+            },
+            "heart_rate": {
+                "labels": labels,
+                "avg": rounded_ints(scatter(columns.avg_hr, positions, mask, days, np.nan)),
+                "max": rounded_ints(scatter(columns.max_hr, positions, mask, days, np.nan))
+            },
+            "sleep": {"labels": [], "hours": [], "quality": []},
+            "weight": {"labels": [], "values": []}
+        }
 
-        avg_hr_data = [hr if hr is not None else 0 for hr in avg_hr_data]
-        max_hr_data = [hr if hr is not None else 0 for hr in max_hr_data]
+    def _charts_from_rollups(self, rollups: dict, period_starts: list, resolution: str) -> dict:
+        """Serie wykresów z rollupów (tydzień, miesiąc, godzina); okresy bez danych mają zera."""
+        label_format = ROLLUP_LABEL_FORMATS[resolution]
+        labels, steps, distance, avg_hr, max_hr = [], [], [], [], []
+        for start in period_starts:
+            labels.append(start.strftime(label_format))
+            rollup = rollups.get(start)
+            steps.append(rollup.steps if rollup else 0)
+            distance.append(round(rollup.distance / 1000, 2) if rollup else 0)
+            avg_hr.append(round(rollup.bpm_sum / rollup.bpm_count) if rollup and rollup.bpm_count else 0)
+            max_hr.append((rollup.bpm_max or 0) if rollup else 0)
 
         return {
-            "activity": {"labels": labels, "steps": steps_data, "distance": distance_data},
-            "heart_rate": {"labels": labels, "avg": avg_hr_data, "max": max_hr_data},
+            "activity": {"labels": labels, "steps": steps, "distance": distance},
+            "heart_rate": {"labels": labels, "avg": avg_hr, "max": max_hr},
             "sleep": {"labels": [], "hours": [], "quality": []},
             "weight": {"labels": [], "values": []}
         }
 
+    def _charts_from_daily(self, data_by_date: dict, days: int) -> dict:
+        """Buduje serie wykresów z wartości dziennych (klucz: 'YYYY-MM-DD')."""
+        return self._charts_from_columns(daily_columns_from_dict(data_by_date), days)
+
     # --- Metody specyficzne dla typów danych ---
 
-    def _get_sleep_data_for_period(self, start_time_millis: int, end_time_millis: int) -> list:
-        """Pobiera surowe segmenty snu dla danego okresu."""
+    def _sleep_sessions_url(self, start_time_millis: int, end_time_millis: int, page_token: Optional[str] = None) -> str:
         # <<< POPRAWKA FORMATOWANIA DATY >>>
         start_iso = datetime.utcfromtimestamp(start_time_millis/1000).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
         end_iso = datetime.utcfromtimestamp(end_time_millis/1000).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-
-        url = f"https://www.googleapis.com/fitness/v1/users/me/sessions?startTime={start_iso}&endTime={end_iso}&activityType=72"
-
-        try:
-            response = self._make_request(url, method="GET")
-            # <<< DODANO PRINT DIAGNOSTYCZNY >>>
-            print("\n--- DEBUG: SUROWA ODPOWIEDŹ Z API SNU ---")
-            print(json.dumps(response, indent=2))
-            print("--- KONIEC SUROWEJ ODPOWIEDZI Z API SNU ---\n")
-            return response.get("session", [])
-        except HTTPException as e:
-            print(f"Błąd podczas pobierania sesji snu: {e.detail}")
-            return []
-        except Exception as e:
-            print(f"Nieoczekiwany błąd podczas pobierania sesji snu: {e}")
-            return []
-
-    def _calculate_sleep_stats(self, sleep_sessions: list) -> dict:
-        """Oblicza statystyki snu z ostatniej nocy."""
+        url = f"{GOOGLE_FIT_BASE_URL}/sessions?startTime={start_iso}&endTime={end_iso}&activityType=72"
+        return f"{url}&pageToken={page_token}" if page_token else url
+
+    async def _iter_sleep_sessions_async(self, start_time_millis: int, end_time_millis: int):
+        """
+        Generator sesji snu po kolejnych stronach API (nextPageToken); trzyma w pamięci jedną stronę.
+        Limit GOOGLE_FIT_FETCH_TIMEOUT dotyczy każdej strony osobno - długi zakres nie kończy się 504.
+        """
+        page_token = None
+        while True:
+            page = await self._guarded_fetch("sleep", self._make_request_async(
+                self._sleep_sessions_url(start_time_millis, end_time_millis, page_token), method="GET"))
+            for session in page.get("session", []):
+                yield session
+            next_token = page.get("nextPageToken")
+            if not next_token or next_token == page_token:
+                return
+            page_token = next_token
+
+    async def _fetch_sleep_intervals(self, start_time_millis: int, end_time_millis: int) -> list:
+        """Przedziały (start, koniec) w ms wszystkich sesji snu z zakresu - bez surowych stron odpowiedzi."""
+        intervals = []
+        async for session in self._iter_sleep_sessions_async(start_time_millis, end_time_millis):
+            interval = session_interval(session)
+            if interval:
+                intervals.append(interval)
+        return intervals
+
+    def _sleep_stats_from_nights(self, nights: dict) -> dict:
+        """Statystyki snu z ostatniej nocy (suma scalonych sesji)."""
         stats = {"sleep_hours": 0}
-        if not sleep_sessions:
-            return stats
-        try: # Dodano try-except na wypadek pustej listy po filtrowaniu
-            latest_session = max(sleep_sessions, key=lambda s: int(s.get("endTimeMillis", 0)))
-            start_millis = int(latest_session.get("startTimeMillis", 0))
-            end_millis = int(latest_session.get("endTimeMillis", 0))
-            if start_millis and end_millis:
-                duration_millis = end_millis - start_millis
-                stats["sleep_hours"] = round(duration_millis / (1000 * 60 * 60), 1)
-        except ValueError: # Jeśli sleep_sessions jest puste, max() rzuci błąd
-             print("Brak sesji snu do przetworzenia dla _calculate_sleep_stats.")
+        if nights:
+            stats["sleep_hours"] = round(nights[max(nights)] / MILLIS_PER_HOUR, 1)
         return stats
 
-
-    def _parse_sleep_chart_data(self, sleep_sessions: list, days: int, start_time_dt: datetime) -> dict:
-        """Przetwarza sesje snu na dane do wykresu."""
-        labels = []
-        sleep_hours_data = []
-        sleep_by_end_date = {}
-
-        for session in sleep_sessions:
-            start_millis = int(session.get("startTimeMillis", 0))
-            end_millis = int(session.get("endTimeMillis", 0))
-            if start_millis and end_millis:
-                duration_millis = end_millis - start_millis
-                duration_hours = duration_millis / (1000 * 60 * 60)
-                end_dt = datetime.fromtimestamp(end_millis / 1000)
-                end_date_str = end_dt.strftime("%Y-%m-%d")
-                sleep_by_end_date[end_date_str] = sleep_by_end_date.get(end_date_str, 0) + duration_hours
-
-        end_date_chart = datetime.now().date()
-        for i in range(days -1, -1, -1):
-            current_date = end_date_chart - timedelta(days=i)
-            date_str = current_date.strftime("%Y-%m-%d")
-            labels.append(current_date.strftime("%d-%m"))
-            sleep_hours = round(sleep_by_end_date.get(date_str, 0), 1)
-            sleep_hours_data.append(sleep_hours)
-
+    def _sleep_chart_from_nights(self, nights: dict, days: int) -> dict:
+        """Godziny snu dla ostatnich `days` nocy (noc przypisana do dnia zakończenia)."""
+        end_date = datetime.now().date()
+        dates = [end_date - timedelta(days=i) for i in range(days - 1, -1, -1)]
         return {
-            "labels": labels,
-            "hours": sleep_hours_data,
+            "labels": [current_date.strftime("%d-%m") for current_date in dates],
+            "hours": [round(nights.get(current_date, 0) / MILLIS_PER_HOUR, 1) for current_date in dates],
             "quality": [85] * days # Mock
         }
 
-    def _get_latest_weight_and_height(self) -> dict:
-        """Pobiera ostatni zapis wagi i wzrostu."""
-        stats = {"weight": 0, "bmi": 0, "weight_change": 0}
-        weight = None
-        height = None
-        weight_response = None # Inicjalizacja zmiennych
-        height_response = None # Inicjalizacja zmiennych
-
-        end_time = datetime.now()
-        start_time = end_time - timedelta(days=90)
-        # Użyj nanosekund dla dataset ID
-        start_nanos = int(start_time.timestamp() * 1e9)
-        end_nanos = int(end_time.timestamp() * 1e9)
-        dataset_id = f"{start_nanos}-{end_nanos}"
-
-        weight_url = f"https://www.googleapis.com/fitness/v1/users/me/dataSources/derived:com.google.weight:com.google.android.gms:merge_weight/datasets/{dataset_id}"
-        height_url = f"https://www.googleapis.com/fitness/v1/users/me/dataSources/derived:com.google.height:com.google.android.gms:merge_height/datasets/{dataset_id}"
+    def _sleep_chart_for_periods(self, nights: dict, period_starts: list, resolution: str) -> dict:
+        """Średnia długość snu na noc w każdym okresie (tylko noce z zapisanym snem)."""
+        totals = {start: [0, 0] for start in period_starts}
+        for night, millis in nights.items():
+            total = totals.get(period_start(datetime.combine(night, time()), resolution))
+            if total is not None:
+                total[0] += millis
+                total[1] += 1
+        return {
+            "labels": [start.strftime(ROLLUP_LABEL_FORMATS[resolution]) for start in period_starts],
+            "hours": [round(millis / count / MILLIS_PER_HOUR, 1) if count else 0 for millis, count in totals.values()],
+            "quality": [85] * len(period_starts) # Mock
+        }
 
-        try:
-            weight_response = self._make_request(weight_url, method="GET")
-            if weight_response and weight_response.get("point"):
-                latest_weight_point = max(weight_response["point"], key=lambda p: int(p.get("endTimeNanos", 0)))
-                weight_val = latest_weight_point.get("value", [])
-                if weight_val:
-                    weight = weight_val[0].get("fpVal")
-                    if weight:
-                        stats["weight"] = round(weight, 1)
-
-            height_response = self._make_request(height_url, method="GET")
-            if height_response and height_response.get("point"):
-                latest_height_point = max(height_response["point"], key=lambda p: int(p.get("endTimeNanos", 0)))
-                height_val = latest_height_point.get("value", [])
-                if height_val:
-                    height = height_val[0].get("fpVal")
-
-            if weight and height and height > 0:
-                stats["bmi"] = round(weight / (height ** 2), 1)
-
-            # <<< DODANO PRINT DIAGNOSTYCZNY >>>
-            print("\n--- DEBUG: SUROWA ODPOWIEDŹ Z API WAGI ---")
-            print(json.dumps(weight_response, indent=2) if weight_response else "Brak odpowiedzi wagowej")
-            print("--- KONIEC SUROWEJ ODPOWIEDZI Z API WAGI ---\n")
-            print("\n--- DEBUG: SUROWA ODPOWIEDŹ Z API WZROSTU ---")
-            print(json.dumps(height_response, indent=2) if height_response else "Brak odpowiedzi wzrostowej")
-            print("--- KONIEC SUROWEJ ODPOWIEDZI Z API WZROSTU ---\n")
-            print(f"--- DEBUG: Obliczone Weight Stats: {stats} ---\n")
+    def _body_dataset_url(self, measurement_type: str, start_nanos: int, end_nanos: int) -> str:
+        # ID datasetu to zakres w nanosekundach
+        return f"{GOOGLE_FIT_BASE_URL}/dataSources/{BODY_DATA_SOURCES[measurement_type]}/datasets/{start_nanos}-{end_nanos}"
+
+    def _latest_point(self, dataset_response) -> Optional[dict]:
+        """Zwraca najnowszy punkt datasetu (po endTimeNanos) z wartością fpVal."""
+        if dataset_response and dataset_response.get("point"):
+            latest_point = max(dataset_response["point"], key=lambda p: int(p.get("endTimeNanos", 0)))
+            value = latest_point.get("value", [])
+            if value and value[0].get("fpVal") is not None:
+                return latest_point
+        return None
+
+    def _load_body_measurements(self) -> dict:
+        with self.session() as db:
+            rows = db.query(BodyMeasurement).filter(BodyMeasurement.user_id == self.user_id).all()
+        return {row.measurement_type: row for row in rows}
+
+    def _body_fetches_due(self, stored: dict, now: datetime) -> dict:
+        """
+        URL-e datasetów do pobrania: tylko pomiary, o które dawno nie pytaliśmy,
+        i tylko zakres po ostatnim znanym punkcie (endTimeNanos).
+        """
+        end_nanos = int(now.timestamp() * 1e9)
+        urls = {}
+        for measurement_type in BODY_DATA_SOURCES:
+            row = stored.get(measurement_type)
+            refresh_seconds = settings.HEIGHT_REFRESH_INTERVAL_SECONDS if measurement_type == "height" else settings.SYNC_MIN_INTERVAL_SECONDS
+            if row is not None and row.checked_at and row.checked_at > now - timedelta(seconds=refresh_seconds):
+                continue
+            if row is not None and row.end_time_nanos:
+                start_nanos = row.end_time_nanos + 1
+            else:
+                start_nanos = int((now - BODY_LOOKBACK).timestamp() * 1e9)
+            urls[measurement_type] = self._body_dataset_url(measurement_type, start_nanos, end_nanos)
+        return urls
+
+    def _store_body_measurements(self, db: Session, stored: dict, responses: dict, now: datetime) -> dict:
+        """Zapisuje nowsze pomiary (upsert) i zwraca aktualne wartości {typ: wartość}."""
+        values = {measurement_type: row.value for measurement_type, row in stored.items()}
+        for measurement_type, response in responses.items():
+            row = stored.get(measurement_type)
+            latest_point = self._latest_point(response)
+            end_nanos = int(latest_point.get("endTimeNanos", 0)) if latest_point else 0
+            data = {"user_id": self.user_id, "measurement_type": measurement_type, "checked_at": now,
+                    "value": None, "end_time_nanos": None, "measured_at": None}
+            if latest_point and (row is None or not row.end_time_nanos or end_nanos > row.end_time_nanos):
+                data.update(value=latest_point["value"][0]["fpVal"], end_time_nanos=end_nanos,
+                            measured_at=datetime.fromtimestamp(end_nanos / 1e9))
+                values[measurement_type] = data["value"]
+                update_columns = ["value", "end_time_nanos", "measured_at", "checked_at"]
+            else:
+                update_columns = ["checked_at"]
+            bulk_upsert(db, BodyMeasurement, [data], ["user_id", "measurement_type"], update_columns)
+        return values
 
-        except HTTPException as e:
-            print(f"Błąd podczas pobierania danych wagi/wzrostu: {e.detail}")
-        except Exception as e:
-            print(f"Nieoczekiwany błąd podczas pobierania danych wagi/wzrostu: {e}")
+    def _weight_stats(self, weight: Optional[float], height: Optional[float]) -> dict:
+        stats = {"weight": 0, "bmi": 0, "weight_change": 0}
+        if weight:
+            stats["weight"] = round(weight, 1)
+        if weight and height and height > 0:
+            stats["bmi"] = round(weight / (height ** 2), 1)
 
-        return stats
\ No newline at end of file
+        logger.debug("Statystyki wagi dla użytkownika %s: %s", self.user_id, stats)
+        return stats
@@ -0,0 +1,118 @@
+from datetime import date
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import numpy as np
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class DailyColumns(NamedTuple):
+    """
+    Wartości dzienne w postaci kolumnowej - jeden wiersz na kubełek/dzień.
+
+    day to numer dnia od epoki w czasie lokalnym, distance jest w km,
+    a brak pomiaru tętna oznaczamy przez NaN.
+    """
+    day: np.ndarray
+    start_millis: np.ndarray
+    steps: np.ndarray
+    distance: np.ndarray
+    avg_hr: np.ndarray
+    max_hr: np.ndarray
+    min_hr: np.ndarray
+
+
+def local_epoch_day(timestamp: float) -> int:
+    return date.fromtimestamp(timestamp).toordinal() - EPOCH_ORDINAL
+
+
+@lru_cache(maxsize=64)
+def _column_for_source(data_source_id: str) -> Optional[str]:
+    # Identyfikatorów źródeł jest kilka, więc dopasowanie podciągu robimy raz na id
+    if "step_count.delta" in data_source_id:
+        return "steps"
+    if "distance.delta" in data_source_id:
+        return "distance"
+    if "heart_rate.bpm" in data_source_id:
+        return "heart_rate"
+    return None
+
+
+def parse_daily_buckets(response_data) -> DailyColumns:
+    """Jednoprzebiegowo zamienia kubełki z dataset:aggregate na kolumny NumPy."""
+    buckets = response_data.get("bucket", []) if response_data else []
+    count = len(buckets)
+    start_millis = np.zeros(count, dtype=np.int64)
+    day = np.zeros(count, dtype=np.int64)
+    steps = np.zeros(count, dtype=np.int64)
+    distance = np.zeros(count, dtype=np.float64)
+    heart_rate = np.full((3, count), np.nan)
+
+    for i, bucket in enumerate(buckets):
+        start = int(bucket.get("startTimeMillis", 0))
+        start_millis[i] = start
+        day[i] = local_epoch_day(start / 1000)
+        for dataset in bucket.get("dataset", []):
+            column = _column_for_source(dataset.get("dataSourceId", ""))
+            point = dataset.get("point")
+            if column is None or not point:
+                continue
+            value = point[0].get("value")
+            if not value:
+                continue
+            if column == "steps":
+                steps[i] = value[0].get("intVal", 0)
+            elif column == "distance":
+                distance[i] = value[0].get("fpVal", 0)
+            elif len(value) >= 3:
+                heart_rate[0, i] = value[0].get("fpVal", 0)
+                heart_rate[1, i] = value[1].get("fpVal", 0)
+                heart_rate[2, i] = value[2].get("fpVal", 0)
+
+    return DailyColumns(day, start_millis, steps, distance / 1000, heart_rate[0], heart_rate[1], heart_rate[2])
+
+
+def daily_columns_from_dict(data_by_date: dict) -> DailyColumns:
+    """Kolumny z wartości dziennych (klucz: 'YYYY-MM-DD'), np. z load_daily_activity."""
+    count = len(data_by_date)
+    days = np.array(list(data_by_date.keys()), dtype="datetime64[D]").astype(np.int64)
+
+    def column(key, default):
+        return np.array([default if values.get(key) is None else values[key] for values in data_by_date.values()],
+                        dtype=np.float64).reshape(count)
+
+    return DailyColumns(
+        day=days,
+        start_millis=days * 86400000,
+        steps=column("steps", 0).astype(np.int64),
+        distance=column("distance", 0),
+        avg_hr=column("avg_hr", np.nan),
+        max_hr=column("max_hr", np.nan),
+        min_hr=column("min_hr", np.nan),
+    )
+
+
+def window_positions(columns: DailyColumns, first_day: int, days: int):
+    """Indeksy dni okna [first_day, first_day + days) oraz maska wierszy, które do niego trafiają."""
+    positions = columns.day - first_day
+    mask = (positions >= 0) & (positions < days)
+    return positions[mask], mask
+
+
+def scatter(values: np.ndarray, positions: np.ndarray, mask: np.ndarray, days: int, fill) -> np.ndarray:
+    """Rozkłada wartości wierszy na pełne okno dni; dni bez danych dostają fill."""
+    result = np.full(days, fill, dtype=values.dtype)
+    # Przy powtórzonym dniu wygrywa ostatni kubełek - tak jak przy słowniku po dacie
+    result[positions] = values[mask]
+    return result
+
+
+def day_labels(first_day: int, days: int) -> list:
+    """Etykiety 'dd-mm' dla kolejnych dni okna."""
+    iso_dates = np.datetime_as_string(np.arange(first_day, first_day + days).astype("datetime64[D]"))
+    return [f"{iso[8:10]}-{iso[5:7]}" for iso in iso_dates]
+
+
+def rounded_ints(values: np.ndarray, fill: int = 0) -> list:
+    """Zaokrągla do liczb całkowitych; NaN zamienia na fill."""
+    return np.nan_to_num(np.rint(values), nan=fill).astype(np.int64).tolist()
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy.orm import Session
+from app.models.health import HeartRate, Activity, HealthRollup, ACTIVITY_TYPE_HOURLY
+from database.upsert import bulk_upsert
+
+RESOLUTIONS = ("hour", "day", "week", "month")
+
+ROLLUP_COLUMNS = ["steps", "distance", "calories", "bpm_sum", "bpm_count", "bpm_max", "bpm_min"]
+
+
+def period_start(dt: datetime, resolution: str) -> datetime:
+    """Początek okresu zawierającego `dt` (tydzień zaczyna się w poniedziałek)."""
+    hour = dt.replace(minute=0, second=0, microsecond=0)
+    if resolution == "hour":
+        return hour
+    day = hour.replace(hour=0)
+    if resolution == "day":
+        return day
+    if resolution == "week":
+        return day - timedelta(days=day.weekday())
+    if resolution == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Nieznana rozdzielczość: {resolution}")
+
+
+def next_period(start: datetime, resolution: str) -> datetime:
+    if resolution == "hour":
+        return start + timedelta(hours=1)
+    if resolution == "day":
+        return start + timedelta(days=1)
+    if resolution == "week":
+        return start + timedelta(weeks=1)
+    if resolution == "month":
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    raise ValueError(f"Nieznana rozdzielczość: {resolution}")
+
+
+def periods(start: datetime, end: datetime, resolution: str) -> List[datetime]:
+    """Początki kolejnych okresów pokrywających [start, end]."""
+    result = []
+    current = period_start(start, resolution)
+    while current <= end:
+        result.append(current)
+        current = next_period(current, resolution)
+    return result
+
+
+def _empty_rollup() -> dict:
+    return {"steps": 0, "distance": 0.0, "calories": 0, "bpm_sum": 0, "bpm_count": 0, "bpm_max": None, "bpm_min": None}
+
+
+def rebuild_rollups(db: Session, user_id: int, start: datetime, end: datetime) -> int:
+    """
+    Przelicza rollupy wszystkich rozdzielczości dla okresów dotkniętych przez [start, end).
+
+    Zakres rozszerzamy do pełnych tygodni i miesięcy i liczymy je od nowa z
+    godzinowych wierszy, więc wynik jest dokładny niezależnie od tego, ile razy
+    dana godzina była synchronizowana. Nie wykonuje commit.
+    """
+    if start >= end:
+        return 0
+    last = end - timedelta(microseconds=1)
+    # Dotknięte okresy każdej rozdzielczości: [pierwszy, ostatni]
+    touched = {resolution: (period_start(start, resolution), period_start(last, resolution)) for resolution in RESOLUTIONS}
+    span_start = min(first for first, _ in touched.values())
+    span_end = max(next_period(last_period, resolution) for resolution, (_, last_period) in touched.items())
+
+    rollups: Dict[Tuple[str, datetime], dict] = {}
+
+    def targets(timestamp: datetime):
+        for resolution in RESOLUTIONS:
+            period = period_start(timestamp, resolution)
+            first_period, last_period = touched[resolution]
+            if not first_period <= period <= last_period:
+                # Np. tydzień na przełomie miesięcy, który zakres obejmuje tylko częściowo
+                continue
+            key = (resolution, period)
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = _empty_rollup()
+            yield rollup
+
+    activity_rows = db.query(Activity.timestamp, Activity.steps, Activity.distance, Activity.calories).filter(
+        Activity.user_id == user_id,
+        Activity.activity_type == ACTIVITY_TYPE_HOURLY,
+        Activity.timestamp >= span_start,
+        Activity.timestamp < span_end
+    ).all()
+    for timestamp, steps, distance, calories in activity_rows:
+        for rollup in targets(timestamp):
+            rollup["steps"] += steps or 0
+            rollup["distance"] += distance or 0
+            rollup["calories"] += calories or 0
+
+    heart_rate_rows = db.query(HeartRate.timestamp, HeartRate.bpm_value, HeartRate.bpm_max, HeartRate.bpm_min).filter(
+        HeartRate.user_id == user_id,
+        HeartRate.timestamp >= span_start,
+        HeartRate.timestamp < span_end
+    ).all()
+    for timestamp, bpm_value, bpm_max, bpm_min in heart_rate_rows:
+        for rollup in targets(timestamp):
+            rollup["bpm_sum"] += bpm_value
+            rollup["bpm_count"] += 1
+            if bpm_max is not None and (rollup["bpm_max"] is None or bpm_max > rollup["bpm_max"]):
+                rollup["bpm_max"] = bpm_max
+            if bpm_min is not None and (rollup["bpm_min"] is None or bpm_min < rollup["bpm_min"]):
+                rollup["bpm_min"] = bpm_min
+
+    rows = [{"user_id": user_id, "resolution": resolution, "period_start": period, **values}
+            for (resolution, period), values in rollups.items()]
+    return bulk_upsert(db, HealthRollup, rows, ["user_id", "resolution", "period_start"], ROLLUP_COLUMNS)
+
+
+def load_rollups(db: Session, user_id: int, resolution: str, start: datetime) -> Dict[datetime, HealthRollup]:
+    """Rollupy użytkownika od okresu zawierającego `start`, klucz: początek okresu."""
+    rows = db.query(HealthRollup).filter(
+        HealthRollup.user_id == user_id,
+        HealthRollup.resolution == resolution,
+        HealthRollup.period_start >= period_start(start, resolution)
+    ).order_by(HealthRollup.period_start).all()
+    return {row.period_start: row for row in rows}
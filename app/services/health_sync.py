@@ -0,0 +1,265 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from app.models.api_connections import ApiConnection
+from app.models.health import HeartRate, Sleep, Activity, ACTIVITY_TYPE_HOURLY
+from app.services.health_rollups import rebuild_rollups
+from app.services.daily_summary import refresh_daily_summaries
+from app.services.rolling_stats import invalidate_rolling_stats
+from app.config import get_settings
+from database.upsert import bulk_upsert
+
+settings = get_settings()
+
+HOURLY_BUCKET_MILLIS = 3600000
+# Sesje snu zaczynają się przed północą, więc przy synchronizacji patrzymy dzień wstecz
+SLEEP_LOOKBACK = timedelta(days=1)
+
+
+def floor_hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def split_range(start: datetime, end: datetime, window: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Dzieli [start, end) na kolejne okna o długości `window` (ostatnie może być krótsze)."""
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start += window
+    return windows
+
+
+def merge_bucket_responses(responses) -> dict:
+    """Skleja odpowiedzi dataset:aggregate kolejnych okien w jedną serię kubełków."""
+    return {"bucket": [bucket for response in responses if response for bucket in response.get("bucket", [])]}
+
+
+def parse_hourly_buckets(response_data, user_id: int) -> Tuple[List[dict], List[dict]]:
+    """Zamienia godzinne kubełki z dataset:aggregate na wiersze HeartRate i Activity."""
+    heart_rate_rows = []
+    activity_rows = []
+    if not response_data:
+        return heart_rate_rows, activity_rows
+
+    for bucket in response_data.get("bucket", []):
+        start_millis = int(bucket.get("startTimeMillis", 0))
+        end_millis = int(bucket.get("endTimeMillis", start_millis + HOURLY_BUCKET_MILLIS))
+        timestamp = datetime.fromtimestamp(start_millis / 1000)
+        steps, distance, calories, heart_rate = 0, 0.0, 0.0, None
+
+        for dataset in bucket.get("dataset", []):
+            data_type = dataset.get("dataSourceId", "")
+            point = dataset.get("point", [])
+            if not point:
+                continue
+            value = point[0].get("value", [])
+            if not value:
+                continue
+            if "step_count.delta" in data_type:
+                steps = value[0].get("intVal", 0)
+            elif "distance.delta" in data_type:
+                distance = value[0].get("fpVal", 0)
+            elif "calories.expended" in data_type:
+                calories = value[0].get("fpVal", 0)
+            elif "heart_rate.bpm" in data_type and len(value) >= 3:
+                heart_rate = value
+
+        if steps or distance or calories:
+            activity_rows.append({
+                "user_id": user_id,
+                "timestamp": timestamp,
+                "activity_type": ACTIVITY_TYPE_HOURLY,
+                "duration": (end_millis - start_millis) / 60000,
+                "calories": round(calories),
+                "steps": steps,
+                "distance": distance,
+            })
+        if heart_rate:
+            heart_rate_rows.append({
+                "user_id": user_id,
+                "timestamp": timestamp,
+                "bpm_value": round(heart_rate[0].get("fpVal", 0)),
+                "bpm_max": round(heart_rate[1].get("fpVal", 0)),
+                "bpm_min": round(heart_rate[2].get("fpVal", 0)),
+            })
+
+    return heart_rate_rows, activity_rows
+
+
+def sleep_rows(intervals: list, user_id: int) -> List[dict]:
+    """Zamienia przedziały sesji snu (start, koniec w ms) na wiersze Sleep."""
+    return [{
+        "user_id": user_id,
+        "start_time": datetime.fromtimestamp(start_millis / 1000),
+        "end_time": datetime.fromtimestamp(end_millis / 1000),
+        "sleep_value": round((end_millis - start_millis) / 60000),
+    } for start_millis, end_millis in intervals]
+
+
+class HealthSyncService:
+    """
+    Przyrostowa synchronizacja Google Fit -> lokalne tabele HeartRate/Sleep/Activity.
+
+    Pobiera tylko zakres spoza [synced_from, synced_until) zapisanego na ApiConnection
+    i wstawia go upsertem, więc powtórne pobranie tej samej godziny jest bezpieczne.
+    """
+
+    def __init__(self, fit_service):
+        self.fit = fit_service
+        self.user_id = fit_service.user_id
+        # Wspólny limit równoległych zapytań o okna dla wszystkich zakresów jednej synchronizacji
+        self._window_semaphore = asyncio.Semaphore(settings.GOOGLE_FIT_WINDOW_CONCURRENCY)
+
+    @property
+    def connection(self):
+        # Odświeżenie tokenu podmienia obiekt połączenia w GoogleFitServices
+        return self.fit.connection
+
+    def _ranges_to_fetch(self, since: datetime, now: datetime) -> List[Tuple[datetime, datetime]]:
+        since = floor_hour(since)
+        connection = self.connection
+        if connection.synced_from is None or connection.synced_until is None:
+            return [(since, now)]
+
+        ranges = []
+        if since < connection.synced_from:
+            # Backfill starszego okresu, o który pierwszy raz pyta dashboard
+            ranges.append((since, connection.synced_from))
+        if not connection.last_synced_at or connection.last_synced_at < now - timedelta(seconds=settings.SYNC_MIN_INTERVAL_SECONDS):
+            ranges.append((connection.synced_until, now))
+        return ranges
+
+    def _aggregate_request(self, start: datetime, end: datetime) -> dict:
+        body = self.fit._build_aggregate_request(int(start.timestamp() * 1000), int(end.timestamp() * 1000))
+        body["aggregateBy"] = [
+            item for item in body["aggregateBy"]
+            if item["dataTypeName"] not in ("com.google.weight", "com.google.height")
+        ] + [{
+            "dataTypeName": "com.google.calories.expended",
+            "dataSourceId": "derived:com.google.calories.expended:com.google.android.gms:merge_calories_expended"
+        }]
+        body["bucketByTime"] = {"durationMillis": HOURLY_BUCKET_MILLIS}
+        return body
+
+    async def _fetch_aggregate_window(self, start: datetime, end: datetime):
+        aggregate_url = f"{settings.GOOGLE_FIT_BASE_URL}/dataset:aggregate"
+        async with self._window_semaphore:
+            return await self.fit._guarded_fetch("aggregate", self.fit._make_request_async(
+                aggregate_url, method="POST", json_data=self._aggregate_request(start, end)))
+
+    async def _fetch_aggregate(self, start: datetime, end: datetime) -> dict:
+        """
+        Pobiera kubełki godzinowe dla [start, end) w oknach GOOGLE_FIT_AGGREGATE_WINDOW_DAYS.
+
+        Okna idą równolegle, więc rok danych trwa mniej więcej tyle, co jedno okno.
+        Błąd dowolnego okna oznacza niepełny zakres - zgłaszamy pierwszy z nich.
+        """
+        windows = split_range(start, end, timedelta(days=settings.GOOGLE_FIT_AGGREGATE_WINDOW_DAYS))
+        responses = await asyncio.gather(
+            *(self._fetch_aggregate_window(window_start, window_end) for window_start, window_end in windows),
+            return_exceptions=True
+        )
+        for response in responses:
+            if isinstance(response, BaseException):
+                raise response
+        return merge_bucket_responses(responses)
+
+    async def _fetch_range(self, start: datetime, end: datetime):
+        sleep_start = start - SLEEP_LOOKBACK
+        return await asyncio.gather(
+            self._fetch_aggregate(start, end),
+            # Limit czasu na każdą stronę sesji osobno (w _iter_sleep_sessions_async), jak na okno agregacji
+            self.fit._fetch_sleep_intervals(int(sleep_start.timestamp() * 1000), int(end.timestamp() * 1000)),
+            return_exceptions=True
+        )
+
+    def _store(self, db: Session, aggregate_response, sleep_intervals) -> dict:
+        heart_rate_rows, activity_rows = parse_hourly_buckets(aggregate_response, self.user_id)
+        new_sleep_rows = sleep_rows(sleep_intervals or [], self.user_id)
+        stored = {
+            "heart_rate": bulk_upsert(db, HeartRate, heart_rate_rows, ["user_id", "timestamp"],
+                                      ["bpm_value", "bpm_max", "bpm_min"]),
+            "activity": bulk_upsert(db, Activity, activity_rows, ["user_id", "activity_type", "timestamp"],
+                                    ["duration", "calories", "steps", "distance"]),
+            "sleep": bulk_upsert(db, Sleep, new_sleep_rows, ["user_id", "start_time"],
+                                 ["end_time", "sleep_value"]),
+        }
+        # Podsumowania dzienne przeliczamy tylko dla dni, których dotyczą zapisane wiersze
+        touched_days = {row["timestamp"].date() for row in heart_rate_rows + activity_rows}
+        touched_days.update(row["end_time"].date() for row in new_sleep_rows)
+        changed_days = refresh_daily_summaries(db, self.user_id, touched_days)
+        invalidate_rolling_stats(db, self.user_id, [row["date"] for row in changed_days])
+        stored["daily_summary"] = len(changed_days)
+        return stored, changed_days
+
+    def _store_ranges(self, ranges: list, fetched: list, now: datetime, result: dict) -> dict:
+        """
+        Zapisuje pobrane zakresy w jednej transakcji (uzupełniając `result`) i zwraca
+        zapisane znaczniki synchronizacji połączenia.
+        """
+        connection = self.connection
+        markers = {}
+        with self.fit.session() as db:
+            for (start, end), (aggregate_response, sleep_response) in zip(ranges, fetched):
+                failed = [name for name, response in (("aggregate", aggregate_response), ("sleep", sleep_response))
+                          if isinstance(response, BaseException)]
+                for name in failed:
+                    if name not in result["missing"]:
+                        result["missing"].append(name)
+
+                stored, changed_days = self._store(db, None if "aggregate" in failed else aggregate_response,
+                                                   None if "sleep" in failed else sleep_response)
+                for key, count in stored.items():
+                    result[key] += count
+                result["changed_days"].extend(changed_days)
+                if stored["activity"] or stored["heart_rate"]:
+                    # Rollupy dotkniętych godzin/dni/tygodni/miesięcy przeliczamy w tej samej transakcji
+                    rebuild_rollups(db, self.user_id, start, end)
+
+                if failed:
+                    # Znaczniki przesuwamy tylko po kompletnym pobraniu zakresu
+                    continue
+                synced_from = markers.get("synced_from", connection.synced_from)
+                if synced_from is None or start < synced_from:
+                    markers["synced_from"] = start
+                if end == now:
+                    markers["synced_until"] = floor_hour(now)
+                    markers["last_synced_at"] = now
+
+            if markers:
+                # Tylko znaczniki synchronizacji - tokenów mógł w międzyczasie dotknąć ktoś inny
+                db.query(ApiConnection).filter(ApiConnection.id == connection.id).update(
+                    markers, synchronize_session=False)
+            db.commit()
+        return markers
+
+    async def sync(self, since: datetime) -> dict:
+        """
+        Synchronizuje dane od `since` do teraz. Zwraca liczby zapisanych wierszy,
+        zmienione wiersze podsumowań dziennych ("changed_days") oraz listę
+        źródeł ("aggregate", "sleep"), których nie udało się pobrać.
+        """
+        now = datetime.now()
+        result = {"heart_rate": 0, "activity": 0, "sleep": 0, "daily_summary": 0, "missing": [], "changed_days": []}
+        ranges = self._ranges_to_fetch(since, now)
+        if not ranges:
+            return result
+
+        fetched = await asyncio.gather(*(self._fetch_range(start, end) for start, end in ranges))
+
+        connection = self.connection
+        # Sesja dopiero po pobraniu wszystkich zakresów - połączenie z puli nie czeka na Google;
+        # zapis idzie w wątku puli, żeby upserty i przeliczenia nie blokowały pętli zdarzeń
+        markers = await run_in_threadpool(self._store_ranges, ranges, fetched, now, result)
+        for column, value in markers.items():
+            setattr(connection, column, value)
+
+        if len(result["missing"]) == 2 and connection.synced_until is None:
+            # Brak jakichkolwiek danych lokalnych - nie ma czego pokazać, przekaż błąd dalej
+            error = fetched[-1][0]
+            raise error if isinstance(error, HTTPException) else HTTPException(
+                status_code=503, detail="Nie udało się pobrać danych z Google Fit.")
+        return result
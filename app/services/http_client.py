@@ -0,0 +1,32 @@
+import httpx
+from typing import Optional
+from app.config import get_settings
+
+settings = get_settings()
+
+# Jeden współdzielony klient na proces workera - trzyma pulę połączeń keep-alive
+# do googleapis.com, więc kolejne żądania nie płacą za nowy handshake TLS.
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Zwraca współdzielonego klienta HTTP (tworzy go przy pierwszym użyciu)."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    """Zamyka współdzielonego klienta HTTP (wywoływane przy zamykaniu aplikacji)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
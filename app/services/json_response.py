@@ -0,0 +1,105 @@
+import gzip
+import json
+from hashlib import blake2b
+from typing import Dict, Optional
+from fastapi import Request, Response
+from app.config import get_settings
+
+try:
+    import brotli
+except ImportError:  # brotli jest opcjonalny - bez niego negocjujemy tylko gzip
+    brotli = None
+
+settings = get_settings()
+
+
+class PreparedJson:
+    """
+    Odpowiedź JSON zserializowana raz i trzymana w cache razem z ETagiem.
+
+    ETag to skrót treści, więc zmienia się dokładnie wtedy, gdy zmieniają się
+    dane użytkownika. Wersje skompresowane liczymy przy pierwszym użyciu i
+    zapamiętujemy - kolejne wyświetlenia nie serializują ani nie kompresują.
+    """
+
+    def __init__(self, data):
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = blake2b(self.body, digest_size=16).hexdigest()
+        self._encoded: Dict[str, bytes] = {}
+        self._stale: Optional["PreparedJson"] = None
+
+    def encoded(self, encoding: str) -> bytes:
+        if encoding == "identity":
+            return self.body
+        if encoding not in self._encoded:
+            if encoding == "br":
+                self._encoded[encoding] = brotli.compress(self.body, quality=5)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+        return self._encoded[encoding]
+
+
+    def marked_stale(self) -> "PreparedJson":
+        """Ta sama odpowiedź z polem "stale": true (np. gdy nie można jej odświeżyć)."""
+        if self._stale is None:
+            self._stale = PreparedJson({**json.loads(self.body), "stale": True})
+        return self._stale
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(accept_encoding: Optional[str], size: int) -> str:
+    """Wybiera kodowanie odpowiedzi: br (jeśli dostępny), potem gzip; małe odpowiedzi bez kompresji."""
+    if not accept_encoding or size < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+        return "identity"
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        # If-None-Match używa słabego porównania; sufiks kodowania nie zmienia danych
+        candidate = candidate.removeprefix("W/").strip('"')
+        if candidate.split("-", 1)[0] == etag:
+            return True
+    return False
+
+
+def conditional_json_response(request: Request, prepared: PreparedJson) -> Response:
+    """Zwraca 304 dla aktualnego If-None-Match, w przeciwnym razie (skompresowane) body JSON."""
+    encoding = choose_encoding(request.headers.get("accept-encoding"), len(prepared.body))
+    # Silny ETag jest per reprezentacja - wersje skompresowane dostają sufiks
+    etag = f'"{prepared.etag}"' if encoding == "identity" else f'"{prepared.etag}-{encoding}"'
+    headers = {
+        "ETag": etag,
+        # Przeglądarka może trzymać odpowiedź, ale przed użyciem musi ją zwalidować
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding, Authorization",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), prepared.etag):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=prepared.encoded(encoding), media_type="application/json", headers=headers)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.api_connections import OAuthState
+from database.db_setup import AsyncSessionLocal
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+async def create_oauth_state(db: AsyncSession, user_id: int, provider: str) -> str:
+    """Zapisuje nowy stan autoryzacji OAuth ważny OAUTH_STATE_TTL_SECONDS i go zwraca. Wykonuje commit."""
+    state = secrets.token_urlsafe(16)
+    now = datetime.now()
+    db.add(OAuthState(state=state, user_id=user_id, provider=provider, created_at=now,
+                      expires_at=now + timedelta(seconds=settings.OAUTH_STATE_TTL_SECONDS)))
+    await db.commit()
+    return state
+
+
+async def consume_oauth_state(db: AsyncSession, state: str) -> Optional[Tuple[int, str]]:
+    """
+    Zużywa stan z callbacku: usuwa go (po unikalnym indeksie) i zwraca (user_id, provider).
+
+    DELETE ... RETURNING jest atomowe - ten sam stan nie przejdzie dwóch równoległych
+    callbacków. Nieznany albo przeterminowany stan daje None. Wykonuje commit.
+    """
+    row = (await db.execute(
+        delete(OAuthState)
+        .where(OAuthState.state == state, OAuthState.expires_at > datetime.now())
+        .returning(OAuthState.user_id, OAuthState.provider)
+    )).first()
+    await db.commit()
+    return (row.user_id, row.provider) if row else None
+
+
+async def purge_expired_oauth_states(db: AsyncSession) -> int:
+    """Usuwa przeterminowane stany (porzucone autoryzacje); zwraca ich liczbę. Wykonuje commit."""
+    result = await db.execute(delete(OAuthState).where(OAuthState.expires_at <= datetime.now()))
+    await db.commit()
+    return result.rowcount
+
+
+class OAuthStatePurger:
+    """Zadanie w tle okresowo usuwające przeterminowane stany OAuth."""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_forever(self):
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    purged = await purge_expired_oauth_states(db)
+                if purged:
+                    logger.info("Usunięto %s przeterminowanych stanów OAuth.", purged)
+            except Exception as e:
+                logger.exception("Błąd podczas usuwania przeterminowanych stanów OAuth: %s", e)
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+oauth_state_purger = OAuthStatePurger(interval_seconds=settings.OAUTH_STATE_PURGE_INTERVAL_SECONDS)
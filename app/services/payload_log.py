@@ -0,0 +1,56 @@
+from collections import deque
+from datetime import datetime
+from typing import Any, Optional, Set
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class PayloadRecorder:
+    """
+    Ograniczony bufor cykliczny surowych odpowiedzi Google Fit do diagnostyki.
+
+    Zapisuje tylko odpowiedzi użytkowników z włączonym debugowaniem i trzyma
+    referencję do już zdekodowanego JSON-a - bez serializacji w ścieżce żądania.
+    Najstarsze wpisy wypadają po przekroczeniu max_entries.
+    """
+
+    def __init__(self, max_entries: int, debug_user_ids: Optional[Set[int]] = None):
+        self._entries = deque(maxlen=max_entries)
+        self._debug_user_ids: Set[int] = set(debug_user_ids or ())
+
+    def is_enabled(self, user_id: int) -> bool:
+        return user_id in self._debug_user_ids
+
+    def enable(self, user_id: int):
+        self._debug_user_ids.add(user_id)
+
+    def disable(self, user_id: int):
+        self._debug_user_ids.discard(user_id)
+        # Nie trzymaj w pamięci danych użytkownika, który nie jest już debugowany
+        kept = [entry for entry in self._entries if entry["user_id"] != user_id]
+        self._entries.clear()
+        self._entries.extend(kept)
+
+    def debug_user_ids(self) -> list:
+        return sorted(self._debug_user_ids)
+
+    def record(self, user_id: int, method: str, url: str, payload: Any):
+        if user_id not in self._debug_user_ids:
+            return
+        self._entries.append({
+            "user_id": user_id,
+            "recorded_at": datetime.now().isoformat(),
+            "method": method,
+            "url": url,
+            "payload": payload,
+        })
+
+    def entries(self, user_id: Optional[int] = None) -> list:
+        return [entry for entry in self._entries if user_id is None or entry["user_id"] == user_id]
+
+
+payload_recorder = PayloadRecorder(
+    max_entries=settings.PAYLOAD_LOG_MAX_ENTRIES,
+    debug_user_ids={int(user_id) for user_id in settings.PAYLOAD_DEBUG_USER_IDS.split(",") if user_id.strip()}
+)
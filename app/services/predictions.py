@@ -1,11 +1,114 @@
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
 import numpy as np
-from sklearn.linear_model import LinearRegression
+from sqlalchemy.orm import Session
+from app.models.health import DailyHealthSummary
+
+# Regularyzacja równań normalnych - układ pozostaje rozwiązywalny, gdy w serii
+# brakuje któregoś dnia tygodnia
+RIDGE = 1e-6
+# Mniej punktów nie daje sensownego trendu
+MIN_POINTS = 2
+
+
+def design_matrix(start: date, days: int, seasonal: bool = True) -> np.ndarray:
+    """
+    Macierz cech dla dni start..start+days-1: wyraz wolny, trend liniowy
+    i (opcjonalnie) zmienne zero-jedynkowe dni tygodnia (poniedziałek bazowy).
+    """
+    t = np.arange(days, dtype=float)
+    columns = [np.ones(days), t]
+    if seasonal:
+        weekday = (start.weekday() + np.arange(days)) % 7
+        columns.extend((weekday == day).astype(float) for day in range(1, 7))
+    return np.column_stack(columns)
+
+
+def fit_batch(series: np.ndarray, start: date, seasonal: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Najmniejsze kwadraty w postaci zamkniętej dla wielu serii naraz.
+
+    series: (użytkownicy, dni), NaN oznacza brak danych. Wszystkie serie
+    dzielą macierz cech (te same daty), różnią się tylko maską, więc równania
+    normalne X^T W X i X^T W y liczymy jednym einsum dla całej paczki,
+    a układy rozwiązujemy jednym wywołaniem np.linalg.solve.
+    Zwraca (współczynniki (użytkownicy, cechy), liczba punktów na serię).
+    """
+    series = np.asarray(series, dtype=float)
+    X = design_matrix(start, series.shape[1], seasonal)
+    weights = (~np.isnan(series)).astype(float)
+    values = np.nan_to_num(series)
+
+    gram = np.einsum("ud,di,dj->uij", weights, X, X, optimize=True)
+    moments = (weights * values) @ X
+    gram += RIDGE * np.eye(X.shape[1])
+    coefficients = np.linalg.solve(gram, moments[..., None])[..., 0]
+    return coefficients, weights.sum(axis=1)
+
+
+def forecast_batch(series: np.ndarray, start: date, horizon: int, seasonal: bool = True) -> np.ndarray:
+    """
+    Prognoza `horizon` kolejnych dni dla każdej serii: (użytkownicy, horizon).
+
+    Serie z mniej niż MIN_POINTS punktami dostają NaN; wartości ujemne przycinamy do 0.
+    Serie z mniejszą liczbą punktów niż cech modelu sezonowego dostają sam trend
+    liniowy - słaba regularyzacja nie wyznaczy z nich wzorca tygodniowego.
+    """
+    series = np.asarray(series, dtype=float)
+    days = series.shape[1]
+    coefficients, points = fit_batch(series, start, seasonal)
+    future = design_matrix(start, days + horizon, seasonal)[days:]
+    forecast = coefficients @ future.T
+    sparse = points < future.shape[1]
+    if seasonal and sparse.any():
+        forecast[sparse] = forecast_batch(series[sparse], start, horizon, seasonal=False)
+    forecast = np.clip(forecast, 0, None)
+    forecast[points < MIN_POINTS] = np.nan
+    return forecast
+
+
+def load_step_series(db: Session, user_ids: Sequence[int], start: date, end: date) -> np.ndarray:
+    """Kroki z daily_health_summary dla [start, end] jako macierz (użytkownicy, dni) z NaN dla brakujących dni."""
+    days = (end - start).days + 1
+    series = np.full((len(user_ids), days), np.nan)
+    rows_by_user = {user_id: index for index, user_id in enumerate(user_ids)}
+    rows = db.query(DailyHealthSummary.user_id, DailyHealthSummary.date, DailyHealthSummary.steps).filter(
+        DailyHealthSummary.user_id.in_(list(user_ids)),
+        DailyHealthSummary.date >= start,
+        DailyHealthSummary.date <= end
+    ).all()
+    for user_id, day, steps in rows:
+        series[rows_by_user[user_id], (day - start).days] = steps
+    return series
+
+
+def forecast_steps_for_users(db: Session, user_ids: Sequence[int], history_days: int, horizon: int,
+                             today: Optional[date] = None) -> Dict[int, List[dict]]:
+    """
+    Prognoza kroków wielu użytkowników jednym zapytaniem i jednym dopasowaniem.
+
+    Bieżący dzień jest pomijany - jest jeszcze niepełny. Dla użytkowników bez
+    wystarczającej historii lista prognozy jest pusta.
+    """
+    end = (today or date.today()) - timedelta(days=1)
+    start = end - timedelta(days=history_days - 1)
+    forecast = forecast_batch(load_step_series(db, user_ids, start, end), start, horizon)
+    result = {}
+    for user_id, values in zip(user_ids, forecast):
+        if np.isnan(values).any():
+            result[user_id] = []
+            continue
+        result[user_id] = [
+            {"date": (end + timedelta(days=offset + 1)).isoformat(), "steps": int(round(value))}
+            for offset, value in enumerate(values)
+        ]
+    return result
+
 
 def predict_steps(steps_data: list) -> int:
+    """Kroki na następny dzień z trendu liniowego (bez sezonowości) serii [{'steps': ...}, ...]."""
     if len(steps_data) < 2:
         return 0
-    X = np.arange(len(steps_data)).reshape(-1, 1)
-    y = np.array([d['steps'] for d in steps_data])
-    model = LinearRegression()
-    model.fit(X, y)
-    return int(model.predict([[len(X)]])[0])
\ No newline at end of file
+    series = np.array([[d['steps'] for d in steps_data]], dtype=float)
+    coefficients, _ = fit_batch(series, date.today(), seasonal=False)
+    return int(coefficients[0, 0] + coefficients[0, 1] * len(steps_data))
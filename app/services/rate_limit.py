@@ -0,0 +1,154 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from prometheus_client import Counter, Gauge
+from app.config import get_settings
+
+settings = get_settings()
+
+UPSTREAM_QUEUED = Gauge("google_fit_calls_queued", "Wywołania Google Fit czekające na token limitera")
+UPSTREAM_THROTTLED = Counter("google_fit_calls_throttled_total", "Wywołania Google Fit opóźnione przez limiter", ["scope"])
+UPSTREAM_REJECTED = Counter("google_fit_calls_rejected_total", "Wywołania Google Fit odrzucone lokalnie przez limiter", ["scope"])
+UPSTREAM_RETRIES = Counter("google_fit_retries_total", "Ponowienia po odpowiedzi 429/503 z Google Fit", ["status"])
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Limit wywołań Google Fit ({scope}) wyczerpany, spróbuj za {retry_after:.1f} s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Kubełek tokenów: `rate` tokenów na sekundę, maksymalnie `capacity` naraz.
+
+    reserve() od razu rezerwuje token (saldo może zejść poniżej zera) i zwraca,
+    ile trzeba odczekać - dzięki temu czekający nie wyprzedzają się nawzajem.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        wait = self.wait_time(now)
+        self.tokens -= 1
+        return wait
+
+    def hold(self, seconds: float, now: Optional[float] = None):
+        """Wstrzymuje wydawanie tokenów na `seconds` (np. po Retry-After od Google)."""
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class GoogleFitRateLimiter:
+    """
+    Limity wywołań Google Fit: globalny (wspólny limit projektu) i na użytkownika.
+
+    Wywołanie czeka na token obu kubełków, ale co najwyżej `max_wait` sekund -
+    jeśli trzeba by czekać dłużej, odrzucamy je od razu (RateLimitExceeded),
+    zanim zajmie miejsce w kolejce. Limity obowiązują w obrębie procesu workera.
+    """
+
+    def __init__(self, global_rate: float, global_burst: float, user_rate: float, user_burst: float, max_wait: float):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_wait = max_wait
+        self._user_buckets: Dict[int, TokenBucket] = {}
+
+    def _user_bucket(self, user_id: int, now: float) -> TokenBucket:
+        bucket = self._user_buckets.get(user_id)
+        if bucket is None:
+            if len(self._user_buckets) >= 10000:
+                # Pełne (nieużywane) kubełki niczego nie ograniczają - można je usunąć
+                self._user_buckets = {uid: b for uid, b in self._user_buckets.items() if not b.is_idle(now)}
+            bucket = self._user_buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def reserve(self, user_id: int) -> float:
+        """Rezerwuje wywołanie i zwraca czas oczekiwania albo zgłasza RateLimitExceeded."""
+        now = time.monotonic()
+        user_bucket = self._user_bucket(user_id, now)
+        user_wait = user_bucket.wait_time(now)
+        global_wait = self.global_bucket.wait_time(now)
+        if user_wait > self.max_wait:
+            UPSTREAM_REJECTED.labels(scope="user").inc()
+            raise RateLimitExceeded("user", user_wait)
+        if global_wait > self.max_wait:
+            UPSTREAM_REJECTED.labels(scope="global").inc()
+            raise RateLimitExceeded("global", global_wait)
+        user_bucket.reserve(now)
+        self.global_bucket.reserve(now)
+        if user_wait or global_wait:
+            UPSTREAM_THROTTLED.labels(scope="user" if user_wait >= global_wait else "global").inc()
+        return max(user_wait, global_wait)
+
+    async def acquire(self, user_id: int):
+        wait = self.reserve(user_id)
+        if wait:
+            UPSTREAM_QUEUED.inc()
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                UPSTREAM_QUEUED.dec()
+
+    def hold(self, seconds: float):
+        """Google odpowiedział 429 - limit projektu jest wspólny, więc wstrzymujemy wszystkich."""
+        self.global_bucket.hold(seconds)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After w sekundach albo jako data HTTP; None, jeśli brak lub niepoprawny."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Opóźnienie przed ponowieniem numer `attempt` (od 0).
+
+    Retry-After od serwera ma pierwszeństwo; w przeciwnym razie wykładniczy
+    backoff z pełnym jitterem, żeby ponowienia wielu workerów się nie zbiegały.
+    """
+    if retry_after is not None:
+        return retry_after
+    ceiling = min(settings.GOOGLE_FIT_BACKOFF_MAX_SECONDS, settings.GOOGLE_FIT_BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+google_fit_limiter = GoogleFitRateLimiter(
+    global_rate=settings.GOOGLE_FIT_GLOBAL_RATE,
+    global_burst=settings.GOOGLE_FIT_GLOBAL_BURST,
+    user_rate=settings.GOOGLE_FIT_USER_RATE,
+    user_burst=settings.GOOGLE_FIT_USER_BURST,
+    max_wait=settings.GOOGLE_FIT_LIMIT_MAX_WAIT_SECONDS
+)
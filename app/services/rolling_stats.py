@@ -0,0 +1,188 @@
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from app.models.health import DailyHealthSummary, RollingStatsState
+from database.upsert import bulk_upsert
+
+WINDOWS = (7, 30, 90)
+MAX_WINDOW = max(WINDOWS)
+PERCENTILE_WINDOW = 30
+PERCENTILES = (10, 50, 90)
+STEP_GOAL = 10000
+
+# Metryka -> (kolumna daily_health_summary, czy liczyć serię celu, czy liczyć percentyle)
+METRICS = {
+    "steps": ("steps", True, False),
+    "avg_hr": ("avg_hr", False, True),
+}
+
+
+class RollingState:
+    """
+    Stan statystyk kroczących jednej metryki, aktualizowany dzień po dniu.
+
+    Ostatnie MAX_WINDOW wartości trzymamy w buforze cyklicznym razem z sumami
+    i licznikami dla każdego okna, więc dodanie dnia kosztuje stałą liczbę
+    operacji niezależnie od długości historii. Percentyle liczymy z
+    posortowanego okna PERCENTILE_WINDOW wartości. Dni bez danych (None)
+    przesuwają okna, ale nie wchodzą do średnich.
+    """
+
+    def __init__(self, track_streak: bool = False, track_percentiles: bool = False):
+        self.track_streak = track_streak
+        self.track_percentiles = track_percentiles
+        self.count = 0
+        self.buffer: List[Optional[float]] = [None] * MAX_WINDOW
+        self.sums = {window: 0.0 for window in WINDOWS}
+        self.counts = {window: 0 for window in WINDOWS}
+        self.sorted_window: List[float] = []
+        self.streak = 0
+        self.best_streak = 0
+
+    def push(self, value: Optional[float]):
+        slot = self.count % MAX_WINDOW
+        for window in WINDOWS:
+            if self.count >= window:
+                old = self.buffer[(self.count - window) % MAX_WINDOW]
+                if old is not None:
+                    self.sums[window] -= old
+                    self.counts[window] -= 1
+            if value is not None:
+                self.sums[window] += value
+                self.counts[window] += 1
+
+        if self.track_percentiles:
+            if self.count >= PERCENTILE_WINDOW:
+                old = self.buffer[(self.count - PERCENTILE_WINDOW) % MAX_WINDOW]
+                if old is not None:
+                    del self.sorted_window[bisect_left(self.sorted_window, old)]
+            if value is not None:
+                insort(self.sorted_window, value)
+
+        if self.track_streak:
+            self.streak = self.streak + 1 if value is not None and value >= STEP_GOAL else 0
+            self.best_streak = max(self.best_streak, self.streak)
+
+        self.buffer[slot] = value
+        self.count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Percentyl z interpolacją liniową (jak numpy.percentile)."""
+        values = self.sorted_window
+        if not values:
+            return None
+        position = (len(values) - 1) * q / 100
+        lower = int(position)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+    def summary(self) -> dict:
+        result = {
+            f"avg_{window}d": round(self.sums[window] / self.counts[window], 1) if self.counts[window] else None
+            for window in WINDOWS
+        }
+        if self.track_streak:
+            result["goal_streak"] = self.streak
+            result["best_goal_streak"] = self.best_streak
+        if self.track_percentiles:
+            for q in PERCENTILES:
+                value = self.percentile(q)
+                result[f"p{q}_{PERCENTILE_WINDOW}d"] = round(value, 1) if value is not None else None
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count, "buffer": self.buffer,
+            "sums": [self.sums[window] for window in WINDOWS],
+            "counts": [self.counts[window] for window in WINDOWS],
+            "sorted_window": self.sorted_window,
+            "streak": self.streak, "best_streak": self.best_streak,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, track_streak: bool, track_percentiles: bool) -> "RollingState":
+        state = cls(track_streak, track_percentiles)
+        state.count = data["count"]
+        state.buffer = data["buffer"]
+        state.sums = dict(zip(WINDOWS, data["sums"]))
+        state.counts = dict(zip(WINDOWS, data["counts"]))
+        state.sorted_window = data["sorted_window"]
+        state.streak = data["streak"]
+        state.best_streak = data["best_streak"]
+        return state
+
+
+def _advance(state: RollingState, last_date: Optional[date], rows: Dict[date, Optional[float]], until: date) -> date:
+    """Dopycha do stanu dni (last_date, until]; brakujące dni jako None."""
+    if not rows and last_date is not None and (until - last_date).days > MAX_WINDOW:
+        # Długa przerwa bez danych - okna i tak będą puste, nie iterujemy po każdym dniu
+        for _ in range(MAX_WINDOW):
+            state.push(None)
+        return until
+    day = min(rows) if last_date is None else last_date + timedelta(days=1)
+    while day <= until:
+        state.push(rows.get(day))
+        day += timedelta(days=1)
+    return until
+
+
+def update_rolling_stats(db: Session, user_id: int, today: Optional[date] = None) -> dict:
+    """
+    Aktualizuje stan statystyk kroczących o pełne dni, których jeszcze nie uwzględnia,
+    i zwraca podsumowanie dla dashboardu. Bieżący dzień (niepełny) jest pomijany.
+
+    Czyta z daily_health_summary tylko wiersze nowsze niż zapisany stan; bez
+    stanu (pierwszy raz lub po invalidate_rolling_stats) przelicza całą historię.
+    Nie wykonuje commit.
+    """
+    until = (today or date.today()) - timedelta(days=1)
+    stored = {row.metric: row for row in db.query(RollingStatsState).filter(RollingStatsState.user_id == user_id)}
+    states = {}
+    for metric, (column, track_streak, track_percentiles) in METRICS.items():
+        row = stored.get(metric)
+        if row is None:
+            states[metric] = (RollingState(track_streak, track_percentiles), None)
+        else:
+            states[metric] = (RollingState.from_dict(row.state, track_streak, track_percentiles), row.last_date)
+
+    known = [last_date for _, last_date in states.values() if last_date is not None]
+    since = min(known) if len(known) == len(states) else None
+    if since is None or since < until:
+        query = db.query(DailyHealthSummary).filter(
+            DailyHealthSummary.user_id == user_id,
+            DailyHealthSummary.date <= until
+        )
+        if since is not None:
+            query = query.filter(DailyHealthSummary.date > since)
+        summaries = query.order_by(DailyHealthSummary.date).all()
+
+        rows = []
+        for metric, (state, last_date) in states.items():
+            column = METRICS[metric][0]
+            values = {summary.date: getattr(summary, column) for summary in summaries
+                      if last_date is None or summary.date > last_date}
+            if last_date is None and not values:
+                continue
+            if last_date is not None and last_date >= until:
+                continue
+            last_date = _advance(state, last_date, values, until)
+            states[metric] = (state, last_date)
+            rows.append({"user_id": user_id, "metric": metric, "last_date": last_date,
+                         "state": state.to_dict(), "updated_at": datetime.now()})
+        bulk_upsert(db, RollingStatsState, rows, ["user_id", "metric"], ["last_date", "state", "updated_at"])
+
+    return {metric: state.summary() for metric, (state, _) in states.items()}
+
+
+def invalidate_rolling_stats(db: Session, user_id: int, changed_days: List[date]):
+    """
+    Usuwa stan, który uwzględnia już któryś ze zmienionych dni (np. spóźnione dane
+    z opaski) - następne update_rolling_stats przeliczy go od zera. Nie wykonuje commit.
+    """
+    if not changed_days:
+        return
+    db.query(RollingStatsState).filter(
+        RollingStatsState.user_id == user_id,
+        RollingStatsState.last_date >= min(changed_days)
+    ).delete(synchronize_session=False)
@@ -0,0 +1,42 @@
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+Interval = Tuple[int, int]
+MILLIS_PER_HOUR = 1000 * 60 * 60
+
+
+def session_interval(session: dict) -> Optional[Interval]:
+    """(startTimeMillis, endTimeMillis) sesji snu albo None dla sesji bez poprawnego zakresu."""
+    start_millis = int(session.get("startTimeMillis", 0))
+    end_millis = int(session.get("endTimeMillis", 0))
+    if start_millis and end_millis > start_millis:
+        return start_millis, end_millis
+    return None
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> Iterator[Interval]:
+    """
+    Scala nakładające się i stykające przedziały (sortowanie + jeden przebieg).
+
+    Sesje z kilku źródeł (np. telefon i opaska) często opisują ten sam sen -
+    po scaleniu każda minuta liczy się tylko raz.
+    """
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is not None and start <= current_end:
+            current_end = max(current_end, end)
+            continue
+        if current_end is not None:
+            yield current_start, current_end
+        current_start, current_end = start, end
+    if current_end is not None:
+        yield current_start, current_end
+
+
+def nightly_sleep_millis(intervals: Iterable[Interval]) -> Dict[date, int]:
+    """Suma snu na noc po scaleniu przedziałów; noc przypisujemy do dnia (lokalnego) jej zakończenia."""
+    nights: Dict[date, int] = {}
+    for start, end in merge_intervals(intervals):
+        night = datetime.fromtimestamp(end / 1000).date()
+        nights[night] = nights.get(night, 0) + end - start
+    return nights
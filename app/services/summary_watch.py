@@ -0,0 +1,68 @@
+"""
+Zmiany danych zapisane przez inne procesy (sync_worker, pozostałe workery uvicorna).
+
+dashboard_events i dashboard_cache działają w pamięci jednego procesu, więc
+synchronizacja wykonana gdzie indziej nie trafia do nich bezpośrednio. Dopóki
+użytkownik ma otwarty strumień, SummaryChangeWatcher sprawdza w bazie
+api_connections.last_synced_at; po jego zmianie wysyła zmienione wiersze
+daily_health_summary jako delty i unieważnia cache dashboardu użytkownika.
+Delta niesie pełne wartości dnia, więc wysłana powtórnie niczego nie psuje.
+"""
+from datetime import datetime
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from app.models.api_connections import ApiConnection
+from app.models.health import DailyHealthSummary
+from app.services.daily_summary import SUMMARY_COLUMNS, summary_delta
+from app.services.dashboard_cache import dashboard_cache
+from app.services.dashboard_events import dashboard_events
+from database.db_setup import SessionLocal
+
+
+class SummaryChangeWatcher:
+    def __init__(self, user_id: int, session_factory=None):
+        self.user_id = user_id
+        self._session_factory = session_factory
+        self._primed = False
+        # Ostatnio widziany last_synced_at i najnowszy updated_at już wysłanych wierszy
+        self.synced_at: Optional[datetime] = None
+        self.published_until: Optional[datetime] = None
+
+    def _last_synced_at(self, db: Session) -> Optional[datetime]:
+        row = db.query(ApiConnection.last_synced_at).filter(
+            ApiConnection.user_id == self.user_id,
+            ApiConnection.provider == "google_fit",
+            ApiConnection.is_active == True
+        ).first()
+        return row[0] if row else None
+
+    def _changed_rows(self) -> List[dict]:
+        """Wiersze podsumowań zmienione od poprzedniego sprawdzenia (pierwsze tylko zapamiętuje stan)."""
+        with (self._session_factory or SessionLocal)() as db:
+            synced_at = self._last_synced_at(db)
+            if not self._primed:
+                self._primed = True
+                self.synced_at, self.published_until = synced_at, datetime.now()
+                return []
+            if synced_at == self.synced_at:
+                return []
+            # Wiersze synchronizacji mają updated_at nie wcześniejszy niż jej last_synced_at (moment startu),
+            # także gdy zatwierdziła się później niż synchronizacja widziana poprzednio
+            since = self.published_until if synced_at is None else min(self.published_until, synced_at)
+            summaries = db.query(DailyHealthSummary).filter(
+                DailyHealthSummary.user_id == self.user_id,
+                DailyHealthSummary.updated_at > since
+            ).order_by(DailyHealthSummary.date).all()
+        self.synced_at = synced_at
+        if summaries:
+            self.published_until = max(self.published_until, max(row.updated_at for row in summaries))
+        return [{column: getattr(row, column) for column in ["date"] + SUMMARY_COLUMNS} for row in summaries]
+
+    async def poll(self) -> int:
+        """Wysyła do strumieni dni zmienione przez dowolny proces; zwraca ich liczbę."""
+        rows = await run_in_threadpool(self._changed_rows)
+        if rows:
+            dashboard_cache.invalidate_user(self.user_id, keep_last_good=True)
+            dashboard_events.publish(self.user_id, "delta", {"days": [summary_delta(row) for row in rows]})
+        return len(rows)
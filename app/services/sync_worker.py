@@ -0,0 +1,152 @@
+"""
+Worker synchronizujący dane Google Fit wszystkich aktywnych połączeń.
+
+Uruchamiany jako osobny proces (obok uvicorna):
+    python -m app.services.sync_worker --metrics-port 9101
+
+Każdy cykl rozkłada synchronizacje użytkowników równomiernie na
+SYNC_WORKER_INTERVAL_SECONDS, zaczynając od najdawniej synchronizowanych.
+Dashboard czyta wtedy głównie lokalne tabele - jego własna synchronizacja
+zwykle kończy się na sprawdzeniu SYNC_MIN_INTERVAL_SECONDS.
+
+Worker jest jednym procesem, więc działa w nim też token_refresher - tokeny
+są odnawiane przed wygaśnięciem, a nie na ścieżce żądania użytkownika.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from app.models.api_connections import ApiConnection
+from app.services.health import GoogleFitServices
+from app.services.http_client import close_async_client
+from app.services.token_refresher import token_refresher
+from app.logging_config import configure_logging
+from database.db_setup import SessionLocal
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CYCLE_USERS = Gauge("sync_worker_cycle_users", "Połączenia do zsynchronizowania w bieżącym cyklu")
+CYCLE_DONE = Gauge("sync_worker_cycle_done", "Połączenia obsłużone w bieżącym cyklu")
+CYCLE_DURATION = Gauge("sync_worker_cycle_duration_seconds", "Czas trwania ostatniego pełnego cyklu")
+SYNC_LAG = Gauge("sync_worker_lag_seconds", "Czas od ostatniej synchronizacji najdawniej zsynchronizowanego połączenia")
+USER_SYNCS = Counter("sync_worker_user_syncs_total", "Synchronizacje użytkowników wg wyniku", ["outcome"])
+USER_SYNC_DURATION = Histogram("sync_worker_user_sync_seconds", "Czas synchronizacji jednego użytkownika",
+                               buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+
+
+class BulkSyncWorker:
+    def __init__(self, interval_seconds: float, concurrency: int, user_timeout_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.concurrency = concurrency
+        self.user_timeout_seconds = user_timeout_seconds
+
+    def _active_user_ids(self) -> List[int]:
+        """Aktywne połączenia, najdawniej synchronizowane (i nigdy) najpierw."""
+        with SessionLocal() as db:
+            rows = db.query(ApiConnection.user_id, ApiConnection.last_synced_at).filter(
+                ApiConnection.provider == "google_fit",
+                ApiConnection.is_active == True
+            ).order_by(ApiConnection.last_synced_at.asc().nullsfirst()).all()
+        if rows:
+            oldest = rows[0].last_synced_at
+            SYNC_LAG.set((datetime.now() - oldest).total_seconds() if oldest else self.interval_seconds)
+        else:
+            SYNC_LAG.set(0)
+        return [user_id for user_id, _ in rows]
+
+    async def _sync_one(self, user_id: int, semaphore: asyncio.Semaphore) -> bool:
+        async with semaphore:
+            started = time.perf_counter()
+            outcome = "failed"
+            try:
+                service = await GoogleFitServices.create(user_id=user_id)
+                changed = await asyncio.wait_for(service.sync_recent(), timeout=self.user_timeout_seconds)
+                logger.debug("Zsynchronizowano użytkownika %s, zmienionych dni: %s", user_id, changed)
+                outcome = "ok"
+            except HTTPException as e:
+                # Np. połączenie dezaktywowane w międzyczasie albo 401 wymagający ponownej autoryzacji
+                outcome = "skipped" if e.status_code == 404 else "failed"
+                logger.warning("Synchronizacja użytkownika %s nieudana: %s", user_id, e.detail)
+            except asyncio.TimeoutError:
+                logger.warning("Synchronizacja użytkownika %s przekroczyła %s s", user_id, self.user_timeout_seconds)
+            except Exception as e:
+                logger.exception("Nieoczekiwany błąd synchronizacji użytkownika %s: %s", user_id, e)
+            finally:
+                USER_SYNC_DURATION.observe(time.perf_counter() - started)
+                USER_SYNCS.labels(outcome=outcome).inc()
+                CYCLE_DONE.inc()
+            return outcome == "ok"
+
+    async def run_once(self, spread_seconds: float = 0) -> int:
+        """
+        Jeden cykl po wszystkich aktywnych połączeniach; zwraca liczbę udanych.
+
+        Starty kolejnych użytkowników są rozłożone równomiernie na spread_seconds,
+        a jednocześnie trwa najwyżej `concurrency` synchronizacji.
+        """
+        user_ids = await run_in_threadpool(self._active_user_ids)
+        CYCLE_USERS.set(len(user_ids))
+        CYCLE_DONE.set(0)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        spacing = spread_seconds / len(user_ids) if user_ids else 0
+        tasks = []
+        for index, user_id in enumerate(user_ids):
+            if index and spacing:
+                await asyncio.sleep(spacing)
+            tasks.append(asyncio.create_task(self._sync_one(user_id, semaphore)))
+        results = await asyncio.gather(*tasks)
+        return sum(1 for result in results if result)
+
+    async def run_forever(self):
+        while True:
+            started = time.monotonic()
+            try:
+                synced = await self.run_once(spread_seconds=self.interval_seconds)
+                logger.info("Cykl synchronizacji zakończony: %s udanych.", synced)
+            except Exception as e:
+                logger.exception("Błąd w cyklu synchronizacji: %s", e)
+            elapsed = time.monotonic() - started
+            CYCLE_DURATION.set(elapsed)
+            await asyncio.sleep(max(0.0, self.interval_seconds - elapsed))
+
+
+async def _run(once: bool):
+    worker = BulkSyncWorker(
+        interval_seconds=settings.SYNC_WORKER_INTERVAL_SECONDS,
+        concurrency=settings.SYNC_WORKER_CONCURRENCY,
+        user_timeout_seconds=settings.SYNC_WORKER_USER_TIMEOUT_SECONDS
+    )
+    try:
+        if once:
+            # Najpierw tokeny wygasające w trakcie cyklu - synchronizacje nie trafią na 401
+            await token_refresher.run_once()
+            await worker.run_once()
+        else:
+            token_refresher.start()
+            await worker.run_forever()
+    finally:
+        await token_refresher.stop()
+        await close_async_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synchronizacja Google Fit wszystkich aktywnych połączeń")
+    parser.add_argument("--once", action="store_true", help="jeden cykl bez rozkładania w czasie, potem koniec")
+    parser.add_argument("--metrics-port", type=int, default=settings.SYNC_WORKER_METRICS_PORT)
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    asyncio.run(_run(args.once))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.models.api_connections import ApiConnection
+from app.services.health import GoogleFitServices
+from database.db_setup import SessionLocal
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class TokenRefresher:
+    """
+    Zadanie w tle odnawiające tokeny Google Fit przed token_expires_at.
+
+    Dzięki temu żądanie użytkownika prawie nigdy nie trafia na wygasły token
+    i nie płaci za dodatkowe odświeżenie oraz ponowienie po 401. Korzysta z tej
+    samej blokady single-flight co GoogleFitServices._refresh_token_async.
+    """
+
+    def __init__(self, interval_seconds: float, refresh_ahead_seconds: float, concurrency: int):
+        self.interval_seconds = interval_seconds
+        self.refresh_ahead = timedelta(seconds=refresh_ahead_seconds)
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+
+    def _expiring_user_ids(self) -> list:
+        with SessionLocal() as db:
+            rows = db.query(ApiConnection.user_id).filter(
+                ApiConnection.provider == "google_fit",
+                ApiConnection.is_active == True,
+                ApiConnection.refresh_token.isnot(None),
+                ApiConnection.token_expires_at < datetime.now() + self.refresh_ahead
+            ).all()
+        return [user_id for user_id, in rows]
+
+    async def _refresh_one(self, user_id: int, semaphore: asyncio.Semaphore) -> bool:
+        async with semaphore:
+            try:
+                service = await GoogleFitServices.create(user_id=user_id)
+            except HTTPException:
+                # Połączenie zostało w międzyczasie dezaktywowane
+                return False
+            return await service._refresh_token_async(min_validity=self.refresh_ahead)
+
+    async def run_once(self) -> int:
+        """Odświeża wszystkie tokeny wygasające w oknie refresh_ahead; zwraca liczbę udanych."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        user_ids = await run_in_threadpool(self._expiring_user_ids)
+        results = await asyncio.gather(
+            *(self._refresh_one(user_id, semaphore) for user_id in user_ids),
+            return_exceptions=True
+        )
+        return sum(1 for result in results if result is True)
+
+    async def run_forever(self):
+        while True:
+            try:
+                refreshed = await self.run_once()
+                if refreshed:
+                    logger.info("Proaktywnie odświeżono %s tokenów Google Fit.", refreshed)
+            except Exception as e:
+                logger.exception("Błąd w zadaniu odświeżania tokenów Google Fit: %s", e)
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+token_refresher = TokenRefresher(
+    interval_seconds=settings.TOKEN_REFRESHER_INTERVAL_SECONDS,
+    refresh_ahead_seconds=settings.TOKEN_REFRESH_AHEAD_SECONDS,
+    concurrency=settings.TOKEN_REFRESHER_CONCURRENCY
+)
@@ -1,7 +1,10 @@
+from typing import Optional
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm import declarative_base 
+from sqlalchemy.orm import declarative_base
 from app.config import get_settings
+from database.pool_metrics import TimedAsyncAdaptedQueuePool, TimedQueuePool, instrument_engine
 
 settings = get_settings()
 DATABASE_URL = settings.DATABASE_URL
@@ -9,7 +12,23 @@ DATABASE_URL = settings.DATABASE_URL
 Base = declarative_base()
 
 
-engine = create_engine(DATABASE_URL, connect_args={}) 
+def engine_options(url: str, async_mode: bool = False) -> dict:
+    """Ustawienia puli połączeń z Settings; SQLite zostaje przy domyślnej puli dialektu."""
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if url.startswith("sqlite"):
+        return options
+    options.update(
+        poolclass=TimedAsyncAdaptedQueuePool if async_mode else TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    return options
+
+
+# Synchroniczny silnik - skrypty, worker synchronizacji i GoogleFitServices
+engine = instrument_engine("sync", create_engine(DATABASE_URL, connect_args={}, **engine_options(DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -20,4 +39,52 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def async_database_url(url: str) -> str:
+    """Ten sam DATABASE_URL ze sterownikiem asynchronicznym (psycopg 3 obsługuje oba tryby)."""
+    if url.startswith("postgresql://"):
+        return "postgresql+psycopg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+
+# Silnik asynchroniczny dla routerów - tworzony przy pierwszym użyciu, żeby skrypty
+# korzystające tylko z SessionLocal nie potrzebowały sterownika async
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        url = async_database_url(DATABASE_URL)
+        _async_engine = instrument_engine("async", create_async_engine(url, **engine_options(url, async_mode=True)))
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    global _async_session_factory
+    if _async_session_factory is None:
+        # expire_on_commit=False - po commit zwracamy obiekty ORM bez ponownego (leniwego) odczytu
+        _async_session_factory = async_sessionmaker(bind=get_async_engine(), autoflush=False, expire_on_commit=False)
+    return _async_session_factory()
+
+
+async def dispose_async_engine():
+    """Zamyka pulę połączeń silnika asynchronicznego (przy zamykaniu aplikacji)."""
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
+
+
+async def get_async_db():
+    """
+    Dependency to get an async database session
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
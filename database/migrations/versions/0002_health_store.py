@@ -0,0 +1,181 @@
+"""Lokalny magazyn danych zdrowotnych - znaczniki synchronizacji, klucze upsertu i nowe tabele
+
+Revision ID: 0002_health_store
+Revises: 0001_baseline
+Create Date: 2026-10-18
+
+Kolumny synced_from/synced_until/last_synced_at połączeń, bpm_max/bpm_min
+tętna, steps/distance aktywności, ograniczenia unikalności będące kluczami
+upsertu oraz tabele pomiarów ciała, rollupów, podsumowań dziennych, statystyk
+kroczących i stanu OAuth.
+
+Wersje bez migracji wywoływały create_all, który tworzył brakujące tabele, ale
+nie dodawał kolumn do istniejących - dlatego tworzymy tylko to, czego w bazie
+jeszcze nie ma (w trybie --sql zakładamy schemat 0001_baseline).
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_health_store'
+down_revision: Union[str, None] = '0001_baseline'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UPSERT_KEYS = {
+    'heart_rate': ('uq_heart_rate_user_timestamp', ['user_id', 'timestamp']),
+    'sleep': ('uq_sleep_user_start_time', ['user_id', 'start_time']),
+    'activity': ('uq_activity_user_type_timestamp', ['user_id', 'activity_type', 'timestamp']),
+}
+
+
+class _Schema:
+    """Istniejące tabele, kolumny i ograniczenia unikalności (pusto w trybie offline)."""
+
+    def __init__(self):
+        self.inspector = None if context.is_offline_mode() else sa.inspect(op.get_bind())
+        self.tables = set(self.inspector.get_table_names()) if self.inspector else set()
+
+    def columns(self, table: str) -> set:
+        return {column['name'] for column in self.inspector.get_columns(table)} if self.inspector else set()
+
+    def unique_constraints(self, table: str) -> set:
+        return {constraint['name'] for constraint in self.inspector.get_unique_constraints(table)} \
+            if self.inspector else set()
+
+
+def _delete_duplicates(table: str, columns: list):
+    # Bez ograniczenia klucz mógł się powtórzyć - zostaje najstarszy wiersz
+    key = ', '.join(f'"{column}"' for column in columns)
+    op.execute(f'DELETE FROM "{table}" WHERE id NOT IN (SELECT MIN(id) FROM "{table}" GROUP BY {key})')
+
+
+def upgrade() -> None:
+    schema = _Schema()
+
+    with op.batch_alter_table('api_connections') as batch_op:
+        for name in ('synced_from', 'synced_until', 'last_synced_at'):
+            if name not in schema.columns('api_connections'):
+                batch_op.add_column(sa.Column(name, sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('heart_rate') as batch_op:
+        for name in ('bpm_max', 'bpm_min'):
+            if name not in schema.columns('heart_rate'):
+                batch_op.add_column(sa.Column(name, sa.Integer(), nullable=True))
+
+    # Istniejące wiersze dostają zero, potem kolumny są NOT NULL bez domyślnej wartości, jak w modelu
+    new_activity_columns = [name for name in ('steps', 'distance') if name not in schema.columns('activity')]
+    with op.batch_alter_table('activity') as batch_op:
+        if 'steps' in new_activity_columns:
+            batch_op.add_column(sa.Column('steps', sa.Integer(), nullable=False, server_default='0'))
+        if 'distance' in new_activity_columns:
+            batch_op.add_column(sa.Column('distance', sa.Float(), nullable=False, server_default='0'))
+    if new_activity_columns:
+        with op.batch_alter_table('activity') as batch_op:
+            for name in new_activity_columns:
+                batch_op.alter_column(name, server_default=None)
+
+    for table, (name, columns) in UPSERT_KEYS.items():
+        if name in schema.unique_constraints(table):
+            continue
+        _delete_duplicates(table, columns)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.create_unique_constraint(name, columns)
+
+    if 'body_measurement' not in schema.tables:
+        op.create_table('body_measurement',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('measurement_type', sa.String(), nullable=False),
+        sa.Column('value', sa.Float(), nullable=True),
+        sa.Column('end_time_nanos', sa.BigInteger(), nullable=True),
+        sa.Column('measured_at', sa.DateTime(), nullable=True),
+        sa.Column('checked_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'measurement_type', name='uq_body_measurement_user_type')
+        )
+    if 'daily_health_summary' not in schema.tables:
+        op.create_table('daily_health_summary',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('steps', sa.Integer(), nullable=False),
+        sa.Column('distance', sa.Float(), nullable=False),
+        sa.Column('avg_hr', sa.Integer(), nullable=True),
+        sa.Column('max_hr', sa.Integer(), nullable=True),
+        sa.Column('min_hr', sa.Integer(), nullable=True),
+        sa.Column('sleep_minutes', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'date', name='uq_daily_health_summary_user_date')
+        )
+    if 'health_rollup' not in schema.tables:
+        op.create_table('health_rollup',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('resolution', sa.String(length=10), nullable=False),
+        sa.Column('period_start', sa.DateTime(), nullable=False),
+        sa.Column('steps', sa.Integer(), nullable=False),
+        sa.Column('distance', sa.Float(), nullable=False),
+        sa.Column('calories', sa.Integer(), nullable=False),
+        sa.Column('bpm_sum', sa.Integer(), nullable=False),
+        sa.Column('bpm_count', sa.Integer(), nullable=False),
+        sa.Column('bpm_max', sa.Integer(), nullable=True),
+        sa.Column('bpm_min', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'resolution', 'period_start', name='uq_health_rollup_user_resolution_period')
+        )
+    if 'oauth_states' not in schema.tables:
+        op.create_table('oauth_states',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('state', sa.String(length=64), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('provider', sa.String(length=50), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_oauth_states_expires_at', 'oauth_states', ['expires_at'], unique=False)
+        op.create_index('ix_oauth_states_state', 'oauth_states', ['state'], unique=True)
+    if 'rolling_stats_state' not in schema.tables:
+        op.create_table('rolling_stats_state',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('metric', sa.String(), nullable=False),
+        sa.Column('last_date', sa.Date(), nullable=False),
+        sa.Column('state', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'metric', name='uq_rolling_stats_state_user_metric')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('rolling_stats_state')
+    op.drop_index('ix_oauth_states_state', table_name='oauth_states')
+    op.drop_index('ix_oauth_states_expires_at', table_name='oauth_states')
+    op.drop_table('oauth_states')
+    op.drop_table('health_rollup')
+    op.drop_table('daily_health_summary')
+    op.drop_table('body_measurement')
+    for table, (name, _) in UPSERT_KEYS.items():
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(name, type_='unique')
+    with op.batch_alter_table('activity') as batch_op:
+        batch_op.drop_column('distance')
+        batch_op.drop_column('steps')
+    with op.batch_alter_table('heart_rate') as batch_op:
+        batch_op.drop_column('bpm_min')
+        batch_op.drop_column('bpm_max')
+    with op.batch_alter_table('api_connections') as batch_op:
+        batch_op.drop_column('last_synced_at')
+        batch_op.drop_column('synced_until')
+        batch_op.drop_column('synced_from')
@@ -0,0 +1,33 @@
+"""Indeksy złożone pod najczęstsze zapytania
+
+Revision ID: 0003_query_indexes
+Revises: 0002_health_store
+Create Date: 2026-10-18
+
+(user_id, timestamp) tabel heart_rate/activity, (user_id, date) podsumowań
+i (user_id, resolution, period_start) rollupów pokrywają już ograniczenia
+unikalności z 0002_health_store. Plany zapytań: scripts/explain_hot_queries.py.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_query_indexes'
+down_revision: Union[str, None] = '0002_health_store'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transaction_user_date', 'transaction', ['user_id', 'date'], unique=False)
+    op.create_index('ix_api_connections_user_provider_active', 'api_connections',
+                    ['user_id', 'provider', 'is_active'], unique=False)
+    op.create_index('ix_sleep_user_end_time', 'sleep', ['user_id', 'end_time'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sleep_user_end_time', table_name='sleep')
+    op.drop_index('ix_api_connections_user_provider_active', table_name='api_connections')
+    op.drop_index('ix_transaction_user_date', table_name='transaction')
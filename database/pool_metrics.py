@@ -0,0 +1,159 @@
+"""
+Metryki Prometheus pul połączeń SQLAlchemy.
+
+Stan puli (wypożyczone, nadmiarowe, wolne połączenia) odczytujemy dopiero przy
+scrapowaniu /metrics, więc wypożyczenie połączenia nie płaci za aktualizację
+gauge'y. Czas oczekiwania na połączenie mierzą klasy puli TimedQueuePool /
+TimedAsyncAdaptedQueuePool - SQLAlchemy nie ma zdarzenia "przed pobraniem z puli".
+
+HeldConnectionTracker mierzy, jak długo sesje trzymają połączenia, i ostrzega
+o trzymanych dłużej niż DB_SESSION_LEAK_THRESHOLD_SECONDS (np. sesja otwarta
+na czas wywołań Google albo niezamknięta).
+"""
+import logging
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Czas oczekiwania na połączenie z puli (z otwarciem nowego połączenia)",
+    ["pool"], buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total", "Wypożyczenia odrzucone po DB_POOL_TIMEOUT (pula wyczerpana)", ["pool"]
+)
+POOL_CONNECTION_HELD = Histogram(
+    "db_pool_connection_held_seconds", "Czas od wypożyczenia połączenia do jego zwrotu do puli",
+    ["pool"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+POOL_LONG_HELD = Counter(
+    "db_pool_long_held_total", "Połączenia zwrócone po czasie dłuższym niż DB_SESSION_LEAK_THRESHOLD_SECONDS", ["pool"]
+)
+
+
+class _TimedCheckout:
+    """Mierzy czas _do_get - oczekiwanie na wolne połączenie albo otwarcie nadmiarowego."""
+    metrics_name = "unnamed"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(pool=self.metrics_name).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.labels(pool=self.metrics_name).observe(time.perf_counter() - started)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+class HeldConnectionTracker:
+    """
+    Śledzi wypożyczone połączenia (zdarzenia checkout/checkin puli).
+
+    Przy zwrocie połączenia trzymanego dłużej niż threshold_seconds loguje
+    ostrzeżenie (z miejscem wypożyczenia, jeśli capture_stack); połączenia,
+    które wciąż nie wróciły, zwraca long_held() i gauge db_pool_long_held_connections.
+    """
+
+    def __init__(self, threshold_seconds: float, capture_stack: bool = False):
+        self.threshold_seconds = threshold_seconds
+        self.capture_stack = capture_stack
+        # id(ConnectionPoolEntry) -> (pula, moment wypożyczenia, stos)
+        self._held: Dict[int, Tuple[str, float, Optional[str]]] = {}
+
+    def attach(self, name: str, engine):
+        sync_engine = getattr(engine, "sync_engine", engine)
+        event.listen(sync_engine, "checkout", lambda dbapi_connection, record, proxy: self._checked_out(name, record))
+        event.listen(sync_engine, "checkin", lambda dbapi_connection, record: self._checked_in(record))
+
+    def _checked_out(self, name: str, record):
+        stack = "".join(traceback.format_stack(limit=16)[:-2]) if self.capture_stack else None
+        self._held[id(record)] = (name, time.monotonic(), stack)
+
+    def _checked_in(self, record):
+        entry = self._held.pop(id(record), None)
+        if entry is None:
+            return
+        name, started, stack = entry
+        held = time.monotonic() - started
+        POOL_CONNECTION_HELD.labels(pool=name).observe(held)
+        if held > self.threshold_seconds:
+            POOL_LONG_HELD.labels(pool=name).inc()
+            logger.warning("Połączenie z puli %s było trzymane %.1f s (próg %.1f s)%s", name, held,
+                           self.threshold_seconds, f"; wypożyczone w:\n{stack}" if stack else "")
+
+    def long_held(self) -> List[Tuple[str, float, Optional[str]]]:
+        """Wciąż wypożyczone połączenia trzymane dłużej niż próg: (pula, sekundy, stos)."""
+        now = time.monotonic()
+        return [(name, now - started, stack) for name, started, stack in list(self._held.values())
+                if now - started > self.threshold_seconds]
+
+
+held_connections = HeldConnectionTracker(settings.DB_SESSION_LEAK_THRESHOLD_SECONDS,
+                                         settings.DB_SESSION_LEAK_TRACEBACK)
+
+
+class PoolCollector:
+    """Kolektor stanu zarejestrowanych pul, odczytywany przy każdym scrapowaniu."""
+
+    def __init__(self):
+        self._pools: Dict[str, Pool] = {}
+
+    def register(self, name: str, pool: Pool):
+        if isinstance(pool, _TimedCheckout):
+            pool.metrics_name = name
+        self._pools[name] = pool
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Połączenia wypożyczone z puli", labels=["pool"])
+        checked_in = GaugeMetricFamily("db_pool_checked_in", "Wolne połączenia czekające w puli", labels=["pool"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Połączenia ponad DB_POOL_SIZE (ujemne: pula jeszcze niepełna)",
+                                     labels=["pool"])
+        size = GaugeMetricFamily("db_pool_size", "Skonfigurowany rozmiar puli (DB_POOL_SIZE)", labels=["pool"])
+        long_held = GaugeMetricFamily("db_pool_long_held_connections",
+                                      "Połączenia wypożyczone dłużej niż DB_SESSION_LEAK_THRESHOLD_SECONDS", labels=["pool"])
+        long_held_counts = {name: 0 for name in self._pools}
+        for name, _, _ in held_connections.long_held():
+            long_held_counts[name] = long_held_counts.get(name, 0) + 1
+        for name, count in long_held_counts.items():
+            long_held.add_metric([name], count)
+        for name, pool in list(self._pools.items()):
+            if not isinstance(pool, QueuePool):
+                # Np. StaticPool / SingletonThreadPool SQLite - brak liczników do raportowania
+                continue
+            checked_out.add_metric([name], pool.checkedout())
+            checked_in.add_metric([name], pool.checkedin())
+            overflow.add_metric([name], pool.overflow())
+            size.add_metric([name], pool.size())
+        yield checked_out
+        yield checked_in
+        yield overflow
+        yield size
+        yield long_held
+
+
+pool_collector = PoolCollector()
+REGISTRY.register(pool_collector)
+
+
+def instrument_engine(name: str, engine):
+    """Dołącza pulę silnika (sync albo async) do metryk /metrics pod etykietą pool=name."""
+    pool_collector.register(name, getattr(engine, "sync_engine", engine).pool)
+    held_connections.attach(name, engine)
+    return engine
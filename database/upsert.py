@@ -0,0 +1,36 @@
+from typing import Iterable, List
+from sqlalchemy.orm import Session
+
+
+def _dialect_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upsert nie jest obsługiwany dla dialektu {dialect}")
+    return insert
+
+
+def bulk_upsert(db: Session, model, rows: List[dict], index_elements: Iterable[str], update_columns: Iterable[str], chunk_size: int = 1000) -> int:
+    """
+    Wstawia wiersze jednym INSERT ... ON CONFLICT DO UPDATE na paczkę.
+
+    index_elements muszą odpowiadać unikalnemu ograniczeniu modelu.
+    Zwraca liczbę przetworzonych wierszy. Nie wykonuje commit.
+    """
+    if not rows:
+        return 0
+    insert = _dialect_insert(db)
+    index_elements = list(index_elements)
+    update_columns = list(update_columns)
+
+    for i in range(0, len(rows), chunk_size):
+        stmt = insert(model).values(rows[i:i + chunk_size])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: stmt.excluded[column] for column in update_columns}
+        )
+        db.execute(stmt)
+    return len(rows)
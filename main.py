@@ -6,25 +6,50 @@ from app.api.health import router as health_router
 from app.api.api_connections import router as api_connections_router
 from app.api.auth import router as auth_router
 from app.api.finance import router as finance_router  # NOWY IMPORT
-from database.db_setup import engine, Base  # ZMIENIONY IMPORT
+from database.db_setup import dispose_async_engine
 import app.models  # NOWY IMPORT (rejestruje wszystkie modele)
 from app.services.auth import get_current_user
+from app.services.http_client import close_async_client
+from app.services.dashboard_events import dashboard_events
+from app.services.token_refresher import token_refresher
+from app.services.oauth_state import oauth_state_purger
+from app.config import get_settings
+from app.logging_config import configure_logging
+from contextlib import asynccontextmanager
 import os
 
 # Importy dla monitoringu SRE
 from starlette_exporter import PrometheusMiddleware, handle_metrics
 
+configure_logging()
+
 # Create directories if they don't exist
 os.makedirs("templates", exist_ok=True)
 os.makedirs("static", exist_ok=True)
 
-# Create database tables
-# Ta jedna linia teraz stworzy WSZYSTKIE tabele (User, Health, ApiConnection, Transaction)
-app.models.Base.metadata.create_all(bind=engine)
+# Schemat bazy tworzą i aktualizują migracje Alembic (alembic upgrade head), nie start aplikacji
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tokeny odświeża sync_worker; tu domyślnie wyłączone, bo każdy worker uvicorna uruchomiłby
+    # własną kopię. Włącz we wdrożeniu bez sync_workera - równoległe odświeżenia szereguje blokada wiersza.
+    if get_settings().TOKEN_REFRESHER_ENABLED:
+        token_refresher.start()
+    oauth_state_purger.start()
+    yield
+    await token_refresher.stop()
+    await oauth_state_purger.stop()
+    # Zatrzymaj synchronizacje w tle uruchomione dla otwartych strumieni SSE
+    await dashboard_events.close()
+    # Zamknij współdzieloną pulę połączeń HTTP do Google
+    await close_async_client()
+    await dispose_async_engine()
+
 
 app = FastAPI(title="Personal Health & Finance Dashboard",
               description="API to track health and financial data",
-              version="0.1.0")
+              version="0.1.0",
+              lifespan=lifespan)
 
 # --- SRE: Dodanie monitoringu Prometheus ---
 app.add_middleware(PrometheusMiddleware)
@@ -0,0 +1,83 @@
+"""
+Porównanie prognozy kroków: dopasowanie sklearn LinearRegression per użytkownik
+(poprzednia implementacja predict_steps) vs jedno wsadowe dopasowanie NumPy
+z app.services.predictions.
+
+Oba warianty liczą ten sam model (trend + dni tygodnia) na tych samych danych,
+więc oprócz czasu raportowana jest też maksymalna różnica prognoz:
+    python -m scripts.benchmark_forecast --users 2000 --days 90 --horizon 7
+
+sklearn nie jest zależnością aplikacji - bez niego mierzony jest tylko wariant NumPy.
+"""
+import argparse
+import time
+from datetime import date
+
+import numpy as np
+
+from app.services.predictions import design_matrix, forecast_batch
+
+
+def synthetic_series(users: int, days: int, missing: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(days)
+    weekly = rng.normal(0, 800, size=(users, 7))
+    series = (rng.normal(7000, 2000, size=(users, 1)) + rng.normal(0, 15, size=(users, 1)) * t
+              + weekly[:, t % 7] + rng.normal(0, 1000, size=(users, days)))
+    series[rng.random(series.shape) < missing] = np.nan
+    return series
+
+
+def sklearn_forecast(series: np.ndarray, start: date, horizon: int) -> np.ndarray:
+    from sklearn.linear_model import LinearRegression
+
+    days = series.shape[1]
+    X = design_matrix(start, days + horizon)
+    forecast = np.empty((series.shape[0], horizon))
+    for index, row in enumerate(series):
+        mask = ~np.isnan(row)
+        model = LinearRegression(fit_intercept=False)
+        model.fit(X[:days][mask], row[mask])
+        forecast[index] = np.clip(model.predict(X[days:]), 0, None)
+    return forecast
+
+
+def timed(function, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prognozy kroków: sklearn vs wsadowy NumPy")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--horizon", type=int, default=7)
+    parser.add_argument("--missing", type=float, default=0.05, help="odsetek brakujących dni")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = date(2024, 1, 1)
+    series = synthetic_series(args.users, args.days, args.missing, args.seed)
+
+    numpy_seconds, numpy_result = timed(lambda: forecast_batch(series, start, args.horizon), args.repeat)
+    print(f"NumPy (wsadowo):      {numpy_seconds * 1000:9.1f} ms  ({numpy_seconds / args.users * 1e6:.1f} µs/użytkownik)")
+
+    try:
+        import sklearn  # noqa: F401
+    except ImportError:
+        print("sklearn niezainstalowany - pominięto porównanie")
+        return
+    sklearn_seconds, sklearn_result = timed(lambda: sklearn_forecast(series, start, args.horizon), args.repeat)
+    print(f"sklearn (pętla):      {sklearn_seconds * 1000:9.1f} ms  ({sklearn_seconds / args.users * 1e6:.1f} µs/użytkownik)")
+    print(f"Przyspieszenie:       {sklearn_seconds / numpy_seconds:9.1f}x")
+    print(f"Maks. różnica prognoz: {np.nanmax(np.abs(numpy_result - sklearn_result)):.4f} kroków")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Plany zapytań (EXPLAIN) dla najczęstszych zapytań aplikacji.
+
+Zapytania odpowiadają tym z routerów i serwisów (lista transakcji, aktywne
+połączenie Google Fit, zakresy tętna/aktywności/snu, podsumowania dzienne,
+rollupy, stan OAuth). Po `alembic upgrade head` każde powinno trafiać w indeks:
+    python -m scripts.explain_hot_queries --user-id 1
+    python -m scripts.explain_hot_queries --analyze     # PostgreSQL: EXPLAIN ANALYZE
+    python -m scripts.explain_hot_queries --check       # kod wyjścia 1 przy pełnym skanie tabeli
+
+W --check PostgreSQL dostaje `SET enable_seqscan = off` - na małych tabelach
+planista i tak wybrałby Seq Scan, a sprawdzamy, czy indeks w ogóle da się użyć.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app.models.api_connections import ApiConnection, OAuthState
+from app.models.health import ACTIVITY_TYPE_HOURLY, Activity, DailyHealthSummary, HealthRollup, HeartRate, Sleep
+from app.models.transaction import Transaction
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement, analyze: bool = False):
+        self.statement = statement
+        self.analyze = analyze
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    if compiler.dialect.name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN ANALYZE " if element.analyze else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def hot_queries(user_id: int, now: datetime) -> List[Tuple[str, object]]:
+    week_ago = now - timedelta(days=7)
+    return [
+        ("transakcje użytkownika", select(Transaction).where(
+            Transaction.user_id == user_id).order_by(Transaction.date.desc())),
+        ("aktywne połączenie google_fit", select(ApiConnection).where(
+            ApiConnection.user_id == user_id, ApiConnection.provider == "google_fit",
+            ApiConnection.is_active == True)),
+        ("tętno w zakresie", select(HeartRate.timestamp, HeartRate.bpm_value).where(
+            HeartRate.user_id == user_id, HeartRate.timestamp >= week_ago, HeartRate.timestamp < now)),
+        ("aktywność godzinowa w zakresie", select(Activity.timestamp, Activity.steps).where(
+            Activity.user_id == user_id, Activity.activity_type == ACTIVITY_TYPE_HOURLY,
+            Activity.timestamp >= week_ago, Activity.timestamp < now)),
+        ("sen kończący się w zakresie", select(Sleep.start_time, Sleep.end_time).where(
+            Sleep.user_id == user_id, Sleep.end_time >= week_ago, Sleep.end_time < now
+        ).order_by(Sleep.start_time)),
+        ("podsumowania dzienne", select(DailyHealthSummary).where(
+            DailyHealthSummary.user_id == user_id, DailyHealthSummary.date >= week_ago.date())),
+        ("rollupy tygodniowe", select(HealthRollup).where(
+            HealthRollup.user_id == user_id, HealthRollup.resolution == "week",
+            HealthRollup.period_start >= week_ago)),
+        ("stan OAuth", select(OAuthState).where(OAuthState.state == "state")),
+    ]
+
+
+def explain(connection: Connection, statement, analyze: bool = False) -> List[str]:
+    rows = connection.execute(Explain(statement, analyze)).fetchall()
+    # SQLite: (id, parent, notused, detail); PostgreSQL: jedna kolumna z linią planu
+    return [str(row[-1]) for row in rows]
+
+
+def full_scans(plan: List[str], dialect: str) -> List[str]:
+    """Linie planu czytające całą tabelę zamiast indeksu."""
+    if dialect == "sqlite":
+        return [line for line in plan if line.startswith("SCAN ") and " USING " not in line]
+    return [line for line in plan if "Seq Scan" in line]
+
+
+def run(connection: Connection, user_id: int, analyze: bool = False, check: bool = False) -> int:
+    """Wypisuje plany i zwraca liczbę zapytań z pełnym skanem tabeli."""
+    dialect = connection.dialect.name
+    if check and dialect == "postgresql":
+        connection.execute(text("SET enable_seqscan = off"))
+    failures = 0
+    for name, statement in hot_queries(user_id, datetime.now()):
+        plan = explain(connection, statement, analyze)
+        scans = full_scans(plan, dialect)
+        failures += bool(scans)
+        print(f"== {name}{'  [PEŁNY SKAN]' if scans else ''}")
+        for line in plan:
+            print(f"   {line}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN dla najczęstszych zapytań aplikacji")
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (tylko PostgreSQL, wykonuje zapytania)")
+    parser.add_argument("--check", action="store_true", help="kod wyjścia 1, jeśli któreś zapytanie skanuje całą tabelę")
+    args = parser.parse_args()
+
+    from database.db_setup import engine
+
+    with engine.connect() as connection:
+        failures = run(connection, args.user_id, args.analyze, args.check)
+        connection.rollback()
+    if args.check and failures:
+        print(f"Zapytania bez indeksu: {failures}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Lokalny zamiennik API Google Fit do testów i pomiarów wydajności.
+
+Obsługuje endpointy używane przez GoogleFitServices: dataset:aggregate,
+sessions, dataSources/.../datasets oraz endpoint tokenów OAuth. Dane są
+syntetyczne, ale deterministyczne (zależą tylko od znaczników czasu), a
+rozmiar odpowiedzi, opóźnienie i odsetek błędów można konfigurować.
+
+Uruchomienie:
+    python -m scripts.fake_google_fit --port 8099 --latency-ms 150 --jitter-ms 50
+
+Aplikację kierujemy na zamiennik zmiennymi środowiskowymi:
+    GOOGLE_FIT_BASE_URL=http://127.0.0.1:8099/fitness/v1/users/me
+    GOOGLE_TOKEN_URL=http://127.0.0.1:8099/token
+"""
+import argparse
+import asyncio
+import random
+import secrets
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DAY_MILLIS = 86400000
+SLEEP_ACTIVITY_TYPE = 72
+
+
+@dataclass
+class FakeFitConfig:
+    latency_ms: float = 0
+    jitter_ms: float = 0
+    error_rate: float = 0.0
+    # Liczba punktów na dzień w datasetach wagi/wzrostu (rozmiar odpowiedzi)
+    points_per_day: int = 1
+    # Liczba sesji snu na stronę odpowiedzi API sesji
+    sessions_page_size: int = 1000
+
+
+def _rng(*seed) -> random.Random:
+    # Ziarno jako tekst - stabilne między procesami (w przeciwieństwie do hash())
+    return random.Random(repr(seed))
+
+
+def _aggregate_value(data_type: str, start_millis: int, duration_millis: int) -> Optional[list]:
+    """Syntetyczna wartość jednego kubełka - skalowana do długości kubełka."""
+    rng = _rng(data_type, start_millis, duration_millis)
+    day_fraction = duration_millis / DAY_MILLIS
+    if data_type == "com.google.step_count.delta":
+        return [{"intVal": int(rng.randint(3000, 14000) * day_fraction), "mapVal": []}]
+    if data_type == "com.google.distance.delta":
+        return [{"fpVal": rng.uniform(2000, 10000) * day_fraction, "mapVal": []}]
+    if data_type == "com.google.calories.expended":
+        return [{"fpVal": rng.uniform(1800, 2800) * day_fraction, "mapVal": []}]
+    if data_type == "com.google.heart_rate.bpm":
+        avg = rng.uniform(60, 85)
+        return [{"fpVal": avg, "mapVal": []}, {"fpVal": avg + rng.uniform(20, 60), "mapVal": []},
+                {"fpVal": avg - rng.uniform(5, 15), "mapVal": []}]
+    if data_type == "com.google.weight":
+        return [{"fpVal": 70 + rng.uniform(-0.5, 0.5), "mapVal": []}]
+    if data_type == "com.google.height":
+        return [{"fpVal": 1.78, "mapVal": []}]
+    return None
+
+
+def aggregate_payload(body: dict) -> dict:
+    """Odpowiedź dataset:aggregate dla podanego ciała żądania (bucketByTime)."""
+    start_millis = int(body["startTimeMillis"])
+    end_millis = int(body["endTimeMillis"])
+    duration = int(body.get("bucketByTime", {}).get("durationMillis", DAY_MILLIS))
+    buckets = []
+    for bucket_start in range(start_millis, end_millis, duration):
+        bucket_end = min(bucket_start + duration, end_millis)
+        datasets = []
+        for aggregate in body.get("aggregateBy", []):
+            data_type = aggregate["dataTypeName"]
+            value = _aggregate_value(data_type, bucket_start, bucket_end - bucket_start)
+            points = []
+            if value is not None:
+                points.append({
+                    "startTimeNanos": str(bucket_start * 1000000),
+                    "endTimeNanos": str(bucket_end * 1000000),
+                    "dataTypeName": data_type,
+                    "value": value,
+                })
+            datasets.append({"dataSourceId": f"derived:{data_type}:com.google.android.gms:aggregated", "point": points})
+        buckets.append({"startTimeMillis": str(bucket_start), "endTimeMillis": str(bucket_end), "dataset": datasets})
+    return {"bucket": buckets}
+
+
+def all_sleep_sessions(start_millis: int, end_millis: int) -> list:
+    """Jedna noc na każdy dzień w zakresie: start między 22:30 a 24:00, 5,5-9 h snu."""
+    sessions = []
+    day = datetime.fromtimestamp(start_millis / 1000).date() - timedelta(days=1)
+    last_day = datetime.fromtimestamp(end_millis / 1000).date()
+    while day <= last_day:
+        rng = _rng("sleep", day.toordinal())
+        night_start = datetime.combine(day, datetime.min.time()) + timedelta(hours=22, minutes=rng.randint(30, 120))
+        night_end = night_start + timedelta(minutes=rng.randint(330, 540))
+        session_start = int(night_start.timestamp() * 1000)
+        session_end = int(night_end.timestamp() * 1000)
+        if session_end > start_millis and session_start < end_millis:
+            sessions.append({
+                "id": f"sleep-{day.isoformat()}",
+                "name": "Sen",
+                "startTimeMillis": str(session_start),
+                "endTimeMillis": str(session_end),
+                "modifiedTimeMillis": str(session_end),
+                "activityType": SLEEP_ACTIVITY_TYPE,
+                "application": {"packageName": "fake.google.fit"},
+            })
+        day += timedelta(days=1)
+    return sessions
+
+
+def sessions_payload(start_millis: int, end_millis: int, page_token: Optional[str], page_size: int) -> dict:
+    """Strona odpowiedzi API sesji; pageToken to indeks pierwszej sesji strony."""
+    sessions = all_sleep_sessions(start_millis, end_millis)
+    offset = int(page_token or 0)
+    page = sessions[offset:offset + page_size]
+    payload = {"session": page, "deletedSession": []}
+    if offset + page_size < len(sessions):
+        payload["nextPageToken"] = str(offset + page_size)
+    return payload
+
+
+def dataset_payload(data_source_id: str, start_nanos: int, end_nanos: int, points_per_day: int) -> dict:
+    """Punkty surowego datasetu (np. wagi) równomiernie rozłożone w zakresie."""
+    data_type = data_source_id.split(":")[1] if ":" in data_source_id else data_source_id
+    step_nanos = max(DAY_MILLIS * 1000000 // max(points_per_day, 1), 1)
+    points = []
+    for point_start in range(start_nanos, end_nanos, step_nanos):
+        value = _aggregate_value(data_type, point_start // 1000000, 0)
+        if value is None:
+            break
+        points.append({
+            "startTimeNanos": str(point_start),
+            "endTimeNanos": str(point_start),
+            "dataTypeName": data_type,
+            "originDataSourceId": "fake.google.fit",
+            "value": value,
+        })
+    return {"minStartTimeNs": str(start_nanos), "maxEndTimeNs": str(end_nanos),
+            "dataSourceId": data_source_id, "point": points}
+
+
+def _iso_to_millis(value: str) -> int:
+    return int(datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def create_app(config: Optional[FakeFitConfig] = None) -> FastAPI:
+    config = config or FakeFitConfig()
+    app = FastAPI(title="Fake Google Fit")
+    app.state.config = config
+    app.state.request_counts = {}
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        counts = app.state.request_counts
+        counts[request.url.path] = counts.get(request.url.path, 0) + 1
+        delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if config.error_rate and random.random() < config.error_rate:
+            return JSONResponse({"error": {"code": 503, "message": "Backend Error"}}, status_code=503)
+        return await call_next(request)
+
+    @app.post("/token")
+    async def token():
+        return {"access_token": f"fake-{secrets.token_hex(8)}", "expires_in": 3600, "token_type": "Bearer"}
+
+    @app.post("/fitness/v1/users/me/dataset:aggregate")
+    async def aggregate(request: Request):
+        return aggregate_payload(await request.json())
+
+    @app.get("/fitness/v1/users/me/sessions")
+    async def sessions(startTime: str, endTime: str, pageToken: Optional[str] = None):
+        return sessions_payload(_iso_to_millis(startTime), _iso_to_millis(endTime), pageToken, config.sessions_page_size)
+
+    @app.get("/fitness/v1/users/me/dataSources/{data_source_id}/datasets/{dataset_id}")
+    async def dataset(data_source_id: str, dataset_id: str):
+        start_nanos, end_nanos = (int(part) for part in dataset_id.split("-"))
+        return dataset_payload(data_source_id, start_nanos, end_nanos, config.points_per_day)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokalny zamiennik API Google Fit")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--points-per-day", type=int, default=1)
+    parser.add_argument("--sessions-page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = FakeFitConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        points_per_day=args.points_per_day, sessions_page_size=args.sessions_page_size
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
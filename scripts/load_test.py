@@ -0,0 +1,223 @@
+"""
+Test obciążeniowy /api/health/dashboard na lokalnym zamienniku Google Fit.
+
+Harness rejestruje użytkowników przez prawdziwe API aplikacji, podpina im
+połączenie google_fit (tokeny zamiennika), a następnie uruchamia scenariusze
+z zadaną współbieżnością i raportuje przepustowość, p50/p95/p99 oraz odsetek
+błędów dla każdego scenariusza.
+
+Wszystko naraz (zamiennik + aplikacja jako podprocesy, baza z DATABASE_URL):
+    python -m scripts.load_test --spawn --latency-ms 150 --users 20 --concurrency 32
+
+Przeciwko już działającej aplikacji skierowanej na zamiennik:
+    python -m scripts.fake_google_fit --port 8099 --latency-ms 150 &
+    GOOGLE_FIT_BASE_URL=http://127.0.0.1:8099/fitness/v1/users/me \\
+    GOOGLE_TOKEN_URL=http://127.0.0.1:8099/token uvicorn main:app --port 8000 &
+    python -m scripts.load_test --app-url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import httpx
+
+
+@dataclass
+class Scenario:
+    name: str
+    days: List[int]
+    requests_per_user: int
+
+
+# Kolejność ma znaczenie: pierwszy scenariusz trafia na zimną bazę i cache
+SCENARIOS = [
+    Scenario("first_view_7d", days=[7], requests_per_user=1),
+    Scenario("repeat_7d", days=[7], requests_per_user=10),
+    Scenario("range_switch", days=[7, 30, 90], requests_per_user=6),
+    Scenario("range_365d", days=[365], requests_per_user=2),
+]
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies_ms: List[float] = field(default_factory=list)
+    statuses: dict = field(default_factory=dict)
+    errors: int = 0
+    elapsed_s: float = 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies_ms:
+            return 0.0
+        ordered = sorted(self.latencies_ms)
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def summary(self) -> dict:
+        total = len(self.latencies_ms)
+        return {
+            "scenario": self.name,
+            "requests": total,
+            "throughput_rps": round(total / self.elapsed_s, 1) if self.elapsed_s else 0.0,
+            "p50_ms": round(self.percentile(50), 1),
+            "p95_ms": round(self.percentile(95), 1),
+            "p99_ms": round(self.percentile(99), 1),
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "statuses": self.statuses,
+        }
+
+
+async def create_user(client: httpx.AsyncClient, run_id: str, index: int) -> str:
+    """Rejestruje użytkownika, loguje go i podpina połączenie google_fit; zwraca JWT."""
+    username = f"load_{run_id}_{index}"
+    password = "load-test-password"
+    response = await client.post("/auth/register", json={
+        "username": username, "email": f"{username}@example.com",
+        "password": password, "confirm_password": password,
+    })
+    response.raise_for_status()
+    response = await client.post("/auth/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    token = response.json()["access_token"]
+
+    response = await client.post("/api/api-connections/", headers={"Authorization": f"Bearer {token}"}, json={
+        "provider": "google_fit",
+        "access_token": "fake-access-token",
+        "refresh_token": "fake-refresh-token",
+        "token_expires_at": (datetime.now() + timedelta(hours=1)).isoformat(),
+    })
+    response.raise_for_status()
+    return token
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, tokens: List[str], concurrency: int) -> ScenarioResult:
+    result = ScenarioResult(scenario.name)
+    jobs = [(token, scenario.days[i % len(scenario.days)])
+            for i in range(scenario.requests_per_user) for token in tokens]
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def worker():
+        while not queue.empty():
+            token, days = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                response = await client.get("/api/health/dashboard", params={"days": days},
+                                            headers={"Authorization": f"Bearer {token}"})
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "transport_error"
+            result.latencies_ms.append((time.perf_counter() - started) * 1000)
+            result.statuses[str(status)] = result.statuses.get(str(status), 0) + 1
+            if status != 200:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed_s = time.perf_counter() - started
+    return result
+
+
+def print_report(summaries: List[dict]):
+    header = f"{'scenariusz':<16}{'żądania':>9}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'błędy':>9}"
+    print(header)
+    print("-" * len(header))
+    for s in summaries:
+        print(f"{s['scenario']:<16}{s['requests']:>9}{s['throughput_rps']:>9}{s['p50_ms']:>10}"
+              f"{s['p95_ms']:>10}{s['p99_ms']:>10}{s['error_rate'] * 100:>8.1f}%")
+
+
+async def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Serwer {url} nie wystartował w ciągu {timeout} s")
+
+
+def spawn_servers(args) -> List[subprocess.Popen]:
+    """Uruchamia zamiennik Google Fit i aplikację skierowaną na niego."""
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    fake = subprocess.Popen([
+        sys.executable, "-m", "scripts.fake_google_fit", "--port", str(args.fake_port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--points-per-day", str(args.points_per_day),
+    ])
+    env = dict(os.environ,
+               GOOGLE_FIT_BASE_URL=f"{fake_url}/fitness/v1/users/me",
+               GOOGLE_TOKEN_URL=f"{fake_url}/token")
+    # Start aplikacji nie tworzy tabel - schemat z migracji
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], env=env, check=True)
+    app = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ], env=env)
+    return [fake, app]
+
+
+async def main_async(args) -> List[dict]:
+    if args.spawn:
+        await wait_until_up(f"http://127.0.0.1:{args.fake_port}/docs")
+        await wait_until_up(f"{args.app_url}/docs")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.app_url, limits=limits, timeout=args.timeout) as client:
+        run_id = secrets.token_hex(3)
+        tokens = await asyncio.gather(*(create_user(client, run_id, i) for i in range(args.users)))
+        scenarios = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+        summaries = []
+        for scenario in scenarios:
+            summaries.append((await run_scenario(client, scenario, tokens, args.concurrency)).summary())
+    return summaries
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Test obciążeniowy /api/health/dashboard")
+    parser.add_argument("--app-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--scenario", action="append", help="Uruchom tylko wskazane scenariusze")
+    parser.add_argument("--json", help="Zapisz wyniki do pliku JSON")
+    parser.add_argument("--spawn", action="store_true", help="Uruchom zamiennik i aplikację jako podprocesy")
+    parser.add_argument("--app-port", type=int, default=8000)
+    parser.add_argument("--fake-port", type=int, default=8099)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--points-per-day", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    processes = []
+    if args.spawn:
+        args.app_url = f"http://127.0.0.1:{args.app_port}"
+        processes = spawn_servers(args)
+    try:
+        summaries = asyncio.run(main_async(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    print_report(summaries)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summaries, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import sys
+
+# Konfiguracja ścieżek i minimalnych zmiennych środowiskowych wymaganych przez Settings
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("GOOGLE_CLIENT_ID", "test-client-id")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "test-client-secret")
+
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+@pytest.fixture
+def db():
+    """Sesja na bazie SQLite w pamięci z użytkownikiem 1 i jego połączeniem google_fit."""
+    import app.models
+    from app.models.api_connections import ApiConnection
+    from app.models.user import User
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    app.models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(id=1, username="jan", email="jan@example.com", hashed_password="x"))
+    session.add(ApiConnection(user_id=1, provider="google_fit", access_token="token", refresh_token="refresh",
+                              token_expires_at=datetime.now() + timedelta(hours=1)))
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limiter(monkeypatch):
+    """Każdy test zaczyna z pełnymi kubełkami limitera, jak świeży proces."""
+    from app.services import health, rate_limit
+
+    limiter = rate_limit.GoogleFitRateLimiter(
+        global_rate=rate_limit.settings.GOOGLE_FIT_GLOBAL_RATE,
+        global_burst=rate_limit.settings.GOOGLE_FIT_GLOBAL_BURST,
+        user_rate=rate_limit.settings.GOOGLE_FIT_USER_RATE,
+        user_burst=rate_limit.settings.GOOGLE_FIT_USER_BURST,
+        max_wait=rate_limit.settings.GOOGLE_FIT_LIMIT_MAX_WAIT_SECONDS
+    )
+    monkeypatch.setattr(health, "google_fit_limiter", limiter)
+    return limiter
+
+
+@pytest.fixture(autouse=True)
+def fresh_circuit_breakers(monkeypatch):
+    """Bezpieczniki są globalne dla procesu - każdy test dostaje zamknięte."""
+    from app.services import circuit_breaker
+
+    breakers = {name: circuit_breaker.CircuitBreaker(name, breaker.failure_threshold, breaker.reset_timeout)
+                for name, breaker in circuit_breaker.google_fit_breakers.items()}
+    for name, breaker in breakers.items():
+        monkeypatch.setitem(circuit_breaker.google_fit_breakers, name, breaker)
+    return breakers
@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.api.auth import router as auth_router
+from app.api.finance import router as finance_router
+from database.db_setup import async_database_url, get_async_db
+
+
+def test_async_database_url_keeps_the_same_database():
+    assert async_database_url("postgresql://u:p@db:5432/app") == "postgresql+psycopg://u:p@db:5432/app"
+    assert async_database_url("sqlite:///./local.db") == "sqlite+aiosqlite:///./local.db"
+    assert async_database_url("postgresql+psycopg://db/app") == "postgresql+psycopg://db/app"
+
+
+@pytest.fixture
+def client():
+    import app.models
+
+    engine = create_async_engine("sqlite+aiosqlite://", connect_args={"check_same_thread": False},
+                                 poolclass=StaticPool)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with session_factory() as session:
+            yield session
+
+    api = FastAPI()
+    api.include_router(auth_router, prefix="/auth")
+    api.include_router(finance_router, prefix="/api/finance")
+    api.dependency_overrides[get_async_db] = override_get_async_db
+
+    with TestClient(api) as test_client:
+        async def create_schema():
+            async with engine.begin() as connection:
+                await connection.run_sync(app.models.Base.metadata.create_all)
+        test_client.portal.call(create_schema)
+        yield test_client
+        test_client.portal.call(engine.dispose)
+
+
+def test_register_login_and_transactions_through_async_session(client):
+    registered = client.post("/auth/register", json={
+        "username": "anna", "email": "anna@example.com", "password": "tajne123", "confirm_password": "tajne123"
+    })
+    assert registered.status_code == 200, registered.text
+
+    duplicate = client.post("/auth/register", json={
+        "username": "anna", "email": "inna@example.com", "password": "x", "confirm_password": "x"
+    })
+    assert duplicate.status_code == 400
+
+    login = client.post("/auth/login", data={"username": "anna", "password": "tajne123"})
+    assert login.status_code == 200, login.text
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    assert client.get("/auth/me", headers=headers).json()["username"] == "anna"
+
+    for amount, day in ((12.5, "2024-03-01T10:00:00"), (-40.0, "2024-03-02T10:00:00")):
+        created = client.post("/api/finance/", json={"amount": amount, "date": day}, headers=headers)
+        assert created.status_code == 201, created.text
+
+    transactions = client.get("/api/finance/", headers=headers).json()
+    assert [transaction["amount"] for transaction in transactions] == [-40.0, 12.5]
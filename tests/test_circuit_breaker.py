@@ -0,0 +1,64 @@
+import pytest
+
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, google_fit_endpoint
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    # Sukces zeruje licznik - dwa błędy z rzędu to jeszcze za mało
+    assert breaker.state == "closed"
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.is_open()
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.before_call()
+    assert 0 < exc.value.retry_after <= 30
+
+
+def test_half_open_lets_single_trial_through():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+    breaker.opened_at -= 30
+
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_status(200)
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+    breaker.opened_at -= 30
+
+    breaker.before_call()
+    breaker.record_status(502)
+    assert breaker.is_open()
+
+
+def test_client_errors_do_not_trip_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    for status in (401, 404, 429):
+        breaker.record_status(status)
+    assert breaker.state == "closed"
+
+
+def test_endpoint_names():
+    assert google_fit_endpoint("https://fit.test/users/me/dataset:aggregate") == "aggregate"
+    assert google_fit_endpoint("https://fit.test/users/me/sessions?activityType=72") == "sessions"
+    assert google_fit_endpoint("https://fit.test/users/me/dataSources/x/datasets/1-2") == "datasets"
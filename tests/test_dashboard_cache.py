@@ -0,0 +1,108 @@
+import asyncio
+import pytest
+
+from app.services.dashboard_cache import DashboardCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def counting_compute(result="data", delay=0):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result
+
+    return compute, calls
+
+
+def test_second_request_is_served_from_cache():
+    cache = DashboardCache(max_size=10, ttl_seconds=60)
+    compute, calls = counting_compute()
+
+    async def scenario():
+        await cache.get_or_compute((1, 7), compute)
+        return await cache.get_or_compute((1, 7), compute)
+
+    assert run(scenario()) == "data"
+    assert len(calls) == 1
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_expired_entry_is_recomputed():
+    cache = DashboardCache(max_size=10, ttl_seconds=0)
+    compute, calls = counting_compute()
+
+    async def scenario():
+        await cache.get_or_compute((1, 7), compute)
+        await cache.get_or_compute((1, 7), compute)
+
+    run(scenario())
+    assert len(calls) == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = DashboardCache(max_size=2, ttl_seconds=60)
+    compute, calls = counting_compute()
+
+    async def scenario():
+        await cache.get_or_compute((1, 7), compute)
+        await cache.get_or_compute((2, 7), compute)
+        await cache.get_or_compute((1, 7), compute)  # (1, 7) staje się najświeższy
+        await cache.get_or_compute((3, 7), compute)  # usuwa (2, 7)
+        await cache.get_or_compute((1, 7), compute)
+        await cache.get_or_compute((2, 7), compute)
+
+    run(scenario())
+    assert len(calls) == 4
+    assert cache.stats()["evictions"] == 2
+
+
+def test_concurrent_identical_requests_share_one_computation():
+    cache = DashboardCache(max_size=10, ttl_seconds=60)
+    compute, calls = counting_compute(delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_compute((1, 7), compute) for _ in range(5)))
+
+    assert run(scenario()) == ["data"] * 5
+    assert len(calls) == 1
+
+
+def test_failed_computation_is_not_cached():
+    cache = DashboardCache(max_size=10, ttl_seconds=60)
+
+    async def failing():
+        raise RuntimeError("google down")
+
+    with pytest.raises(RuntimeError):
+        run(cache.get_or_compute((1, 7), failing))
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_user_drops_only_that_users_entries():
+    cache = DashboardCache(max_size=10, ttl_seconds=60)
+    compute, calls = counting_compute()
+
+    async def scenario():
+        await cache.get_or_compute((1, 7), compute)
+        await cache.get_or_compute((1, 30), compute)
+        await cache.get_or_compute((2, 7), compute)
+        cache.invalidate_user(1)
+
+    run(scenario())
+    assert cache.stats()["entries"] == 1
+
+
+def test_result_computed_before_invalidation_is_not_stored():
+    cache = DashboardCache(max_size=10, ttl_seconds=60)
+
+    async def compute():
+        cache.invalidate_user(1)  # np. użytkownik odłączył Google Fit w trakcie
+        return "old"
+
+    run(cache.get_or_compute((1, 7), compute))
+    assert cache.stats()["entries"] == 0
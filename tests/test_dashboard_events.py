@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+
+from app.services.dashboard_events import DashboardEventBroker, SubscriptionLimitError, format_sse
+
+
+def test_subscriptions_are_limited_per_user_and_per_process():
+    broker = DashboardEventBroker(max_connections=3, max_connections_per_user=2, queue_size=4)
+    first = broker.subscribe(1)
+    broker.subscribe(1)
+    with pytest.raises(SubscriptionLimitError) as per_user:
+        broker.subscribe(1)
+    assert per_user.value.status_code == 429
+
+    broker.subscribe(2)
+    with pytest.raises(SubscriptionLimitError) as per_process:
+        broker.subscribe(3)
+    assert per_process.value.status_code == 503
+
+    broker.unsubscribe(1, first)
+    broker.subscribe(3)
+    assert broker.connection_count() == 3
+
+
+def test_slow_subscriber_gets_single_resync_instead_of_backlog():
+    broker = DashboardEventBroker(max_connections=10, max_connections_per_user=2, queue_size=2)
+    slow = broker.subscribe(1)
+    other_user = broker.subscribe(2)
+
+    for day in range(5):
+        broker.publish(1, "delta", {"days": [{"label": f"0{day}-01"}]})
+
+    assert slow.qsize() <= 2
+    events = [slow.get_nowait() for _ in range(slow.qsize())]
+    assert ("resync", {}) in events
+    # Zdarzenia trafiają tylko do strumieni właściciela danych
+    assert other_user.empty()
+
+
+def test_worker_runs_while_user_is_subscribed():
+    async def scenario():
+        broker = DashboardEventBroker(max_connections=10, max_connections_per_user=2, queue_size=2)
+        started = []
+
+        async def worker():
+            started.append(True)
+            await asyncio.sleep(3600)
+
+        first = broker.subscribe(1)
+        second = broker.subscribe(1)
+        broker.ensure_worker(1, worker)
+        broker.ensure_worker(1, worker)
+        await asyncio.sleep(0)
+        task = broker._workers[1]
+        assert started == [True]
+
+        broker.unsubscribe(1, first)
+        assert not task.cancelled()
+        broker.unsubscribe(1, second)
+        await asyncio.sleep(0)
+        assert task.cancelled()
+
+    asyncio.run(scenario())
+
+
+def test_stream_subscribes_only_while_its_body_runs(monkeypatch):
+    from app.api import health as health_api
+
+    broker = DashboardEventBroker(max_connections=10, max_connections_per_user=1, queue_size=2)
+    monkeypatch.setattr(health_api, "dashboard_events", broker)
+    monkeypatch.setattr(broker, "ensure_worker", lambda user_id, factory: None)
+    open_while_streaming = []
+
+    class DisconnectedRequest:
+        async def is_disconnected(self):
+            open_while_streaming.append(broker.connection_count())
+            return True
+
+    async def scenario():
+
+        # Odpowiedź, której ciało nigdy nie ruszyło, nie zajmuje miejsca w limicie
+        health_api._event_stream(DisconnectedRequest(), 1)
+        broker.check_limits(1)
+
+        stream = health_api._event_stream(DisconnectedRequest(), 1)
+        assert await stream.__anext__() == "retry: 10000\n\n"
+        assert [chunk async for chunk in stream] == []
+        assert open_while_streaming == [1]
+        assert broker.connection_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_format_sse():
+    assert format_sse("delta", {"days": []}) == 'event: delta\ndata: {"days":[]}\n\n'
@@ -0,0 +1,117 @@
+import time
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.api import health as health_api
+from app.models.user import User
+from app.services.auth import get_current_user
+from app.services.dashboard_cache import dashboard_cache
+
+
+class FakeFitService:
+    calls = 0
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    @classmethod
+    async def create(cls, user_id):
+        return cls(user_id)
+
+    async def get_dashboard_data_async(self, days, resolution="day"):
+        FakeFitService.calls += 1
+        return {
+            "daily_stats": {"steps": 1234},
+            "charts": {"activity": {"labels": [f"{i:02d}-01" for i in range(days)], "steps": list(range(days))}},
+            "missing": []
+        }
+
+
+class FailingFitService(FakeFitService):
+    async def get_dashboard_data_async(self, days, resolution="day"):
+        FakeFitService.calls += 1
+        raise HTTPException(status_code=503, detail="Google Fit (aggregate) chwilowo niedostępny.")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(health_api, "GoogleFitServices", FakeFitService)
+    FakeFitService.calls = 0
+    dashboard_cache.clear()
+    app = FastAPI()
+    app.include_router(health_api.router, prefix="/api/health")
+    app.dependency_overrides[get_current_user] = lambda: User(id=1, username="jan")
+    with TestClient(app) as test_client:
+        yield test_client
+    dashboard_cache.clear()
+
+
+def test_repeat_view_with_etag_returns_304(client):
+    first = client.get("/api/health/dashboard?days=7", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert first.json()["daily_stats"]["steps"] == 1234
+    etag = first.headers["etag"]
+
+    second = client.get("/api/health/dashboard?days=7", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"].strip('"').startswith(etag.strip('"'))
+    assert FakeFitService.calls == 1
+
+    other_range = client.get("/api/health/dashboard?days=30", headers={"If-None-Match": etag})
+    assert other_range.status_code == 200
+
+
+@pytest.mark.parametrize("accept, encoding", [("gzip, deflate, br", "br"), ("gzip", "gzip")])
+def test_large_payload_is_compressed(client, accept, encoding):
+    plain = client.get("/api/health/dashboard?days=365", headers={"Accept-Encoding": "identity"})
+    compressed = client.get("/api/health/dashboard?days=365", headers={"Accept-Encoding": accept})
+
+    assert compressed.headers["content-encoding"] == encoding
+    assert compressed.headers["etag"] == f'"{plain.headers["etag"].strip(chr(34))}-{encoding}"'
+    assert compressed.json() == plain.json()
+    assert int(compressed.headers["content-length"]) < len(plain.content)
+
+
+def test_small_payload_is_not_compressed(client):
+    response = client.get("/api/health/dashboard?days=1", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+
+
+def test_stale_dashboard_is_served_while_google_is_down(client, fresh_circuit_breakers):
+    fresh = client.get("/api/health/dashboard?days=7")
+    assert "stale" not in fresh.json()
+
+    breaker = fresh_circuit_breakers["aggregate"]
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker.opened_at -= breaker.reset_timeout - 0.2
+
+    stale = client.get("/api/health/dashboard?days=7")
+    assert stale.status_code == 200
+    assert stale.json() == {**fresh.json(), "stale": True}
+    assert stale.headers["etag"] != fresh.headers["etag"]
+    assert FakeFitService.calls == 1
+
+    # Po przejściu w stan półotwarty dashboard jest przeliczany w tle
+    deadline = time.monotonic() + 5
+    while FakeFitService.calls == 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert FakeFitService.calls == 2
+
+
+def test_stale_dashboard_is_served_when_google_fails_during_compute(client, monkeypatch):
+    fresh = client.get("/api/health/dashboard?days=7")
+    dashboard_cache.invalidate_user(1, keep_last_good=True)
+    # Bezpiecznik jest jeszcze zamknięty - awaria wychodzi dopiero podczas przeliczania
+    monkeypatch.setattr(health_api, "GoogleFitServices", FailingFitService)
+
+    stale = client.get("/api/health/dashboard?days=7")
+    assert stale.status_code == 200
+    assert stale.json() == {**fresh.json(), "stale": True}
+
+    # Bez kompletnego dashboardu w pamięci klient dostaje błąd
+    assert client.get("/api/health/dashboard?days=30").status_code == 503
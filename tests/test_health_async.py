@@ -0,0 +1,217 @@
+import asyncio
+import pytest
+import httpx
+from datetime import datetime, timedelta
+from unittest.mock import ANY, MagicMock
+from fastapi import HTTPException
+
+from app.models.api_connections import ApiConnection
+from app.services import http_client
+from app.services.health import GoogleFitServices
+from app.services.rate_limit import RateLimitExceeded
+
+
+def make_service(expires_in_minutes=30):
+    service = GoogleFitServices.__new__(GoogleFitServices)
+    service.user_id = 1
+    service._session_factory = MagicMock()
+    service.connection = MagicMock()
+    service.connection.access_token = "old-token"
+    service.connection.refresh_token = "refresh-token"
+    service.connection.token_expires_at = datetime.now() + timedelta(minutes=expires_in_minutes)
+    service._session_factory.return_value.get.return_value = service.connection
+    return service
+
+
+@pytest.fixture
+def mock_transport():
+    calls = []
+
+    def install(handler):
+        def recording_handler(request):
+            calls.append(request)
+            return handler(request)
+        http_client._async_client = httpx.AsyncClient(transport=httpx.MockTransport(recording_handler))
+        return calls
+
+    yield install
+    asyncio.run(http_client.close_async_client())
+
+
+def test_make_request_async_returns_json(mock_transport):
+    calls = mock_transport(lambda request: httpx.Response(200, json={"bucket": []}))
+    service = make_service()
+
+    result = asyncio.run(service._make_request_async("https://fit.test/aggregate", json_data={"a": 1}))
+
+    assert result == {"bucket": []}
+    assert calls[0].headers["Authorization"] == "Bearer old-token"
+
+
+def test_make_request_async_refreshes_token_on_401(mock_transport):
+    def handler(request):
+        if request.url.host == "oauth2.googleapis.com":
+            return httpx.Response(200, json={"access_token": "new-token", "expires_in": 3600})
+        if request.headers["Authorization"] == "Bearer old-token":
+            return httpx.Response(401)
+        return httpx.Response(200, json={"ok": True})
+
+    calls = mock_transport(handler)
+    # Token formalnie wygasł, więc odświeżenie faktycznie uderzy w endpoint OAuth
+    service = make_service(expires_in_minutes=-5)
+
+    result = asyncio.run(service._make_request_async("https://fit.test/aggregate"))
+
+    assert result == {"ok": True}
+    assert service.connection.access_token == "new-token"
+    assert [c.url.host for c in calls] == ["fit.test", "oauth2.googleapis.com", "fit.test"]
+    service._session_factory.return_value.commit.assert_called()
+    service._session_factory.return_value.close.assert_called()
+
+
+def test_make_request_async_maps_upstream_errors(mock_transport):
+    mock_transport(lambda request: httpx.Response(503))
+    service = make_service()
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(service._make_request_async("https://fit.test/aggregate", method="GET"))
+
+    assert exc_info.value.status_code == 503
+
+
+
+def test_concurrent_refreshes_hit_oauth_endpoint_once(mock_transport):
+    def handler(request):
+        return httpx.Response(200, json={"access_token": "new-token", "expires_in": 3600})
+
+    calls = mock_transport(handler)
+    # Wspólny obiekt połączenia imituje ponowny odczyt wiersza z bazy po uzyskaniu blokady
+    first = make_service(expires_in_minutes=-5)
+    services = [first] + [make_service() for _ in range(4)]
+    for service in services[1:]:
+        service.connection = first.connection
+
+    async def scenario():
+        return await asyncio.gather(*(service._refresh_token_async() for service in services))
+
+    assert asyncio.run(scenario()) == [True] * 5
+    assert len(calls) == 1
+    # Wiersz połączenia czytany z blokadą - odświeżenia w innych procesach czekają na zapis
+    first._session_factory.return_value.get.assert_called_with(ApiConnection, ANY, with_for_update=True)
+
+
+def test_rejected_token_is_refreshed_even_if_not_expired(mock_transport):
+    calls = mock_transport(lambda request: httpx.Response(200, json={"access_token": "new-token"}))
+    service = make_service(expires_in_minutes=30)
+
+    assert asyncio.run(service._refresh_token_async(rejected_token="old-token"))
+    assert service.connection.access_token == "new-token"
+    # Token odrzucony wcześniej został już wymieniony - drugie odświeżenie nie jest potrzebne
+    assert asyncio.run(service._refresh_token_async(rejected_token="old-token"))
+    assert len(calls) == 1
+
+
+def test_make_request_async_retries_429_honoring_retry_after(mock_transport, monkeypatch):
+    from app.services import health
+    from app.services.rate_limit import GoogleFitRateLimiter
+
+    monkeypatch.setattr(health, "google_fit_limiter", GoogleFitRateLimiter(100, 100, 100, 100, max_wait=5))
+    responses = iter([httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(503),
+                      httpx.Response(200, json={"ok": True})])
+    calls = mock_transport(lambda request: next(responses))
+    monkeypatch.setattr(health.settings, "GOOGLE_FIT_BACKOFF_BASE_SECONDS", 0.01)
+
+    assert asyncio.run(make_service()._make_request_async("https://fit.test/aggregate")) == {"ok": True}
+    assert len(calls) == 3
+
+
+def test_make_request_async_gives_up_on_long_retry_after(mock_transport, monkeypatch):
+    from app.services import health
+    from app.services.rate_limit import GoogleFitRateLimiter
+
+    monkeypatch.setattr(health, "google_fit_limiter", GoogleFitRateLimiter(100, 100, 100, 100, max_wait=5))
+    calls = mock_transport(lambda request: httpx.Response(429, headers={"Retry-After": "3600"}))
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(make_service()._make_request_async("https://fit.test/aggregate"))
+    assert exc.value.status_code == 429
+    assert len(calls) == 1
+    # Globalny limit wstrzymany na cały Retry-After, mimo że żądanie nie było ponawiane
+    with pytest.raises(RateLimitExceeded) as limited:
+        asyncio.run(health.google_fit_limiter.acquire(user_id=2))
+    assert limited.value.scope == "global"
+    assert limited.value.retry_after > 3000
+
+
+def test_make_request_async_rejects_calls_over_user_limit(mock_transport, monkeypatch):
+    from app.services import health
+    from app.services.rate_limit import GoogleFitRateLimiter
+
+    # Jedno wywołanie na 10 s na użytkownika, czekamy maksymalnie 1 s
+    monkeypatch.setattr(health, "google_fit_limiter", GoogleFitRateLimiter(100, 100, 0.1, 1, max_wait=1))
+    calls = mock_transport(lambda request: httpx.Response(200, json={"ok": True}))
+    service = make_service()
+
+    asyncio.run(service._make_request_async("https://fit.test/aggregate"))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(service._make_request_async("https://fit.test/aggregate"))
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 9
+    assert len(calls) == 1
+
+
+def test_timeouts_open_circuit_and_later_calls_fail_fast(mock_transport, fresh_circuit_breakers):
+    def handler(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    calls = mock_transport(handler)
+    service = make_service()
+    breaker = fresh_circuit_breakers["aggregate"]
+
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(service._make_request_async("https://fit.test/dataset:aggregate"))
+        assert exc_info.value.status_code == 503
+    assert breaker.is_open()
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(service._make_request_async("https://fit.test/dataset:aggregate"))
+    assert exc_info.value.status_code == 503
+    assert "Retry-After" in exc_info.value.headers
+    assert len(calls) == breaker.failure_threshold
+    # Bezpieczniki są osobne dla endpointów
+    assert not fresh_circuit_breakers["sessions"].is_open()
+
+
+def test_cancelled_call_does_not_count_as_breaker_failure(mock_transport, fresh_circuit_breakers):
+    async def handler(request):
+        await asyncio.sleep(10)
+
+    mock_transport(handler)
+    breaker = fresh_circuit_breakers["aggregate"]
+    breaker.state, breaker.opened_at = "half_open", 0.0
+
+    async def cancelled_call():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(make_service()._send_async("POST", "https://fit.test/dataset:aggregate"), 0.05)
+
+    asyncio.run(cancelled_call())
+    assert breaker.failures == 0
+    assert breaker.state == "half_open"
+    # Próba nie została rozstrzygnięta - następne wywołanie może ją powtórzyć
+    breaker.before_call()
+
+
+def test_request_errors_during_trial_do_not_wedge_breaker(mock_transport, fresh_circuit_breakers):
+    def handler(request):
+        raise httpx.TooManyRedirects("redirect loop", request=request)
+
+    mock_transport(handler)
+    breaker = fresh_circuit_breakers["aggregate"]
+    breaker.state, breaker.opened_at = "half_open", 0.0
+
+    with pytest.raises(httpx.TooManyRedirects):
+        asyncio.run(make_service()._send_async("POST", "https://fit.test/dataset:aggregate"))
+    assert breaker.failures == 0
+    # Próba nie została rozstrzygnięta - następne wywołanie może ją powtórzyć
+    breaker.before_call()
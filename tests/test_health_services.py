@@ -1,173 +1,223 @@
+import asyncio
 import pytest
+import httpx
+import numpy as np
 from datetime import datetime, timedelta
-from unittest.mock import patch, MagicMock
-import pandas as pd
+from sqlalchemy.orm import sessionmaker
 
+from app.services import http_client
+from app.models.health import BodyMeasurement
 from app.services.health import GoogleFitServices
+from app.services.health_columns import parse_daily_buckets
+from app.services.sleep_nights import merge_intervals, nightly_sleep_millis, session_interval
+from scripts.fake_google_fit import FakeFitConfig, aggregate_payload, create_app, dataset_payload, sessions_payload
 
 
-@pytest.fixture
-def mock_google_fit_service():
-    with patch('app.services.health.build') as mock_build:
-        mock_service = MagicMock()
-        mock_build.return_value = mock_service
-
-        with patch('app.services.health.google_fit_credentials') as mock_creds:
-            mock_creds.return_value = MagicMock()
-
-            service = GoogleFitServices()
-            service.service = mock_service
-            yield service
-
-
-def test_get_steps_data(mock_google_fit_service):
-    # Przygotowanie danych testowych
-    mock_response = {
-        "bucket": [
-            {
-                "startTimeMillis": "1617580800000",  # 2021-04-05
-                "dataset": [
-                    {
-                        "point": [
-                            {
-                                "value": [{"intVal": 7500}]
-                            }
-                        ]
-                    }
-                ]
-            },
-            {
-                "startTimeMillis": "1617667200000",  # 2021-04-06
-                "dataset": [
-                    {
-                        "point": [
-                            {
-                                "value": [{"intVal": 9000}]
-                            }
-                        ]
-                    }
-                ]
-            }
-        ]
-    }
-
-    # Konfiguracja mocka
-    mock_aggregate = MagicMock()
-    mock_aggregate.execute.return_value = mock_response
-
-    mock_dataset = MagicMock()
-    mock_dataset.aggregate.return_value = mock_aggregate
-
-    mock_users = MagicMock()
-    mock_users.dataset.return_value = mock_dataset
-
-    mock_google_fit_service.service.users.return_value = mock_users
-
-    # Wywołanie testowanej metody
-    start_date = datetime(2021, 4, 5)
-    end_date = datetime(2021, 4, 6)
-    result = mock_google_fit_service.get_steps_data(start_date, end_date)
-
-    # Asercje
-    assert len(result) == 2
-    assert result[0]["date"] == "2021-04-05"
-    assert result[0]["steps"] == 7500
-    assert result[1]["date"] == "2021-04-06"
-    assert result[1]["steps"] == 9000
-
-
-def test_get_heart_rate_data(mock_google_fit_service):
-    # Przygotowanie danych testowych
-    mock_response = {
-        "bucket": [
-            {
-                "startTimeMillis": "1617580800000",  # 2021-04-05
-                "dataset": [
-                    {
-                        "point": [
-                            {
-                                "value": [{"fpVal": 70.0}, {"fpVal": 75.0}, {"fpVal": 80.0}]
-                            }
-                        ]
-                    }
-                ]
-            }
-        ]
-    }
-
-    # Konfiguracja mocka
-    mock_aggregate = MagicMock()
-    mock_aggregate.execute.return_value = mock_response
-
-    mock_dataset = MagicMock()
-    mock_dataset.aggregate.return_value = mock_aggregate
-
-    mock_users = MagicMock()
-    mock_users.dataset.return_value = mock_dataset
-
-    mock_google_fit_service.service.users.return_value = mock_users
-
-    # Wywołanie testowanej metody
-    start_date = datetime(2021, 4, 5)
-    end_date = datetime(2021, 4, 6)
-    result = mock_google_fit_service.get_heart_rate_data(start_date, end_date)
-
-    # Asercje
-    assert len(result) == 1
-    assert result[0]["date"] == "2021-04-05"
-    assert result[0]["avg_bpm"] == 75.0
-    assert result[0]["min_bpm"] == 70.0
-    assert result[0]["max_bpm"] == 80.0
-    assert result[0]["readings_count"] == 3
-
-
-def test_get_sleep_data(mock_google_fit_service):
-    # Przygotowanie danych testowych
-    mock_response = {
-        "bucket": [
-            {
-                "startTimeMillis": "1617580800000",  # 2021-04-05
-                "dataset": [
-                    {
-                        "point": [
-                            {
-                                "startTimeNanos": "1617580800000000000",  # Przykładowy czas
-                                "endTimeNanos": "1617595200000000000",  # Przykładowy czas + 4 godziny
-                                "value": [{"intVal": 2}]  # Light sleep
-                            },
-                            {
-                                "startTimeNanos": "1617595200000000000",  # Przykładowy czas + 4 godziny
-                                "endTimeNanos": "1617602400000000000",  # Przykładowy czas + 6 godzin
-                                "value": [{"intVal": 3}]  # Deep sleep
-                            }
-                        ]
-                    }
-                ]
-            }
-        ]
-    }
-
-    # Konfiguracja mocka
-    mock_aggregate = MagicMock()
-    mock_aggregate.execute.return_value = mock_response
-
-    mock_dataset = MagicMock()
-    mock_dataset.aggregate.return_value = mock_aggregate
-
-    mock_users = MagicMock()
-    mock_users.dataset.return_value = mock_dataset
-
-    mock_google_fit_service.service.users.return_value = mock_users
-
-    # Wywołanie testowanej metody
-    start_date = datetime(2021, 4, 5)
-    end_date = datetime(2021, 4, 6)
-    result = mock_google_fit_service.get_sleep_data(start_date, end_date)
-
-    # Asercje
-    assert len(result) == 1
-    assert result[0]["date"] == "2021-04-05"
-    assert "total_minutes" in result[0]
-    assert "light_minutes" in result[0]
-    assert "deep_minutes" in result[0]
-    # Głębszy test wartości będzie zależał od konkretnej implementacji parsowania
\ No newline at end of file
+def make_service(db=None):
+    if db is not None:
+        return GoogleFitServices(user_id=1, session_factory=sessionmaker(bind=db.get_bind()))
+    service = GoogleFitServices.__new__(GoogleFitServices)
+    service.user_id = 1
+    service.connection = None
+    return service
+
+
+def daily_aggregate(days):
+    end = datetime.now()
+    start = end - timedelta(days=days)
+    service = make_service()
+    body = service._build_aggregate_request(int(start.timestamp() * 1000), int(end.timestamp() * 1000))
+    return aggregate_payload(body)
+
+
+def bucket_value(bucket, data_type):
+    for dataset in bucket["dataset"]:
+        if data_type in dataset["dataSourceId"]:
+            return dataset["point"][0]["value"]
+
+
+def test_get_steps_data():
+    response = daily_aggregate(7)
+    service = make_service()
+
+    charts = service._charts_from_columns(parse_daily_buckets(response), 7)
+
+    assert len(charts["activity"]["labels"]) == 7
+    expected = {}
+    for bucket in response["bucket"]:
+        day = datetime.fromtimestamp(int(bucket["startTimeMillis"]) / 1000).strftime("%d-%m")
+        expected[day] = bucket_value(bucket, "step_count.delta")[0]["intVal"]
+    for label, steps in zip(charts["activity"]["labels"], charts["activity"]["steps"]):
+        assert steps == expected.get(label, 0)
+
+
+def test_get_heart_rate_data():
+    response = daily_aggregate(7)
+    service = make_service()
+
+    columns = parse_daily_buckets(response)
+    stats = service._daily_stats_from_columns(columns, int(np.argmax(columns.start_millis)))
+
+    latest = max(response["bucket"], key=lambda b: int(b["startTimeMillis"]))
+    avg, maximum, minimum = (v["fpVal"] for v in bucket_value(latest, "heart_rate.bpm"))
+    assert stats["avg_heart_rate"] == round(avg)
+    assert stats["max_heart_rate"] == round(maximum)
+    assert stats["resting_heart_rate"] == round(minimum)
+
+
+def test_get_sleep_data():
+    end = datetime.now()
+    start = end - timedelta(days=7)
+    sessions = sessions_payload(int(start.timestamp() * 1000), int(end.timestamp() * 1000), None, 1000)["session"]
+    service = make_service()
+
+    chart = service._sleep_chart_from_nights(nightly_sleep_millis(map(session_interval, sessions)), 7)
+
+    assert len(chart["hours"]) == 7
+    assert all(5.5 <= hours <= 9 for hours in chart["hours"][:-1])
+
+
+def test_weight_and_bmi_use_latest_point():
+    end_nanos = int(datetime.now().timestamp() * 1e9)
+    start_nanos = end_nanos - int(timedelta(days=90).total_seconds() * 1e9)
+    weight = dataset_payload("derived:com.google.weight:merge_weight", start_nanos, end_nanos, 1)
+    height = dataset_payload("derived:com.google.height:merge_height", start_nanos, end_nanos, 1)
+    service = make_service()
+
+    weight_value, height_value = (service._latest_point(dataset)["value"][0]["fpVal"] for dataset in (weight, height))
+    stats = service._weight_stats(weight_value, height_value)
+
+    latest = max(weight["point"], key=lambda p: int(p["endTimeNanos"]))["value"][0]["fpVal"]
+    assert stats["weight"] == round(latest, 1)
+    assert stats["bmi"] == round(latest / 1.78 ** 2, 1)
+
+
+def test_dashboard_against_fake_google_fit(db):
+    fake = create_app(FakeFitConfig())
+    http_client._async_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake))
+    service = make_service(db)
+    try:
+        data = asyncio.run(service.get_dashboard_data_async(7))
+    finally:
+        asyncio.run(http_client.close_async_client())
+
+    assert data["missing"] == []
+    assert sum(data["charts"]["activity"]["steps"]) > 0
+    assert data["daily_stats"]["bmi"] > 0
+    assert sum(1 for hours in data["charts"]["sleep"]["hours"] if hours) >= 6
+
+
+def test_columnar_parser_matches_buckets_for_long_range():
+    response = daily_aggregate(365)
+    for bucket in response["bucket"][::2]:
+        # Co drugi dzień bez pomiaru tętna
+        for dataset in bucket["dataset"]:
+            if "heart_rate.bpm" in dataset["dataSourceId"]:
+                dataset["point"] = []
+    columns = parse_daily_buckets(response)
+    service = make_service()
+
+    charts = service._charts_from_columns(columns, 365)
+
+    assert len(columns.day) == len(response["bucket"])
+    assert np.isnan(columns.avg_hr[::2]).all()
+    assert len(charts["activity"]["steps"]) == 365
+    by_label = {}
+    first_day = datetime.now().date() - timedelta(days=364)
+    for bucket in response["bucket"]:
+        day = datetime.fromtimestamp(int(bucket["startTimeMillis"]) / 1000).date()
+        if day < first_day:
+            # Ta sama etykieta 'dd-mm' co dzisiaj, ale sprzed roku - poza oknem wykresu
+            continue
+        day = day.strftime("%d-%m")
+        heart_rate = [d for d in bucket["dataset"] if "heart_rate.bpm" in d["dataSourceId"]][0]["point"]
+        by_label[day] = (bucket_value(bucket, "step_count.delta")[0]["intVal"],
+                         round(heart_rate[0]["value"][0]["fpVal"]) if heart_rate else 0)
+    for label, steps, avg in zip(charts["activity"]["labels"], charts["activity"]["steps"], charts["heart_rate"]["avg"]):
+        assert (steps, avg) == by_label.get(label, (0, 0))
+    assert all(type(steps) is int for steps in charts["activity"]["steps"])
+
+
+def test_body_measurements_are_stored_and_fetched_incrementally(db):
+    fake = create_app(FakeFitConfig())
+    http_client._async_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake))
+    service = make_service(db)
+
+    def dataset_requests():
+        return {path: count for path, count in fake.state.request_counts.items() if "/dataSources/" in path}
+
+    try:
+        first = asyncio.run(service.get_dashboard_data_async(7))
+        assert len(dataset_requests()) == 2
+        stored = service._load_body_measurements()
+        assert first["daily_stats"]["weight"] == round(stored["weight"].value, 1)
+
+        # W oknie odświeżania ani waga, ani wzrost nie są pobierane ponownie
+        fake.state.request_counts.clear()
+        second = asyncio.run(service.get_dashboard_data_async(7))
+        assert dataset_requests() == {}
+        assert second["daily_stats"]["bmi"] == first["daily_stats"]["bmi"]
+
+        # Po upływie interwału pobieramy tylko wagę i tylko zakres po ostatnim punkcie
+        weight = db.query(BodyMeasurement).filter_by(measurement_type="weight").one()
+        weight.checked_at = datetime.now() - timedelta(days=1)
+        db.commit()
+        last_end_nanos = weight.end_time_nanos
+        fake.state.request_counts.clear()
+        asyncio.run(service.get_dashboard_data_async(7))
+        (path,) = dataset_requests()
+        assert "weight" in path
+        assert int(path.rsplit("/", 1)[1].split("-")[0]) == last_end_nanos + 1
+    finally:
+        asyncio.run(http_client.close_async_client())
+
+
+def test_overlapping_sleep_sessions_are_counted_once():
+    hour = 3600000
+    night_end = int(datetime.combine(datetime.now().date(), datetime.min.time()).timestamp() * 1000) + 7 * hour
+    sessions = [
+        # Ten sam sen z telefonu i opaski, plus drzemka stykająca się z końcem nocy
+        {"startTimeMillis": str(night_end - 8 * hour), "endTimeMillis": str(night_end - hour)},
+        {"startTimeMillis": str(night_end - 7 * hour), "endTimeMillis": str(night_end)},
+        {"startTimeMillis": str(night_end), "endTimeMillis": str(night_end + hour // 2)},
+    ]
+
+    assert list(merge_intervals([(5, 8), (1, 3), (2, 4), (8, 9)])) == [(1, 4), (5, 9)]
+    nights = nightly_sleep_millis(map(session_interval, sessions))
+    assert make_service()._sleep_stats_from_nights(nights) == {"sleep_hours": 8.5}
+    assert make_service()._sleep_chart_from_nights(nights, 3)["hours"][-1] == 8.5
+
+
+def test_sleep_sessions_follow_next_page_token(db):
+    fake = create_app(FakeFitConfig(sessions_page_size=4))
+    http_client._async_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake))
+    service = make_service(db)
+    end = datetime.now()
+    start_millis, end_millis = int((end - timedelta(days=30)).timestamp() * 1000), int(end.timestamp() * 1000)
+    try:
+        intervals = asyncio.run(service._fetch_sleep_intervals(start_millis, end_millis))
+    finally:
+        asyncio.run(http_client.close_async_client())
+
+    expected = sessions_payload(start_millis, end_millis, None, 1000)["session"]
+    assert len(intervals) == len(expected) > 4
+    assert fake.state.request_counts["/fitness/v1/users/me/sessions"] == -(-len(expected) // 4)
+
+
+def test_sleep_fetch_timeout_applies_to_each_page(db, monkeypatch):
+    from app.services import health as health_module
+
+    # Każda strona mieści się w limicie, cały długi zakres już nie
+    monkeypatch.setattr(health_module.settings, "GOOGLE_FIT_FETCH_TIMEOUT", 0.3)
+    fake = create_app(FakeFitConfig(latency_ms=100, sessions_page_size=4))
+    http_client._async_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake))
+    service = make_service(db)
+    end = datetime.now()
+    start_millis, end_millis = int((end - timedelta(days=30)).timestamp() * 1000), int(end.timestamp() * 1000)
+    try:
+        intervals = asyncio.run(service._fetch_sleep_intervals(start_millis, end_millis))
+    finally:
+        asyncio.run(http_client.close_async_client())
+
+    assert fake.state.request_counts["/fitness/v1/users/me/sessions"] > 3
+    assert len(intervals) == len(sessions_payload(start_millis, end_millis, None, 1000)["session"])
@@ -0,0 +1,415 @@
+import asyncio
+import json
+import threading
+import pytest
+import httpx
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.models.api_connections import ApiConnection
+from app.models.health import HeartRate, Sleep, Activity, HealthRollup, DailyHealthSummary
+from app.services import http_client
+from app.services.health import GoogleFitServices
+from app.services.health_sync import HealthSyncService, floor_hour, split_range, settings
+
+
+def millis(dt):
+    return str(int(dt.timestamp() * 1000))
+
+
+def hourly_buckets(start, hours, steps=100, bpm=70.0):
+    buckets = []
+    for i in range(hours):
+        bucket_start = start + timedelta(hours=i)
+        buckets.append({
+            "startTimeMillis": millis(bucket_start),
+            "endTimeMillis": millis(bucket_start + timedelta(hours=1)),
+            "dataset": [
+                {"dataSourceId": "derived:com.google.step_count.delta:aggregated",
+                 "point": [{"value": [{"intVal": steps}]}]},
+                {"dataSourceId": "derived:com.google.distance.delta:aggregated",
+                 "point": [{"value": [{"fpVal": 80.0}]}]},
+                {"dataSourceId": "derived:com.google.heart_rate.bpm:aggregated",
+                 "point": [{"value": [{"fpVal": bpm}, {"fpVal": bpm + 30}, {"fpVal": bpm - 15}]}]},
+            ]
+        })
+    return {"bucket": buckets}
+
+
+@pytest.fixture
+def google(db):
+    """Podstawia transport HTTP i zwraca listę wykonanych żądań."""
+    calls = []
+
+    def install(handler):
+        def recording_handler(request):
+            calls.append(request)
+            return handler(request)
+        http_client._async_client = httpx.AsyncClient(transport=httpx.MockTransport(recording_handler))
+        return calls
+
+    yield install
+    asyncio.run(http_client.close_async_client())
+
+
+def make_service(db):
+    return GoogleFitServices(user_id=1, session_factory=sessionmaker(bind=db.get_bind()))
+
+
+def fake_google(now, hours=3):
+    def handler(request):
+        if "dataset:aggregate" in request.url.path:
+            return httpx.Response(200, json=hourly_buckets(floor_hour(now) - timedelta(hours=hours - 1), hours))
+        if "sessions" in request.url.path:
+            night_end = floor_hour(now) - timedelta(hours=1)
+            return httpx.Response(200, json={"session": [
+                {"startTimeMillis": millis(night_end - timedelta(hours=7)), "endTimeMillis": millis(night_end)}
+            ]})
+        return httpx.Response(200, json={"point": [{"endTimeNanos": "1", "value": [{"fpVal": 80.0}]}]})
+    return handler
+
+
+def test_sync_upserts_rows_and_advances_high_water_mark(db, google):
+    now = datetime.now()
+    calls = google(fake_google(now))
+    service = make_service(db)
+
+    result = asyncio.run(HealthSyncService(service).sync(now - timedelta(days=1)))
+
+    assert result["missing"] == []
+    assert db.query(Activity).count() == 3
+    assert db.query(HeartRate).count() == 3
+    assert db.query(Sleep).count() == 1
+    assert service.connection.synced_until == floor_hour(service.connection.last_synced_at)
+    assert len(calls) == 2
+
+    # Kolejna synchronizacja w ciągu SYNC_MIN_INTERVAL_SECONDS nie idzie do Google
+    asyncio.run(HealthSyncService(service).sync(now - timedelta(days=1)))
+    assert len(calls) == 2
+
+
+def test_sync_reingests_overlapping_hours_without_duplicates(db, google):
+    now = datetime.now()
+    google(fake_google(now))
+    service = make_service(db)
+    sync = HealthSyncService(service)
+
+    asyncio.run(sync.sync(now - timedelta(days=1)))
+    service.connection.last_synced_at = now - timedelta(hours=1)
+    asyncio.run(sync.sync(now - timedelta(days=1)))
+
+    assert db.query(Activity).count() == 3
+    assert db.query(Sleep).count() == 1
+
+
+def test_sync_keeps_high_water_mark_when_a_source_fails(db, google):
+    now = datetime.now()
+
+    def handler(request):
+        if "sessions" in request.url.path:
+            return httpx.Response(500)
+        return fake_google(now)(request)
+
+    google(handler)
+    service = make_service(db)
+
+    result = asyncio.run(HealthSyncService(service).sync(now - timedelta(days=1)))
+
+    assert result["missing"] == ["sleep"]
+    assert db.query(Activity).count() == 3
+    assert service.connection.synced_until is None
+
+
+def test_dashboard_reads_local_store(db, google):
+    now = datetime.now()
+    google(fake_google(now))
+    service = make_service(db)
+
+    data = asyncio.run(service.get_dashboard_data_async(7))
+
+    today_hours = min(3, now.hour + 1)
+    assert data["missing"] == []
+    assert data["daily_stats"]["steps"] == 100 * today_hours
+    assert data["daily_stats"]["avg_heart_rate"] == 70
+    assert data["daily_stats"]["weight"] == 80.0
+    assert sum(data["charts"]["activity"]["steps"]) == 300
+    assert sum(data["charts"]["sleep"]["hours"]) == 7
+
+
+def test_dashboard_without_local_data_propagates_upstream_error(db, google):
+    google(lambda request: httpx.Response(403))
+    service = make_service(db)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(service.get_dashboard_data_async(7))
+
+    assert exc_info.value.status_code == 403
+
+
+def test_token_refresher_renews_tokens_close_to_expiry(db, google, monkeypatch):
+    from app.services import health, token_refresher as refresher_module
+
+    session_factory = sessionmaker(bind=db.get_bind())
+    monkeypatch.setattr(health, "SessionLocal", session_factory)
+    monkeypatch.setattr(refresher_module, "SessionLocal", session_factory)
+    connection = db.query(ApiConnection).one()
+    connection.token_expires_at = datetime.now() + timedelta(minutes=2)
+    db.commit()
+    calls = google(lambda request: httpx.Response(200, json={"access_token": "fresh", "expires_in": 3600}))
+
+    refresher = refresher_module.TokenRefresher(interval_seconds=60, refresh_ahead_seconds=300, concurrency=2)
+
+    assert asyncio.run(refresher.run_once()) == 1
+    db.refresh(connection)
+    assert connection.access_token == "fresh"
+    # Token ważny dłużej niż okno refresh_ahead - kolejny przebieg nic nie robi
+    assert asyncio.run(refresher.run_once()) == 0
+    assert len(calls) == 1
+
+
+def test_refresh_reuses_token_written_by_another_process(db, google):
+    calls = google(lambda request: httpx.Response(200, json={"access_token": "ours", "expires_in": 3600}))
+    connection = db.query(ApiConnection).one()
+    connection.token_expires_at = datetime.now() - timedelta(minutes=1)
+    db.commit()
+    service = make_service(db)
+
+    # Np. sync_worker odświeżył token, zanim to żądanie dostało blokadę wiersza
+    connection.access_token = "theirs"
+    connection.token_expires_at = datetime.now() + timedelta(hours=1)
+    db.commit()
+
+    assert asyncio.run(service._refresh_token_async())
+    assert service.connection.access_token == "theirs"
+    assert calls == []
+
+
+def test_long_range_is_fetched_in_parallel_windows(db, google, monkeypatch):
+    from scripts.fake_google_fit import aggregate_payload
+
+    monkeypatch.setattr(settings, "GOOGLE_FIT_AGGREGATE_WINDOW_DAYS", 30)
+    monkeypatch.setattr(settings, "GOOGLE_FIT_WINDOW_CONCURRENCY", 2)
+    in_flight = {"now": 0, "max": 0}
+
+    async def handler(request):
+        if "dataset:aggregate" not in request.url.path:
+            return httpx.Response(200, json={"session": []})
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return httpx.Response(200, json=aggregate_payload(json.loads(request.content)))
+
+    calls = google(handler)
+    service = make_service(db)
+    now = datetime.now()
+
+    result = asyncio.run(HealthSyncService(service).sync(now - timedelta(days=100)))
+
+    aggregate_calls = [call for call in calls if "dataset:aggregate" in call.url.path]
+    assert len(aggregate_calls) == 4
+    assert in_flight["max"] == 2
+    assert result["missing"] == []
+    # Okna stykają się bez luk i bez powtórzeń kubełków
+    assert result["activity"] == db.query(Activity).count() == len(
+        split_range(floor_hour(now - timedelta(days=100)), now, timedelta(hours=1)))
+
+
+def test_rollups_follow_synced_rows_and_back_weekly_charts(db, google):
+    from scripts.fake_google_fit import aggregate_payload
+
+    def handler(request):
+        if "dataset:aggregate" in request.url.path:
+            return httpx.Response(200, json=aggregate_payload(json.loads(request.content)))
+        if "sessions" in request.url.path:
+            return httpx.Response(200, json={"session": []})
+        return httpx.Response(200, json={"point": []})
+
+    google(handler)
+    service = make_service(db)
+    now = datetime.now()
+
+    data = asyncio.run(service.get_dashboard_data_async(60, "week"))
+    charted_steps = sum(a.steps for a in db.query(Activity).all())
+    # Ponowna synchronizacja tych samych godzin nie podwaja rollupów
+    service.connection.last_synced_at = now - timedelta(hours=1)
+    asyncio.run(HealthSyncService(service).sync(now - timedelta(days=60)))
+
+    activities = db.query(Activity).all()
+    weekly = db.query(HealthRollup).filter_by(resolution="week").all()
+    monthly = db.query(HealthRollup).filter_by(resolution="month").all()
+    assert sum(r.steps for r in weekly) == sum(r.steps for r in monthly) == sum(a.steps for a in activities)
+    assert sum(r.bpm_count for r in weekly) == db.query(HeartRate).count()
+    assert all(r.period_start.weekday() == 0 and r.period_start.hour == 0 for r in weekly)
+
+    charts = data["charts"]
+    assert len(charts["activity"]["labels"]) == len(charts["sleep"]["labels"]) in (9, 10)
+    assert sum(charts["activity"]["steps"]) == charted_steps
+    assert all(60 <= avg <= 85 for avg in charts["heart_rate"]["avg"] if avg)
+
+
+def test_daily_summary_rows_are_rewritten_only_when_values_change(db, google):
+    now = datetime.now()
+    google(fake_google(now))
+    service = make_service(db)
+    sync = HealthSyncService(service)
+
+    first = asyncio.run(sync.sync(now - timedelta(days=1)))
+    hours = [floor_hour(now) - timedelta(hours=i) for i in range(3)]
+    touched = {hour.date() for hour in hours} | {(floor_hour(now) - timedelta(hours=1)).date()}
+    assert first["daily_summary"] == len(touched)
+    today = db.query(DailyHealthSummary).filter_by(date=now.date()).one()
+    assert today.steps == 100 * sum(1 for hour in hours if hour.date() == now.date())
+
+    # Te same dane ponownie - nic się nie zmienia, żaden wiersz nie jest nadpisywany
+    service.connection.last_synced_at = now - timedelta(hours=1)
+    assert asyncio.run(sync.sync(now - timedelta(days=1)))["daily_summary"] == 0
+
+    # Zmienione kroki w tych samych godzinach - przeliczone tylko dni tych godzin
+    def more_steps(request):
+        if "dataset:aggregate" in request.url.path:
+            return httpx.Response(200, json=hourly_buckets(hours[-1], 3, steps=250))
+        return fake_google(now)(request)
+
+    google(more_steps)
+    service.connection.last_synced_at = now - timedelta(hours=1)
+    assert asyncio.run(sync.sync(now - timedelta(days=1)))["daily_summary"] == len({hour.date() for hour in hours})
+    db.refresh(today)
+    assert today.steps == 250 * sum(1 for hour in hours if hour.date() == now.date())
+
+
+def test_sync_pushes_changed_days_to_open_streams(db, google, monkeypatch):
+    from app.services import health
+    from app.services.dashboard_events import DashboardEventBroker
+
+    broker = DashboardEventBroker(max_connections=10, max_connections_per_user=2, queue_size=8)
+    monkeypatch.setattr(health, "dashboard_events", broker)
+    queue = broker.subscribe(1)
+    now = datetime.now()
+    google(fake_google(now))
+    service = make_service(db)
+
+    assert asyncio.run(service.sync_recent()) > 0
+    event, data = queue.get_nowait()
+    assert event == "delta"
+    today = next(day for day in data["days"] if day["date"] == now.date().isoformat())
+    assert today["label"] == now.strftime("%d-%m")
+    assert today["steps"] == db.query(DailyHealthSummary).filter_by(date=now.date()).one().steps
+
+    # Bez zmian w danych nie wysyłamy nic
+    service.connection.last_synced_at = now - timedelta(hours=1)
+    assert asyncio.run(service.sync_recent()) == 0
+    assert queue.empty()
+
+
+def test_changes_synced_by_another_process_reach_open_streams(db, google, monkeypatch):
+    from app.services import summary_watch
+    from app.services.dashboard_events import DashboardEventBroker
+
+    broker = DashboardEventBroker(max_connections=10, max_connections_per_user=2, queue_size=8)
+    monkeypatch.setattr(summary_watch, "dashboard_events", broker)
+    queue = broker.subscribe(1)
+    watcher = summary_watch.SummaryChangeWatcher(1, session_factory=sessionmaker(bind=db.get_bind()))
+    assert asyncio.run(watcher.poll()) == 0
+
+    # Synchronizacja w innym procesie (sync_worker) - jej własne publish tu nie dociera
+    now = datetime.now()
+    google(fake_google(now))
+    changed = asyncio.run(make_service(db).sync_recent(publish=False))
+    assert changed > 0 and queue.empty()
+
+    assert asyncio.run(watcher.poll()) == changed
+    event, data = queue.get_nowait()
+    assert event == "delta"
+    today = next(day for day in data["days"] if day["date"] == now.date().isoformat())
+    assert today["steps"] == db.query(DailyHealthSummary).filter_by(date=now.date()).one().steps
+    # Te same zmiany nie są wysyłane drugi raz
+    assert asyncio.run(watcher.poll()) == 0
+
+
+def test_bulk_sync_worker_continues_past_failing_users(db, google, monkeypatch):
+    from app.models.user import User
+    from app.services import health, sync_worker
+
+    session_factory = sessionmaker(bind=db.get_bind())
+    monkeypatch.setattr(health, "SessionLocal", session_factory)
+    monkeypatch.setattr(sync_worker, "SessionLocal", session_factory)
+    db.add(User(id=2, username="anna", email="anna@example.com", hashed_password="x"))
+    db.add(ApiConnection(user_id=2, provider="google_fit", access_token="broken", refresh_token="refresh",
+                         token_expires_at=datetime.now() + timedelta(hours=1)))
+    db.add(User(id=3, username="ola", email="ola@example.com", hashed_password="x"))
+    db.add(ApiConnection(user_id=3, provider="google_fit", access_token=None, is_active=False))
+    db.commit()
+
+    now = datetime.now()
+    ok = fake_google(now)
+
+    def handler(request):
+        if request.headers.get("Authorization") == "Bearer broken":
+            return httpx.Response(500)
+        return ok(request)
+
+    google(handler)
+    worker = sync_worker.BulkSyncWorker(interval_seconds=60, concurrency=2, user_timeout_seconds=10)
+
+    assert sorted(worker._active_user_ids()) == [1, 2]
+    assert asyncio.run(worker.run_once()) == 1
+    assert db.query(Activity).filter_by(user_id=1).count() > 0
+    assert db.query(Activity).filter_by(user_id=2).count() == 0
+    connections = {c.user_id: c for c in db.query(ApiConnection).all()}
+    db.refresh(connections[1])
+    assert connections[1].last_synced_at is not None
+
+
+def test_dashboard_holds_no_session_during_google_calls(db, google):
+    now = datetime.now()
+    open_sessions = []
+    factory = sessionmaker(bind=db.get_bind())
+
+    class TrackedSession(factory.class_):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            open_sessions.append(self)
+
+        def close(self):
+            open_sessions.remove(self)
+            super().close()
+
+    handler = fake_google(now)
+    sessions_during_calls = []
+
+    def recording(request):
+        sessions_during_calls.append(len(open_sessions))
+        return handler(request)
+
+    google(recording)
+    service = GoogleFitServices(user_id=1, session_factory=sessionmaker(bind=db.get_bind(), class_=TrackedSession))
+
+    asyncio.run(service.get_dashboard_data_async(7))
+
+    assert sessions_during_calls and set(sessions_during_calls) == {0}
+    assert open_sessions == []
+
+
+def test_database_work_runs_off_the_event_loop_thread(db, google):
+    google(fake_google(datetime.now()))
+    query_threads = set()
+
+    def record_thread(*args):
+        query_threads.add(threading.get_ident())
+
+    event.listen(db.get_bind(), "before_cursor_execute", record_thread)
+    try:
+        async def scenario():
+            service = await GoogleFitServices.create(user_id=1, session_factory=sessionmaker(bind=db.get_bind()))
+            await service.get_dashboard_data_async(7)
+            await service.sync_recent()
+            return threading.get_ident()
+
+        loop_thread = asyncio.run(scenario())
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", record_thread)
+
+    assert query_threads and loop_thread not in query_threads
@@ -0,0 +1,72 @@
+import os
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, text
+
+import app.models
+from scripts.explain_hot_queries import run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_alembic(engine, operation, revision):
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "database", "migrations"))
+    config.attributes["configure_logger"] = False
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        operation(config, revision)
+
+
+def migrated_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    run_alembic(engine, command.upgrade, "head")
+    return engine
+
+
+def assert_matches_models(engine):
+    with engine.connect() as connection:
+        assert compare_metadata(MigrationContext.configure(connection), app.models.Base.metadata) == []
+
+
+def test_migrations_match_models(tmp_path):
+    engine = migrated_engine(tmp_path)
+    assert_matches_models(engine)
+    engine.dispose()
+
+
+def test_database_created_by_old_create_all_is_upgraded_after_stamp(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    # Schemat sprzed migracji, z danymi i powtórzonym kluczem, który nie miał jeszcze ograniczenia
+    run_alembic(engine, command.upgrade, "0001_baseline")
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO user (id, username, email, hashed_password) VALUES (1, 'jan', 'j@x', 'x')"))
+        connection.execute(text("INSERT INTO activity (user_id, timestamp, activity_type, duration, calories) "
+                                "VALUES (1, '2024-03-01 10:00:00', 'walk', 30, 100)"))
+        for bpm in (60, 61):
+            connection.execute(text("INSERT INTO heart_rate (user_id, timestamp, bpm_value) "
+                                    "VALUES (1, '2024-03-01 10:00:00', :bpm)"), {"bpm": bpm})
+        # create_all z wersji bez migracji dokładał już nowe tabele, ale nie kolumny
+        app.models.Base.metadata.tables["daily_health_summary"].create(connection)
+
+    run_alembic(engine, command.upgrade, "head")
+
+    assert_matches_models(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT bpm_value FROM heart_rate")).scalars().all() == [60]
+        assert connection.execute(text("SELECT steps, distance FROM activity")).one() == (0, 0)
+    engine.dispose()
+
+
+def test_hot_queries_use_indexes_after_migration(tmp_path, capsys):
+    engine = migrated_engine(tmp_path)
+    with engine.connect() as connection:
+        assert run(connection, user_id=1, check=True) == 0
+    engine.dispose()
+    output = capsys.readouterr().out
+    assert "ix_transaction_user_date" in output
+    assert "ix_api_connections_user_provider_active" in output
+    assert "ix_sleep_user_end_time" in output
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.api import api_connections
+from app.models.api_connections import ApiConnection, OAuthState
+from app.models.user import User
+from app.services import http_client
+from app.services.auth import get_current_user
+from app.services.oauth_state import consume_oauth_state, create_oauth_state, purge_expired_oauth_states
+from database.db_setup import get_async_db
+
+
+@pytest.fixture
+def session_factory():
+    import app.models
+
+    engine = create_async_engine("sqlite+aiosqlite://", connect_args={"check_same_thread": False},
+                                 poolclass=StaticPool)
+    factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as connection:
+            await connection.run_sync(app.models.Base.metadata.create_all)
+        async with factory() as db:
+            db.add(User(id=1, username="jan", email="jan@example.com", hashed_password="x"))
+            await db.commit()
+
+    asyncio.run(setup())
+    yield factory
+    asyncio.run(engine.dispose())
+
+
+def test_state_is_single_use_and_expires(session_factory):
+    async def scenario():
+        async with session_factory() as db:
+            state = await create_oauth_state(db, 1, "google_fit")
+            assert await consume_oauth_state(db, state) == (1, "google_fit")
+            assert await consume_oauth_state(db, state) is None
+
+            expired = await create_oauth_state(db, 1, "google_fit")
+            row = (await db.execute(select(OAuthState).where(OAuthState.state == expired))).scalar_one()
+            row.expires_at = datetime.now() - timedelta(seconds=1)
+            await db.commit()
+            fresh = await create_oauth_state(db, 1, "google_fit")
+
+            assert await consume_oauth_state(db, expired) is None
+            assert await purge_expired_oauth_states(db) == 1
+            remaining = (await db.execute(select(OAuthState.state))).scalars().all()
+            assert remaining == [fresh]
+
+    asyncio.run(scenario())
+
+
+def test_callback_consumes_state_and_stores_tokens(session_factory, monkeypatch):
+    def token_endpoint(request):
+        assert b"code=abc" in request.content
+        return httpx.Response(200, json={"access_token": "access", "refresh_token": "refresh", "expires_in": 3600})
+
+    monkeypatch.setattr(http_client, "_async_client", httpx.AsyncClient(transport=httpx.MockTransport(token_endpoint)))
+
+    async def override_get_async_db():
+        async with session_factory() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(api_connections.router, prefix="/api")
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_current_user] = lambda: User(id=1, username="jan")
+
+    with TestClient(app) as client:
+        state = client.post("/api/api-connections/google-fit/auth").json()["state"]
+        url = f"/api/api-connections/google-fit/callback?code=abc&state={state}"
+
+        first = client.get(url, follow_redirects=False)
+        replay = client.get(url, follow_redirects=False)
+
+    assert first.headers["location"].endswith("auth_success=true")
+    assert replay.headers["location"].endswith("auth_success=false")
+
+    async def stored():
+        async with session_factory() as db:
+            connection = (await db.execute(select(ApiConnection))).scalar_one()
+            states = (await db.execute(select(OAuthState))).scalars().all()
+            return connection, states
+
+    connection, states = asyncio.run(stored())
+    assert (connection.user_id, connection.access_token, connection.is_active) == (1, "access", True)
+    assert states == []
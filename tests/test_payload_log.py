@@ -0,0 +1,34 @@
+from app.services.payload_log import PayloadRecorder
+
+
+def test_records_only_debugged_users():
+    recorder = PayloadRecorder(max_entries=10, debug_user_ids={1})
+    recorder.record(1, "GET", "https://example.com/a", {"a": 1})
+    recorder.record(2, "GET", "https://example.com/b", {"b": 2})
+
+    entries = recorder.entries()
+    assert len(entries) == 1
+    assert entries[0]["user_id"] == 1
+    assert entries[0]["payload"] == {"a": 1}
+
+
+def test_ring_buffer_keeps_newest_entries():
+    recorder = PayloadRecorder(max_entries=3, debug_user_ids={1})
+    for i in range(5):
+        recorder.record(1, "POST", "https://example.com", {"i": i})
+
+    assert [entry["payload"]["i"] for entry in recorder.entries(1)] == [2, 3, 4]
+
+
+def test_disable_purges_user_entries():
+    recorder = PayloadRecorder(max_entries=10)
+    recorder.enable(1)
+    recorder.enable(2)
+    recorder.record(1, "GET", "u", {})
+    recorder.record(2, "GET", "u", {})
+
+    recorder.disable(1)
+    recorder.record(1, "GET", "u", {})
+
+    assert recorder.debug_user_ids() == [2]
+    assert [entry["user_id"] for entry in recorder.entries()] == [2]
@@ -0,0 +1,64 @@
+import logging
+import time
+
+import pytest
+from prometheus_client import REGISTRY, generate_latest
+from sqlalchemy import create_engine, exc
+
+from database.db_setup import engine_options
+from database.pool_metrics import HeldConnectionTracker, TimedAsyncAdaptedQueuePool, TimedQueuePool, instrument_engine
+
+
+def _sample(name, pool):
+    return REGISTRY.get_sample_value(name, {"pool": pool})
+
+
+def test_pool_state_and_checkout_timeouts_are_exported(tmp_path):
+    engine = instrument_engine("test", create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool,
+        pool_size=1, max_overflow=0, pool_timeout=0.05
+    ))
+    timeouts_before = _sample("db_pool_checkout_timeouts_total", "test") or 0
+
+    with engine.connect():
+        assert _sample("db_pool_checked_out", "test") == 1
+        assert _sample("db_pool_size", "test") == 1
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    assert _sample("db_pool_checked_out", "test") == 0
+    assert _sample("db_pool_checked_in", "test") == 1
+    assert _sample("db_pool_checkout_timeouts_total", "test") == timeouts_before + 1
+    assert _sample("db_pool_checkout_wait_seconds_count", "test") >= 2
+    assert b'db_pool_overflow{pool="test"}' in generate_latest(REGISTRY)
+    engine.dispose()
+
+
+def test_engine_options_follow_settings_except_for_sqlite():
+    postgres = engine_options("postgresql+psycopg://db/app")
+    assert postgres["poolclass"] is TimedQueuePool
+    assert {"pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping"} <= postgres.keys()
+    assert engine_options("postgresql+psycopg://db/app", async_mode=True)["poolclass"] is TimedAsyncAdaptedQueuePool
+    assert "poolclass" not in engine_options("sqlite:///./local.db")
+
+
+def test_connections_held_past_threshold_are_reported(tmp_path, caplog):
+    tracker = HeldConnectionTracker(threshold_seconds=0.01)
+    engine = create_engine(f"sqlite:///{tmp_path / 'held.db'}", poolclass=TimedQueuePool)
+    tracker.attach("held", engine)
+    long_held_before = _sample("db_pool_long_held_total", "held") or 0
+
+    with engine.connect():
+        pass
+    assert _sample("db_pool_long_held_total", "held") in (None, long_held_before)
+
+    connection = engine.connect()
+    time.sleep(0.02)
+    assert [name for name, _, _ in tracker.long_held()] == ["held"]
+    with caplog.at_level(logging.WARNING, logger="database.pool_metrics"):
+        connection.close()
+
+    assert tracker.long_held() == []
+    assert _sample("db_pool_long_held_total", "held") == long_held_before + 1
+    assert "held" in caplog.text
+    engine.dispose()
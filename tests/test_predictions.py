@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.models.health import DailyHealthSummary
+from app.services.predictions import (
+    design_matrix, fit_batch, forecast_batch, forecast_steps_for_users, predict_steps
+)
+
+START = date(2024, 1, 1)  # poniedziałek
+WEEKLY = np.array([0, 500, 800, 600, 1200, 3000, -1500])
+
+
+def synthetic(days, base, slope):
+    t = np.arange(days)
+    return base + slope * t + WEEKLY[(START.weekday() + t) % 7]
+
+
+def test_batch_fit_recovers_trend_and_weekly_pattern():
+    series = np.vstack([synthetic(56, 8000, 10), synthetic(56, 4000, -5)])
+
+    forecast = forecast_batch(series, START, horizon=7)
+
+    expected = np.vstack([synthetic(63, 8000, 10)[56:], synthetic(63, 4000, -5)[56:]])
+    assert forecast == pytest.approx(expected, abs=1e-3)
+
+
+def test_batch_matches_independent_fits_with_missing_days():
+    rng = np.random.default_rng(0)
+    series = rng.normal(7000, 1500, size=(5, 42))
+    series[rng.random(series.shape) < 0.2] = np.nan
+
+    batched, _ = fit_batch(series, START)
+
+    for row, coefficients in zip(series, batched):
+        mask = ~np.isnan(row)
+        single, *_ = np.linalg.lstsq(design_matrix(START, 42)[mask], row[mask], rcond=None)
+        assert coefficients == pytest.approx(single, rel=1e-4, abs=1e-2)
+
+
+def test_series_without_history_get_no_forecast():
+    series = np.full((2, 28), np.nan)
+    series[0] = synthetic(28, 6000, 0)
+    series[1, 3] = 5000
+
+    forecast = forecast_batch(series, START, horizon=3)
+
+    assert not np.isnan(forecast[0]).any()
+    assert np.isnan(forecast[1]).all()
+
+
+def test_sparse_series_fall_back_to_linear_trend():
+    series = np.full((2, 28), np.nan)
+    series[0] = synthetic(28, 8000, 10)
+    # Pięć punktów to za mało na 8 parametrów modelu sezonowego
+    for day in (0, 5, 11, 19, 26):
+        series[1, day] = 5000 + 50 * day + WEEKLY[day % 7]
+
+    forecast = forecast_batch(series, START, horizon=7)
+
+    assert forecast[0] == pytest.approx(synthetic(35, 8000, 10)[28:], abs=1e-2)
+    assert forecast[1] == pytest.approx(forecast_batch(series[1:], START, horizon=7, seasonal=False)[0])
+    # Sam trend - bez przypadkowego wahania między dniami tygodnia
+    assert np.diff(forecast[1]) == pytest.approx(np.full(6, np.diff(forecast[1])[0]))
+
+
+def test_predict_steps_keeps_linear_trend_semantics():
+    data = [{"steps": 1000 + 100 * i} for i in range(10)]
+    assert predict_steps(data) == 2000
+    assert predict_steps(data[:1]) == 0
+
+
+def test_forecast_for_users_reads_daily_summaries(db):
+    today = date.today()
+    for offset in range(1, 29):
+        day = today - timedelta(days=offset)
+        db.add(DailyHealthSummary(user_id=1, date=day, steps=5000, distance=0, sleep_minutes=0))
+    db.commit()
+
+    result = forecast_steps_for_users(db, [1, 2], history_days=28, horizon=3)
+
+    assert [point["date"] for point in result[1]] == [(today + timedelta(days=i)).isoformat() for i in range(3)]
+    assert all(point["steps"] == 5000 for point in result[1])
+    assert result[2] == []
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from app.services.rate_limit import (
+    TokenBucket, GoogleFitRateLimiter, RateLimitExceeded, parse_retry_after, backoff_delay, settings
+)
+
+
+def test_token_bucket_spends_burst_then_spaces_calls():
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated
+    assert [bucket.reserve(now) for _ in range(3)] == [0, 0, 0]
+    # Kolejne rezerwacje ustawiają się w kolejce co 1/rate
+    assert bucket.reserve(now) == pytest.approx(0.5)
+    assert bucket.reserve(now) == pytest.approx(1.0)
+    assert bucket.wait_time(now + 1.0) == pytest.approx(0.5)
+
+
+def test_limiter_rejects_instead_of_queueing_too_long():
+    limiter = GoogleFitRateLimiter(global_rate=100, global_burst=100, user_rate=1, user_burst=2, max_wait=1.5)
+    assert limiter.reserve(1) == 0
+    assert limiter.reserve(1) == 0
+    assert limiter.reserve(1) == pytest.approx(1, abs=0.01)
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.reserve(1)
+    assert exc.value.scope == "user"
+    # Limit użytkownika nie dotyczy innych użytkowników
+    assert limiter.reserve(2) == 0
+
+
+def test_hold_pauses_global_bucket():
+    limiter = GoogleFitRateLimiter(global_rate=10, global_burst=10, user_rate=10, user_burst=10, max_wait=1)
+    limiter.hold(30)
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.reserve(1)
+    assert exc.value.scope == "global"
+    assert exc.value.retry_after > 29
+
+
+def test_parse_retry_after_accepts_seconds_and_http_dates():
+    assert parse_retry_after("7") == 7
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 < parse_retry_after(in_a_minute) <= 60
+
+
+def test_backoff_delay_is_capped_and_prefers_retry_after():
+    assert backoff_delay(0, retry_after=2.5) == 2.5
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt) <= settings.GOOGLE_FIT_BACKOFF_MAX_SECONDS
@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.models.health import DailyHealthSummary, RollingStatsState
+from app.services.rolling_stats import (
+    RollingState, WINDOWS, PERCENTILE_WINDOW, STEP_GOAL, update_rolling_stats, invalidate_rolling_stats
+)
+
+
+def test_incremental_state_matches_recomputation():
+    rng = np.random.default_rng(1)
+    values = [None if rng.random() < 0.15 else float(rng.integers(2000, 15000)) for _ in range(200)]
+    state = RollingState(track_streak=True, track_percentiles=True)
+
+    for day, value in enumerate(values):
+        state.push(value)
+        summary = state.summary()
+        for window in WINDOWS:
+            recent = [v for v in values[max(0, day + 1 - window):day + 1] if v is not None]
+            expected = round(float(np.mean(recent)), 1) if recent else None
+            assert summary[f"avg_{window}d"] == pytest.approx(expected)
+        recent = [v for v in values[max(0, day + 1 - PERCENTILE_WINDOW):day + 1] if v is not None]
+        if recent:
+            assert summary[f"p90_{PERCENTILE_WINDOW}d"] == pytest.approx(round(float(np.percentile(recent, 90)), 1))
+
+    streak = 0
+    for value in reversed(values):
+        if value is None or value < STEP_GOAL:
+            break
+        streak += 1
+    assert state.summary()["goal_streak"] == streak
+
+
+def test_state_round_trips_through_dict():
+    state = RollingState(track_streak=True)
+    for value in (12000, 11000, None, 13000):
+        state.push(value)
+    restored = RollingState.from_dict(state.to_dict(), track_streak=True, track_percentiles=False)
+    restored.push(14000)
+    state.push(14000)
+    assert restored.summary() == state.summary()
+    assert restored.summary()["goal_streak"] == 2
+    assert restored.summary()["best_goal_streak"] == 2
+
+
+def add_days(db, first, count, steps=STEP_GOAL, avg_hr=65):
+    for offset in range(count):
+        db.add(DailyHealthSummary(user_id=1, date=first + timedelta(days=offset), steps=steps,
+                                  distance=0, avg_hr=avg_hr, sleep_minutes=0))
+    db.commit()
+
+
+def test_update_reads_only_new_days_and_rebuilds_after_invalidation(db):
+    today = date(2024, 6, 1)
+    add_days(db, today - timedelta(days=40), 40)
+
+    first = update_rolling_stats(db, 1, today=today)
+    db.commit()
+    assert first["steps"]["goal_streak"] == 40
+    assert first["avg_hr"]["avg_7d"] == 65
+    assert {row.last_date for row in db.query(RollingStatsState)} == {today - timedelta(days=1)}
+
+    # Nowy pełny dzień - stan przesuwa się o jeden dzień, bez ponownego czytania historii
+    add_days(db, today, 1, steps=500, avg_hr=80)
+    second = update_rolling_stats(db, 1, today=today + timedelta(days=1))
+    db.commit()
+    assert second["steps"]["goal_streak"] == 0
+    assert second["steps"]["best_goal_streak"] == 40
+    assert second["avg_hr"]["avg_7d"] == pytest.approx(round((6 * 65 + 80) / 7, 1))
+
+    # Spóźnione dane za dzień już uwzględniony - stan jest przeliczany od zera
+    db.query(DailyHealthSummary).filter_by(date=today - timedelta(days=3)).update({"steps": 100})
+    invalidate_rolling_stats(db, 1, [today - timedelta(days=3)])
+    db.commit()
+    assert db.query(RollingStatsState).count() == 0
+    rebuilt = update_rolling_stats(db, 1, today=today + timedelta(days=1))
+    assert rebuilt["steps"]["best_goal_streak"] == 37
+    assert rebuilt["avg_hr"] == second["avg_hr"]